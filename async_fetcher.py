@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Asyncio fetch engine for the player stats updater
+Keeps a variable number of user_info_multiple requests in flight and tunes
+that number with an AIMD controller driven by upstream latency and errors.
+Time spent waiting for the shared rate limiter counts as latency, so the
+limit stops growing once the client cap, not the API, is the bottleneck
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple
+
+import aiohttp
+
+from batch_planner import BatchPlanner, PidBatch
+from tgrcode_client import RETRYABLE_STATUSES, TgrcodeClient, loads_json
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDController:
+    """Additive-increase / multiplicative-decrease limit for in-flight requests"""
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 latency_tolerance: float = 2.0, error_threshold: float = 0.1,
+                 decrease_factor: float = 0.5, window_size: int = 20):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_tolerance = latency_tolerance  # Allowed slowdown vs. best observed latency
+        self.error_threshold = error_threshold  # Error rate that counts as congestion
+        self.decrease_factor = decrease_factor
+        self.window = deque(maxlen=window_size)  # Recent (latency, ok) samples
+        self.limit = max(min_limit, min(initial_limit, max_limit))
+
+        self._base_latency = None  # Best latency seen so far, used as the uncongested baseline
+        self._successes_since_change = 0
+        self._samples_since_decrease = 0
+
+    def record(self, latency: float, ok: bool):
+        """Feed one request outcome into the controller and adjust the limit"""
+        self.window.append((latency, ok))
+        self._samples_since_decrease += 1
+
+        if ok and (self._base_latency is None or latency < self._base_latency):
+            self._base_latency = latency
+
+        if self._is_congested():
+            # Back off at most once per window so one burst of errors does not collapse the limit
+            if self._samples_since_decrease >= self.window.maxlen // 2:
+                old_limit = self.limit
+                self.limit = max(self.min_limit, int(self.limit * self.decrease_factor))
+                self._samples_since_decrease = 0
+                self._successes_since_change = 0
+                if self.limit != old_limit:
+                    logger.info(f"AIMD: congestion detected, concurrency {old_limit} -> {self.limit}")
+            return
+
+        if ok:
+            self._successes_since_change += 1
+            # Grow by one after a full "round trip" worth of successful requests
+            if self._successes_since_change >= self.limit and self.limit < self.max_limit:
+                self.limit += 1
+                self._successes_since_change = 0
+                logger.debug(f"AIMD: concurrency raised to {self.limit}")
+
+    def _is_congested(self) -> bool:
+        if len(self.window) < min(5, self.window.maxlen):
+            return False
+
+        failures = sum(1 for _, ok in self.window if not ok)
+        if failures / len(self.window) > self.error_threshold:
+            return True
+
+        ok_latencies = sorted(latency for latency, ok in self.window if ok)
+        if ok_latencies and self._base_latency:
+            median_latency = ok_latencies[len(ok_latencies) // 2]
+            return median_latency > self._base_latency * self.latency_tolerance
+        return False
+
+
+class AsyncBatchFetcher:
+    """Fetch PID batches concurrently with an AIMD-controlled in-flight limit
+
+    Rate limiting, retry/backoff and the circuit breaker are shared with the
+    threaded engine through the TgrcodeClient passed in.
+    """
+
+    def __init__(self, api_base_url: str, controller: AIMDController, client: TgrcodeClient):
+        self.api_base_url = api_base_url
+        self.controller = controller
+        self.client = client
+        self.in_flight = {}  # Running fetch tasks -> batch, read by the progress reporter
+
+    async def fetch_batch(self, session: aiohttp.ClientSession, batch: PidBatch) -> Tuple[Optional[dict], float, int]:
+        """Call the API for one batch with retries
+        
+        Returns (data, latency, payload_bytes) of the last attempt; data is None
+        when every attempt failed.
+        """
+        api_url = f"{self.api_base_url}{','.join(batch.pids)}"
+        retry = self.client.retry
+        breaker = self.client.breaker
+        latency = 0.0
+        payload_bytes = 0
+
+        for attempt in range(retry.max_retries + 1):
+            wait = breaker.wait_time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                if breaker.wait_time() > 0:
+                    continue
+            throttled = self.client.rate_limiter.reserve()
+            if throttled > 0:
+                await asyncio.sleep(throttled)
+
+            retry_after = None
+            start = time.monotonic()
+            try:
+                async with session.get(api_url) as response:
+                    body = await response.read()
+                    latency = time.monotonic() - start
+                    payload_bytes = len(body)
+                    if response.status == 200:
+                        try:
+                            data = loads_json(body)
+                        except ValueError as e:
+                            logger.error(f"Failed to parse JSON response: {e}")
+                            data = None
+                        # Every attempt feeds the controller so retries register as congestion
+                        self.controller.record(latency + throttled, True)
+                        breaker.record_success()
+                        return data, latency, payload_bytes
+
+                    if response.status not in RETRYABLE_STATUSES:
+                        logger.error(f"API request failed with status {response.status}")
+                        logger.error(f"Response: {body[:500]!r}...")
+                        self.controller.record(latency + throttled, True)
+                        breaker.record_success()
+                        return None, latency, payload_bytes
+
+                    logger.warning(f"API request returned {response.status} "
+                                   f"(attempt {attempt + 1}/{retry.max_retries + 1})")
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                latency = time.monotonic() - start
+                logger.warning(f"API request error: {e!r} (attempt {attempt + 1}/{retry.max_retries + 1})")
+            except asyncio.CancelledError:
+                breaker.release_probe()
+                raise
+            except Exception as e:
+                logger.error(f"Exception during API call: {e}")
+                # Still a failed attempt; also releases the half-open probe if this was it
+                self.controller.record(time.monotonic() - start + throttled, False)
+                breaker.record_failure()
+                return None, time.monotonic() - start, 0
+
+            self.controller.record(latency + throttled, False)
+            breaker.record_failure()
+            if attempt < retry.max_retries:
+                await asyncio.sleep(retry.backoff(attempt, retry_after))
+
+        logger.error(f"API request failed after {retry.max_retries + 1} attempts")
+        return None, latency, payload_bytes
+
+    async def run(self, planner: BatchPlanner,
+                  on_result: Callable[[PidBatch, Optional[dict]], Awaitable[None]]):
+        """Fetch every batch the planner hands out, keeping at most controller.limit in flight
+        
+        Failed batches the planner splits are requeued instead of reported.
+        """
+        in_flight = self.in_flight
+
+        timeout = aiohttp.ClientTimeout(total=self.client.timeout)
+        connector = aiohttp.TCPConnector(limit=self.controller.max_limit)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            while planner.has_pending() or in_flight:
+                while len(in_flight) < self.controller.limit:
+                    batch = planner.next_batch()
+                    if batch is None:
+                        break
+                    task = asyncio.ensure_future(self.fetch_batch(session, batch))
+                    in_flight[task] = batch
+
+                done, _ = await asyncio.wait(in_flight.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    batch = in_flight.pop(task)
+                    api_data, latency, payload_bytes = task.result()
+                    if planner.record_result(batch, latency, payload_bytes, api_data is not None):
+                        continue
+                    await on_result(batch, api_data)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Adaptive batching for user_info_multiple calls
+Hands out PID batches whose size follows measured latency, payload size and
+failure rate, and splits failed batches in half so one bad PID does not
+write off the whole batch
+"""
+
+import logging
+import threading
+from collections import deque
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class PidBatch:
+    """One API request worth of PIDs"""
+    __slots__ = ('pids', 'num', 'depth')
+
+    def __init__(self, pids: List[str], num: int, depth: int = 0):
+        self.pids = pids
+        self.num = num
+        self.depth = depth  # How many times this batch's PIDs have been split after a failure
+
+
+class AdaptiveBatchSizer:
+    """Hill-climb the batch size towards the lowest seconds-per-PID
+
+    Every `window` requests the size moves one step in the current direction;
+    the direction flips when throughput got worse, and the size shrinks
+    whenever failures or payload size exceed their limits.
+    """
+
+    def __init__(self, initial_size: int = 50, min_size: int = 20, max_size: int = 100,
+                 step: int = 10, window: int = 10, failure_threshold: float = 0.2,
+                 max_payload_bytes: int = 5 * 1024 * 1024):
+        self.min_size = min_size
+        self.max_size = max(min_size, max_size)
+        self.step = step
+        self.window = window
+        self.failure_threshold = failure_threshold
+        self.max_payload_bytes = max_payload_bytes
+        self.size = max(self.min_size, min(initial_size, self.max_size))
+
+        self._samples = []  # (size, latency, payload_bytes, ok) since the last adjustment
+        self._direction = 1
+        self._last_seconds_per_pid = None
+
+    def record(self, size: int, latency: float, payload_bytes: int, ok: bool):
+        self._samples.append((size, latency, payload_bytes, ok))
+        if len(self._samples) >= self.window:
+            self._adjust()
+
+    def _adjust(self):
+        samples, self._samples = self._samples, []
+        ok_samples = [s for s in samples if s[3]]
+        failure_rate = 1 - len(ok_samples) / len(samples)
+        old_size = self.size
+
+        if failure_rate > self.failure_threshold:
+            self._direction = -1
+            self.size = max(self.min_size, self.size // 2)
+            self._last_seconds_per_pid = None
+            reason = f"failure rate {failure_rate:.0%}"
+        else:
+            seconds_per_pid = sum(s[1] for s in ok_samples) / max(1, sum(s[0] for s in ok_samples))
+            avg_payload = sum(s[2] for s in ok_samples) / max(1, len(ok_samples))
+
+            if avg_payload > self.max_payload_bytes:
+                self._direction = -1
+                reason = f"payload {avg_payload / 1024:.0f} KiB"
+            elif self._last_seconds_per_pid is not None and seconds_per_pid > self._last_seconds_per_pid * 1.05:
+                self._direction = -self._direction
+                reason = f"{seconds_per_pid * 1000:.1f} ms/PID, worse than before"
+            else:
+                reason = f"{seconds_per_pid * 1000:.1f} ms/PID"
+            self._last_seconds_per_pid = seconds_per_pid
+            self.size = max(self.min_size, min(self.max_size, self.size + self._direction * self.step))
+            if self.size in (self.min_size, self.max_size):
+                # Bounce off the limits so the next window explores the other way
+                self._direction = -1 if self.size == self.max_size else 1
+
+        if self.size != old_size:
+            logger.info(f"Adaptive batching: batch size {old_size} -> {self.size} ({reason})")
+
+
+class BatchPlanner:
+    """Thread-safe queue of pending PIDs that cuts batches on demand"""
+
+    def __init__(self, pids: List[str], sizer: AdaptiveBatchSizer, max_split_depth: int = 3):
+        self.sizer = sizer
+        self.max_split_depth = max_split_depth  # 50 -> 25 -> 12 -> 6 with the default of 3
+        self._pids = deque(pids)
+        self._retries = deque()  # Split halves of failed batches, served before new PIDs
+        self._next_num = 1
+        self._lock = threading.Lock()
+        self.splits = 0
+        self.latencies = []  # Seconds per request, for run statistics
+
+    def has_pending(self) -> bool:
+        with self._lock:
+            return bool(self._pids or self._retries)
+
+    @property
+    def pending_pids(self) -> int:
+        with self._lock:
+            return len(self._pids) + sum(len(batch.pids) for batch in self._retries)
+
+    def next_batch(self) -> Optional[PidBatch]:
+        """Cut the next batch, or None when nothing is pending"""
+        with self._lock:
+            if self._retries:
+                return self._retries.popleft()
+            if not self._pids:
+                return None
+            size = min(self.sizer.size, len(self._pids))
+            batch = PidBatch([self._pids.popleft() for _ in range(size)], self._next_num)
+            self._next_num += 1
+            return batch
+
+    def record_result(self, batch: PidBatch, latency: float, payload_bytes: int, ok: bool) -> bool:
+        """Feed one request outcome back; returns True if the failed batch was split and requeued"""
+        with self._lock:
+            self.latencies.append(latency)
+            # Split retries are not representative of the chosen size
+            if batch.depth == 0 or not ok:
+                self.sizer.record(len(batch.pids), latency, payload_bytes, ok)
+
+            if ok or len(batch.pids) < 2 or batch.depth >= self.max_split_depth:
+                return False
+
+            middle = len(batch.pids) // 2
+            self._retries.append(PidBatch(batch.pids[:middle], batch.num, batch.depth + 1))
+            self._retries.append(PidBatch(batch.pids[middle:], batch.num, batch.depth + 1))
+            self.splits += 1
+            logger.debug("Batch %d failed, retrying as two halves of %d and %d PIDs",
+                         batch.num, middle, len(batch.pids) - middle)
+            return True
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Ingestion throughput benchmark for update_player_stats.py
+Runs PlayerStatsUpdater.update_all_players against the local mock tgrcode
+server on a throwaway database and reports PIDs/second, batch latency
+percentiles and time spent writing to SQLite
+"""
+
+import argparse
+import logging
+import math
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import List
+
+from mock_tgrcode_server import add_server_arguments, server_from_args
+from update_player_stats import PlayerStatsUpdater, SNAPSHOT_INDEXES, SNAPSHOT_TABLE, SNAPSHOT_TABLE_SQL
+
+logger = logging.getLogger(__name__)
+
+FIRST_PID = 10 ** 15  # Synthetic PIDs have the same width as real ones
+
+
+def create_synthetic_database(db_path: str, player_count: int):
+    """Create a database with player rows and a day-old snapshot for each of them"""
+    with sqlite3.connect(db_path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+        cursor.execute(SNAPSHOT_TABLE_SQL.format(table=SNAPSHOT_TABLE))
+        for name, column in SNAPSHOT_INDEXES:
+            cursor.execute(f"CREATE INDEX {name} ON {SNAPSHOT_TABLE}({column})")
+
+        pids = [str(FIRST_PID + i) for i in range(player_count)]
+        cursor.executemany("INSERT INTO player (pid) VALUES (?)", [(pid,) for pid in pids])
+        cursor.executemany(f"""
+            INSERT INTO {SNAPSHOT_TABLE} (pid, created_at, fetched_at)
+            VALUES (?, datetime('now', '-1 day'), datetime('now', '-1 day'))
+        """, [(pid,) for pid in pids])
+        conn.commit()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile; 0 for an empty list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def failure_reasons(db_path: str, run_id) -> dict:
+    """Failed PIDs of a run per recorded reason (missing_from_response, invalid_response, ...)
+
+    Read from the run's checkpoints, the source of the dead-letter queue,
+    so failures are reported even when the run was not published.
+    """
+    if run_id is None:
+        return {}
+    with sqlite3.connect(db_path) as conn:
+        return dict(conn.execute("""
+            SELECT IFNULL(error, 'unknown'), COUNT(*) FROM update_checkpoints
+            WHERE run_id = ? AND status != 'done'
+            GROUP BY 1
+            ORDER BY 2 DESC
+        """, (run_id,)))
+
+
+def run_benchmark(args) -> dict:
+    work_dir = tempfile.mkdtemp(prefix='mario_bench_')
+    db_path = os.path.join(work_dir, 'bench.db')
+    if args.db:
+        # Never touch the source database; updates run against a copy
+        shutil.copyfile(args.db, db_path)
+    else:
+        create_synthetic_database(db_path, args.players)
+
+    server = server_from_args(args).start()
+    try:
+        updater = PlayerStatsUpdater(db_path, engine=args.engine)
+        updater.api_base_url = server.user_info_multiple_url
+        updater.rate_limit = args.rate_limit
+        updater.max_workers = args.max_workers
+        updater.max_concurrency = args.max_concurrency
+        updater.batch_size = args.batch_size
+        updater.min_batch_size = args.min_batch_size or args.batch_size
+        updater.max_batch_size = args.max_batch_size or args.batch_size
+        updater.commit_size = args.commit_size
+        updater.history_mode = args.history_mode
+
+        start = time.monotonic()
+        ok = updater.update_all_players()
+        elapsed = time.monotonic() - start
+        reasons = failure_reasons(db_path, updater.last_run_stats.get('run_id'))
+    finally:
+        server.stop()
+        if args.keep:
+            logger.info(f"Benchmark database kept at {db_path}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    stats = updater.last_run_stats
+    latencies = stats.get('batch_latencies', [])
+    return {
+        'ok': ok,
+        'elapsed': elapsed,
+        'pids': stats.get('pids', 0),
+        'successful': stats.get('successful', 0),
+        'failed': stats.get('failed', 0),
+        'failure_reasons': reasons,
+        'pids_per_second': stats.get('successful', 0) / elapsed if elapsed else 0.0,
+        'requests': len(latencies),
+        'p50_latency': percentile(latencies, 0.50),
+        'p99_latency': percentile(latencies, 0.99),
+        'final_batch_size': stats.get('final_batch_size'),
+        'splits': stats.get('splits', 0),
+        'write_seconds': stats.get('write_seconds', 0.0),
+        'commits': stats.get('commits', 0),
+        'publish_seconds': stats.get('publish_seconds', 0.0),
+        'server': dict(server.stats),
+    }
+
+
+def print_report(args, result: dict):
+    print("=" * 60)
+    print(f"INGESTION BENCHMARK ({args.engine} engine)")
+    print("=" * 60)
+    print(f"Run succeeded:        {result['ok']}")
+    print(f"PIDs:                 {result['pids']} ({result['successful']} updated, {result['failed']} failed)")
+    if result['failure_reasons']:
+        reasons = ', '.join(f"{count} {reason}" for reason, count in result['failure_reasons'].items())
+        print(f"Failures by reason:   {reasons}")
+    print(f"Wall time:            {result['elapsed']:.2f}s")
+    print(f"Throughput:           {result['pids_per_second']:.1f} PIDs/s")
+    print(f"API requests:         {result['requests']} (final batch size {result['final_batch_size']}, "
+          f"{result['splits']} splits)")
+    print(f"Batch latency p50:    {result['p50_latency'] * 1000:.1f} ms")
+    print(f"Batch latency p99:    {result['p99_latency'] * 1000:.1f} ms")
+    print(f"DB write time:        {result['write_seconds']:.2f}s in {result['commits']} commits")
+    print(f"Publish time:         {result['publish_seconds']:.2f}s")
+    server = result['server']
+    print(f"Server:               {server['requests']} requests, {server['rate_limited']} rate limited, "
+          f"{server['errors_injected']} injected errors, {server['rejected']} rejected")
+    print("=" * 60)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark update_player_stats.py against a local mock API')
+    parser.add_argument('--players', type=int, default=5000, help='Players in the synthetic database')
+    parser.add_argument('--db', help='Benchmark a copy of this database instead of a synthetic one')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark database afterwards')
+    parser.add_argument('--engine', choices=PlayerStatsUpdater.ENGINES, default='threads')
+    parser.add_argument('--max-workers', type=int, default=4, help='Threads for the threads engine')
+    parser.add_argument('--max-concurrency', type=int, default=32, help='In-flight limit for the asyncio engine')
+    parser.add_argument('--rate-limit', type=float, default=0.0,
+                        help='Client-side requests per second (0 disables, the default for benchmarking)')
+    parser.add_argument('--batch-size', type=int, default=50, help='Initial PIDs per API call')
+    parser.add_argument('--min-batch-size', type=int, default=None,
+                        help='Adaptive batch size lower bound (defaults to --batch-size, i.e. fixed batches)')
+    parser.add_argument('--max-batch-size', type=int, default=None,
+                        help='Adaptive batch size upper bound (defaults to --batch-size, i.e. fixed batches)')
+    parser.add_argument('--commit-size', type=int, default=2000, help='Players per writer transaction')
+    parser.add_argument('--history-mode', choices=PlayerStatsUpdater.HISTORY_MODES, default='full')
+    parser.add_argument('--verbose', action='store_true', help='Show the updater log on the console')
+    add_server_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    print_report(args, run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
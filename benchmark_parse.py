@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+CPU profile of user_info_multiple response handling
+Compares the previous dict-per-player parse with the current row-based
+process_api_response, with both JSON decoders, and reports CPU milliseconds
+per 1,000 players
+"""
+
+import argparse
+import cProfile
+import json
+import logging
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import tgrcode_client
+from benchmark_ingest import create_synthetic_database
+from mock_tgrcode_server import MockTgrcodeServer
+from update_player_stats import PlayerStatsUpdater
+
+logger = logging.getLogger(__name__)
+
+
+def legacy_process_api_response(api_data: Dict, requested_pids: List[str]) -> List[Dict]:
+    """The parse path before rows were introduced, kept as the benchmark baseline"""
+    processed_players = []
+    if 'users' in api_data:
+        for user_data in api_data['users']:
+            if isinstance(user_data, dict):
+                raw_pid = user_data.get('pid', '')
+                pid_str = str(raw_pid) if raw_pid else ''
+                player_info = {
+                    'pid': pid_str,
+                    'name': user_data.get('name', ''),
+                    'code': user_data.get('code', ''),
+                    'country': user_data.get('country', ''),
+                    'versus_rating': user_data.get('versus_rating', 0),
+                    'versus_won': user_data.get('versus_won', 0),
+                    'versus_plays': user_data.get('versus_plays', 0),
+                    'created_at': datetime.now().isoformat()
+                }
+                if player_info['pid'] and player_info['pid'] in requested_pids:
+                    processed_players.append(player_info)
+        logger.info(f"[Thread-{threading.get_ident()}] Processed {len(processed_players)} players from API response")
+    return processed_players
+
+
+def legacy_rows(players: List[Dict]) -> tuple:
+    """Turn legacy dicts into the executemany parameters the writer needs"""
+    profile_rows = [
+        (player.get('code') or None, player.get('country') or None, player.get('name') or None, player['pid'])
+        for player in players
+        if player.get('code') or player.get('country') or player.get('name')
+    ]
+    snapshot_rows = [
+        (player['pid'], player['versus_rating'], player['versus_won'], player['versus_plays'],
+         player['created_at'], player['created_at'])
+        for player in players
+    ]
+    return snapshot_rows, profile_rows
+
+
+def make_payloads(batch_count: int, batch_size: int) -> List[tuple]:
+    """Synthetic (pids, body) pairs shaped like user_info_multiple responses"""
+    server = MockTgrcodeServer()
+    server.stop()
+    payloads = []
+    for batch in range(batch_count):
+        pids = [str(10 ** 15 + batch * batch_size + i) for i in range(batch_size)]
+        body = json.dumps({'users': [server.synthetic_user(pid) for pid in pids]}).encode()
+        payloads.append((pids, body))
+    return payloads
+
+
+def measure(label: str, handler, payloads: List[tuple], rounds: int, profile: bool) -> float:
+    """CPU milliseconds per 1,000 players for decode + parse + row building"""
+    players = sum(len(pids) for pids, _ in payloads) * rounds
+    profiler = cProfile.Profile() if profile else None
+    if profiler:
+        profiler.enable()
+    start = time.process_time()
+    for _ in range(rounds):
+        for pids, body in payloads:
+            handler(pids, body)
+    cpu_seconds = time.process_time() - start
+    if profiler:
+        profiler.disable()
+        print(f"\n--- {label} ---")
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(8)
+    return cpu_seconds * 1000 / players * 1000
+
+
+def run_benchmark(args) -> List[tuple]:
+    payloads = make_payloads(args.batches, args.batch_size)
+    work_dir = tempfile.mkdtemp(prefix='mario_parse_bench_')
+    try:
+        db_path = os.path.join(work_dir, 'bench.db')
+        create_synthetic_database(db_path, 0)
+        updater = PlayerStatsUpdater(db_path)
+
+        def legacy(pids, body):
+            return legacy_rows(legacy_process_api_response(json.loads(body), pids))
+
+        def stdlib_json(pids, body):
+            return updater.process_api_response(json.loads(body), pids)
+
+        def fast_json(pids, body):
+            return updater.process_api_response(tgrcode_client.loads_json(body), pids)
+
+        cases = [('before: dicts + json', legacy), ('after: rows + json', stdlib_json)]
+        if tgrcode_client.orjson is not None:
+            cases.append(('after: rows + orjson', fast_json))
+        else:
+            logger.warning("orjson is not installed, skipping the fast decoder case")
+
+        results = []
+        for label, handler in cases:
+            handler(*payloads[0])  # Warm up
+            results.append((label, measure(label, handler, payloads, args.rounds, args.profile)))
+        return results
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Profile API response parsing per 1,000 players')
+    parser.add_argument('--batches', type=int, default=200, help='Responses per round')
+    parser.add_argument('--batch-size', type=int, default=50, help='Players per response')
+    parser.add_argument('--rounds', type=int, default=5, help='Passes over all responses')
+    parser.add_argument('--profile', action='store_true', help='Print the top cProfile entries for each case')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = run_benchmark(args)
+    baseline = results[0][1]
+    print("=" * 60)
+    print(f"PARSE BENCHMARK ({args.batches} x {args.batch_size} players, {args.rounds} rounds)")
+    print("=" * 60)
+    for label, ms_per_1000 in results:
+        print(f"{label:<24} {ms_per_1000:8.2f} ms CPU / 1,000 players  ({baseline / ms_per_1000:.2f}x)")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
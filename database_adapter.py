@@ -2,6 +2,7 @@ import os
 from typing import List, Dict, Optional
 from database import MarioDatabase
 from s3_database import S3Database
+from player_search import SEARCH_INDEX_PROBE_SQL, SEARCH_PIDS_SQL, match_expression
 import logging
 
 logger = logging.getLogger(__name__)
@@ -152,16 +153,28 @@ class DatabaseAdapter:
     def search_players(self, query: str) -> List[Dict]:
         """搜索玩家"""
         if self.is_s3:
-            # S3数据库查询 - 使用player表
-            search_query = f"%{query}%"
-            sql_query = """
-                SELECT DISTINCT p.pid, p.name
-                FROM player p
-                WHERE p.name LIKE ? OR p.pid LIKE ? OR p.code LIKE ?
-                ORDER BY p.name
-                LIMIT 20
-            """
-            result = self.db.execute_query(sql_query, (search_query, search_query, search_query))
+            # S3数据库查询 - 使用player表，有三元组全文索引时走索引
+            # execute_query 出错时返回None（没有索引或SQLite不支持trigram），此时退回LIKE
+            match = match_expression(query) if self.db.execute_query(SEARCH_INDEX_PROBE_SQL) else None
+            if match:
+                sql_query = f"""
+                    SELECT p.pid, p.name
+                    FROM player p
+                    WHERE p.pid IN ({SEARCH_PIDS_SQL})
+                    ORDER BY p.name
+                    LIMIT 20
+                """
+                result = self.db.execute_query(sql_query, (match,))
+            else:
+                search_query = f"%{query}%"
+                sql_query = """
+                    SELECT DISTINCT p.pid, p.name
+                    FROM player p
+                    WHERE p.name LIKE ? OR p.pid LIKE ? OR p.code LIKE ?
+                    ORDER BY p.name
+                    LIMIT 20
+                """
+                result = self.db.execute_query(sql_query, (search_query, search_query, search_query))
             if result:
                 return [{
                     'pid': row[0], 'name': row[1]
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Tiered retention for player_stats_history
+Rows newer than raw_days stay at full resolution. Older rows are rolled up
+per player and week (min/max/last into player_stats_history_rollup), and
+rows older than weekly_days are rolled up again per month. Inside a rolled
+up period only the last history row is kept, so the history endpoints keep
+working on the thinned table. Watermarks make every pass incremental, which
+is cheap enough to run after each ingest
+"""
+
+import argparse
+import logging
+import sqlite3
+import sys
+from typing import Dict
+
+from player_search import PlayerSearch
+
+logger = logging.getLogger(__name__)
+
+# SQLite expressions mapping a timestamp or date to the start of its period
+WEEK_START = "date({column}, 'weekday 0', '-6 days')"  # Monday
+MONTH_START = "date({column}, 'start of month')"
+
+
+class HistoryRetention:
+    """Roll up and prune old player_stats_history rows"""
+
+    def __init__(self, db_path: str = "mario_filtered.db", raw_days: int = 90, weekly_days: int = 365):
+        self.db_path = db_path
+        self.raw_days = raw_days  # Full-resolution window
+        self.weekly_days = max(weekly_days, raw_days)  # Weekly rollups until this age, monthly beyond
+
+    @staticmethod
+    def ensure_schema(cursor: sqlite3.Cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_stats_history_rollup (
+                pid TEXT NOT NULL,
+                period TEXT NOT NULL,
+                period_start DATE NOT NULL,
+                samples INTEGER NOT NULL,
+                min_rating INTEGER,
+                max_rating INTEGER,
+                min_win_rate REAL,
+                max_win_rate REAL,
+                last_rating INTEGER,
+                last_won INTEGER,
+                last_plays INTEGER,
+                last_win_rate REAL,
+                last_created_at TIMESTAMP,
+                PRIMARY KEY (pid, period, period_start),
+                FOREIGN KEY (pid) REFERENCES player(pid)
+            ) WITHOUT ROWID
+        """)
+        # How far each tier has been rolled up; periods before the watermark are never rescanned
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS history_retention_state (
+                period TEXT PRIMARY KEY,
+                rolled_up_to DATE NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    def run(self, vacuum: bool = False) -> Dict[str, int]:
+        """Apply the policy in one transaction; returns counts of rollups written and rows pruned"""
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            self.ensure_schema(cursor)
+            stats = {}
+            stats['weekly_rollups'], stats['weekly_pruned'] = self._roll_up_weeks(cursor)
+            stats['monthly_rollups'], stats['monthly_pruned'] = self._roll_up_months(cursor)
+            cursor.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            logger.error(f"Error applying history retention: {e}")
+            raise
+        else:
+            pruned = stats['weekly_pruned'] + stats['monthly_pruned']
+            logger.info(f"History retention: {stats['weekly_rollups']} weekly and {stats['monthly_rollups']} "
+                        f"monthly rollups written, {pruned} history rows pruned")
+            if vacuum and pruned:
+                # Pruned pages only leave the file (and the S3 upload) after a VACUUM
+                conn.execute("VACUUM")
+                logger.info("Database vacuumed")
+                # VACUUM may renumber player rowids, which the search index is keyed on
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                PlayerSearch.rebuild(cursor)
+                cursor.execute("COMMIT")
+            return stats
+        finally:
+            conn.close()
+
+    def _window(self, cursor: sqlite3.Cursor, period: str, cutoff_sql: str) -> tuple:
+        """(watermark, cutoff) dates of the periods that are due; watermark is None on the first pass"""
+        cursor.execute(f"SELECT {cutoff_sql}")
+        cutoff = cursor.fetchone()[0]
+        cursor.execute("SELECT rolled_up_to FROM history_retention_state WHERE period = ?", (period,))
+        row = cursor.fetchone()
+        return (row[0] if row else None), cutoff
+
+    def _advance(self, cursor: sqlite3.Cursor, period: str, cutoff: str):
+        cursor.execute("""
+            INSERT INTO history_retention_state (period, rolled_up_to) VALUES (?, ?)
+            ON CONFLICT(period) DO UPDATE SET rolled_up_to = excluded.rolled_up_to, updated_at = CURRENT_TIMESTAMP
+        """, (period, cutoff))
+
+    def _prune_history(self, cursor: sqlite3.Cursor, period_start: str, watermark, cutoff: str) -> int:
+        """Delete every history row in [watermark, cutoff) except the last one per player and period"""
+        cursor.execute(f"""
+            DELETE FROM player_stats_history
+            WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY pid, {period_start.format(column='created_at')}
+                        ORDER BY created_at DESC, id DESC
+                    ) AS recency
+                    FROM player_stats_history
+                    WHERE created_at >= ? AND created_at < ?
+                )
+                WHERE recency > 1
+            )
+        """, (watermark or '', cutoff))
+        return cursor.rowcount
+
+    def _roll_up_weeks(self, cursor: sqlite3.Cursor) -> tuple:
+        """Roll complete weeks older than raw_days up from the raw history rows"""
+        watermark, cutoff = self._window(
+            cursor, 'week', WEEK_START.format(column=f"date('now', '-{self.raw_days} days')"))
+        if watermark is not None and watermark >= cutoff:
+            return 0, 0
+
+        week_start = WEEK_START.format(column='created_at')
+        cursor.execute(f"""
+            INSERT INTO player_stats_history_rollup
+            (pid, period, period_start, samples, min_rating, max_rating, min_win_rate, max_win_rate,
+             last_rating, last_won, last_plays, last_win_rate, last_created_at)
+            SELECT pid, 'week', period_start, COUNT(*),
+                   MIN(versus_rating), MAX(versus_rating), MIN(win_rate), MAX(win_rate),
+                   MAX(CASE WHEN recency = 1 THEN versus_rating END),
+                   MAX(CASE WHEN recency = 1 THEN versus_won END),
+                   MAX(CASE WHEN recency = 1 THEN versus_plays END),
+                   MAX(CASE WHEN recency = 1 THEN win_rate END),
+                   MAX(created_at)
+            FROM (
+                SELECT pid, versus_rating, versus_won, versus_plays, win_rate, created_at,
+                       {week_start} AS period_start,
+                       ROW_NUMBER() OVER (PARTITION BY pid, {week_start} ORDER BY created_at DESC, id DESC) AS recency
+                FROM player_stats_history
+                WHERE created_at >= ? AND created_at < ?
+            )
+            WHERE period_start IS NOT NULL
+            GROUP BY pid, period_start
+            ON CONFLICT(pid, period, period_start) DO UPDATE SET
+                samples = samples + excluded.samples,
+                min_rating = MIN(min_rating, excluded.min_rating),
+                max_rating = MAX(max_rating, excluded.max_rating),
+                min_win_rate = MIN(min_win_rate, excluded.min_win_rate),
+                max_win_rate = MAX(max_win_rate, excluded.max_win_rate),
+                last_rating = excluded.last_rating,
+                last_won = excluded.last_won,
+                last_plays = excluded.last_plays,
+                last_win_rate = excluded.last_win_rate,
+                last_created_at = excluded.last_created_at
+            WHERE excluded.last_created_at >= last_created_at
+        """, (watermark or '', cutoff))
+        rollups = cursor.rowcount
+        pruned = self._prune_history(cursor, WEEK_START, watermark, cutoff)
+        self._advance(cursor, 'week', cutoff)
+        return rollups, pruned
+
+    def _roll_up_months(self, cursor: sqlite3.Cursor) -> tuple:
+        """Merge weekly rollups older than weekly_days into monthly ones
+
+        A week belongs to the month it starts in, so a month's min/max can
+        include a few days of the next month.
+        """
+        watermark, cutoff = self._window(
+            cursor, 'month', MONTH_START.format(column=f"date('now', '-{self.weekly_days} days')"))
+        if watermark is not None and watermark >= cutoff:
+            return 0, 0
+
+        month_start = MONTH_START.format(column='period_start')
+        cursor.execute(f"""
+            INSERT INTO player_stats_history_rollup
+            (pid, period, period_start, samples, min_rating, max_rating, min_win_rate, max_win_rate,
+             last_rating, last_won, last_plays, last_win_rate, last_created_at)
+            SELECT pid, 'month', month, SUM(samples),
+                   MIN(min_rating), MAX(max_rating), MIN(min_win_rate), MAX(max_win_rate),
+                   MAX(CASE WHEN recency = 1 THEN last_rating END),
+                   MAX(CASE WHEN recency = 1 THEN last_won END),
+                   MAX(CASE WHEN recency = 1 THEN last_plays END),
+                   MAX(CASE WHEN recency = 1 THEN last_win_rate END),
+                   MAX(last_created_at)
+            FROM (
+                SELECT *, {month_start} AS month,
+                       ROW_NUMBER() OVER (PARTITION BY pid, {month_start} ORDER BY period_start DESC) AS recency
+                FROM player_stats_history_rollup
+                WHERE period = 'week' AND period_start >= ? AND period_start < ?
+            )
+            WHERE month IS NOT NULL
+            GROUP BY pid, month
+            ON CONFLICT(pid, period, period_start) DO UPDATE SET
+                samples = samples + excluded.samples,
+                min_rating = MIN(min_rating, excluded.min_rating),
+                max_rating = MAX(max_rating, excluded.max_rating),
+                min_win_rate = MIN(min_win_rate, excluded.min_win_rate),
+                max_win_rate = MAX(max_win_rate, excluded.max_win_rate),
+                last_rating = excluded.last_rating,
+                last_won = excluded.last_won,
+                last_plays = excluded.last_plays,
+                last_win_rate = excluded.last_win_rate,
+                last_created_at = excluded.last_created_at
+            WHERE excluded.last_created_at >= last_created_at
+        """, (watermark or '', cutoff))
+        rollups = cursor.rowcount
+        cursor.execute("""
+            DELETE FROM player_stats_history_rollup
+            WHERE period = 'week' AND period_start >= ? AND period_start < ?
+        """, (watermark or '', cutoff))
+        pruned = self._prune_history(cursor, MONTH_START, watermark, cutoff)
+        self._advance(cursor, 'month', cutoff)
+        return rollups, pruned
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Roll up and prune old player_stats_history rows')
+    parser.add_argument('--db', default='mario_filtered.db', help='SQLite database to maintain')
+    parser.add_argument('--raw-days', type=int, default=90, help='Days of history kept at full resolution')
+    parser.add_argument('--weekly-days', type=int, default=365,
+                        help='Days of history kept as weekly rollups; older history becomes monthly')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM afterwards so the file shrinks')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    HistoryRetention(args.db, args.raw_days, args.weekly_days).run(vacuum=args.vacuum)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Streaming importer for a local copy of the TheGreatRambler/mm2_user dataset
+Reads parquet or Arrow IPC files in record batches, keeping only the columns
+the site uses, and bulk-loads them into the player table (new PIDs inserted,
+changed profiles updated). With --snapshot the versus stats are published as
+a new snapshot through the updater's staging table, carrying over players the
+dataset does not cover. Memory use is bounded by the batch size
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+try:
+    # Optional: only the importer needs it
+    import pyarrow.dataset as pa_dataset
+except ImportError:
+    pa_dataset = None
+
+from snapshot_writer import SNAPSHOT_INSERT_SQL, apply_profile_changes, stage_profile_changes
+from update_player_stats import SNAPSHOT_TABLE, SNAPSHOT_TABLE_SQL, STAGING_TABLE, PlayerStatsUpdater
+
+logger = logging.getLogger(__name__)
+
+PROFILE_COLUMNS = ['pid', 'name', 'code', 'country']
+VERSUS_COLUMNS = ['versus_rating', 'versus_won', 'versus_plays']
+FILE_FORMATS = {'.parquet': 'parquet', '.arrow': 'ipc', '.feather': 'ipc', '.ipc': 'ipc'}
+
+
+def open_dataset(source: str, file_format: Optional[str] = None):
+    """Open a file or directory of parquet / Arrow IPC files without reading it"""
+    if pa_dataset is None:
+        raise RuntimeError("pyarrow is required to import the dataset: pip install pyarrow")
+    if file_format is None:
+        file_format = FILE_FORMATS.get(os.path.splitext(source)[1].lower(), 'parquet')
+    return pa_dataset.dataset(source, format=file_format)
+
+
+class DatasetImporter:
+    """Bulk-load mm2_user record batches into player and, optionally, a new snapshot"""
+
+    def __init__(self, db_path: str = "mario_filtered.db", batch_size: int = 50000):
+        self.db_path = db_path
+        self.batch_size = batch_size  # Rows per record batch and per transaction
+
+    def _ensure_base_tables(self):
+        """Create player and the live snapshot on an empty database so a full rebuild works"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("CREATE TABLE IF NOT EXISTS player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SNAPSHOT_TABLE,))
+            if cursor.fetchone() is None:
+                cursor.execute(SNAPSHOT_TABLE_SQL.format(table=SNAPSHOT_TABLE))
+            conn.commit()
+
+    def run(self, source: str, file_format: Optional[str] = None, snapshot: bool = False,
+            min_plays: int = 0, as_of: Optional[str] = None) -> Dict:
+        """Import the dataset; returns counts of rows read, players inserted and profiles changed"""
+        dataset = open_dataset(source, file_format)
+        available = set(dataset.schema.names)
+        if 'pid' not in available:
+            raise ValueError(f"{source} has no 'pid' column")
+        try:
+            # Normalized so DATE() works on it; one timestamp for every row of the snapshot
+            fetched_at = datetime.fromisoformat(as_of).isoformat() if as_of else datetime.now().isoformat()
+        except ValueError:
+            raise ValueError(f"--as-of must be an ISO date or timestamp, got {as_of!r}")
+        missing_versus = [column for column in VERSUS_COLUMNS if column not in available]
+        if (snapshot or min_plays) and missing_versus:
+            raise ValueError(f"{source} lacks versus columns {missing_versus}")
+        columns = [column for column in PROFILE_COLUMNS + VERSUS_COLUMNS if column in available]
+
+        # Projection and the plays filter are pushed down, so skipped columns and rows are never decoded
+        row_filter = pa_dataset.field('versus_plays') >= min_plays if min_plays else None
+        batches = dataset.to_batches(columns=columns, filter=row_filter, batch_size=self.batch_size)
+
+        self._ensure_base_tables()
+        updater = PlayerStatsUpdater(self.db_path)
+        run_id = None
+        if snapshot:
+            updater.prepare_staging_table()
+            run_id = updater.start_run([], mode='import', snapshot_at=fetched_at)
+
+        stats = {'rows': 0, 'players_inserted': 0, 'profiles_changed': 0, 'snapshot_rows': 0}
+        start = time.monotonic()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            for batch in batches:
+                self._load_batch(cursor, batch.to_pydict(), run_id, fetched_at, stats)
+                conn.commit()
+                logger.info(f"Imported {stats['rows']} rows ({stats['players_inserted']} new players, "
+                            f"{stats['rows'] / max(time.monotonic() - start, 1e-9):.0f} rows/s)")
+            if run_id is not None:
+                cursor.execute("UPDATE update_runs SET total_pids = ? WHERE id = ?", (stats['snapshot_rows'], run_id))
+                conn.commit()
+        except Exception:
+            if run_id is not None:
+                updater.finish_run(run_id, 'failed')
+            raise
+        finally:
+            conn.close()
+
+        if run_id is not None:
+            updater.publish_snapshot(run_id)
+        logger.info(f"Dataset import finished in {time.monotonic() - start:.1f}s: {stats['rows']} rows, "
+                    f"{stats['players_inserted']} players inserted, {stats['profiles_changed']} profiles changed, "
+                    f"{stats['snapshot_rows']} snapshot rows")
+        return stats
+
+    def _load_batch(self, cursor: sqlite3.Cursor, columns: Dict[str, List], run_id: Optional[int],
+                    fetched_at: str, stats: Dict):
+        """Write one record batch; `columns` maps column names to equal-length lists"""
+        count = len(columns['pid'])
+        empty = [None] * count
+        pids = [str(pid) if pid not in (None, '') else None for pid in columns['pid']]
+        names, codes, countries = (columns.get(column, empty) for column in ('name', 'code', 'country'))
+
+        profile_rows = [(code or None, country or None, name or None, pid)
+                        for pid, name, code, country in zip(pids, names, codes, countries) if pid]
+        cursor.executemany("INSERT OR IGNORE INTO player (code, country, name, pid) VALUES (?, ?, ?, ?)", profile_rows)
+        stats['players_inserted'] += cursor.rowcount
+        # New players already hold these values, so only existing players with changes are rewritten;
+        # a snapshot import holds the changes back until publish_snapshot applies them with the snapshot
+        if run_id is None:
+            stats['profiles_changed'] += apply_profile_changes(cursor, profile_rows)
+        else:
+            stats['profiles_changed'] += stage_profile_changes(cursor, profile_rows)
+        stats['rows'] += count
+
+        if run_id is None:
+            return
+        snapshot_rows = [
+            (pid, rating or 0, won or 0, plays or 0, fetched_at, fetched_at)
+            for pid, rating, won, plays in zip(pids, columns['versus_rating'], columns['versus_won'],
+                                               columns['versus_plays'])
+            if pid
+        ]
+        cursor.executemany(SNAPSHOT_INSERT_SQL.format(table=STAGING_TABLE), snapshot_rows)
+        # Done checkpoints tell publish_snapshot which live players not to carry over
+        cursor.executemany("""
+            INSERT OR REPLACE INTO update_checkpoints (run_id, pid, status, attempts, updated_at)
+            VALUES (?, ?, 'done', 1, CURRENT_TIMESTAMP)
+        """, [(run_id, row[0]) for row in snapshot_rows])
+        stats['snapshot_rows'] += len(snapshot_rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import a local copy of the mm2_user dataset')
+    parser.add_argument('source', help='Parquet / Arrow IPC file, or a directory of them')
+    parser.add_argument('--db', default='mario_filtered.db', help='SQLite database to load into')
+    parser.add_argument('--format', choices=sorted(set(FILE_FORMATS.values())), default=None,
+                        help='File format (default: from the file extension, parquet for directories)')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Rows per record batch and transaction')
+    parser.add_argument('--min-plays', type=int, default=0, help='Skip players with fewer versus plays')
+    parser.add_argument('--snapshot', action='store_true',
+                        help='Also publish the versus stats as a new snapshot (other players are carried over)')
+    parser.add_argument('--as-of', default=None,
+                        help='ISO date or timestamp stored as created_at/fetched_at of snapshot rows, '
+                             'carried-over players included (default: now)')
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    try:
+        DatasetImporter(args.db, args.batch_size).run(args.source, args.format, snapshot=args.snapshot,
+                                                      min_plays=args.min_plays, as_of=args.as_of)
+    except (RuntimeError, ValueError) as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
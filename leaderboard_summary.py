@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Leaderboard aggregates materialized once per published snapshot
+The updater computes totals, averages, rating / win-rate histograms and
+per-country counts at publish time so /api/ranking-stats reads a single row
+instead of aggregating the whole snapshot on every page load
+"""
+
+import json
+import logging
+import sqlite3
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Histogram buckets are half-open, min <= value < max; the top win-rate bucket also holds 100%
+RATING_BUCKET = 500  # Width of a rating histogram bucket
+WIN_RATE_BUCKET = 10  # Width of a win-rate histogram bucket, in percent
+
+
+class LeaderboardSummary:
+    """Maintain the per-snapshot leaderboard_summary rows"""
+
+    @staticmethod
+    def ensure_schema(cursor: sqlite3.Cursor):
+        """Create the summary table; one row per published snapshot"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS leaderboard_summary (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id INTEGER,
+                latest_date TEXT,
+                total_players INTEGER NOT NULL DEFAULT 0,
+                avg_rating REAL,
+                avg_win_rate REAL,
+                total_wins INTEGER,
+                total_plays INTEGER,
+                rating_histogram TEXT,
+                win_rate_histogram TEXT,
+                country_counts TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    @staticmethod
+    def refresh(cursor: sqlite3.Cursor, run_id: Optional[int], snapshot_table: str = 'player_stats_snapshot'):
+        """Aggregate the snapshot's latest day, like /api/ranking-stats used to on every request
+
+        Must run inside the publish transaction, after the new snapshot is live,
+        so readers never see a summary that belongs to another snapshot.
+        """
+        cursor.execute(f"SELECT MAX(snapshot_date) FROM {snapshot_table}")
+        latest_date = cursor.fetchone()[0]
+
+        # Latest day's players, joined to player exactly as the endpoint did
+        latest_rows = f"""
+            SELECT pss.versus_rating, pss.versus_won, pss.versus_plays, p.country
+            FROM player p
+            JOIN {snapshot_table} pss ON p.pid = pss.pid
+            WHERE pss.snapshot_date = ?
+        """
+
+        cursor.execute(f"""
+            SELECT COUNT(*),
+                   AVG(versus_rating),
+                   AVG(CASE WHEN versus_plays > 0 THEN (versus_won * 100.0 / versus_plays) ELSE 0 END),
+                   SUM(versus_won),
+                   SUM(versus_plays)
+            FROM ({latest_rows})
+        """, (latest_date,))
+        total_players, avg_rating, avg_win_rate, total_wins, total_plays = cursor.fetchone()
+
+        cursor.execute(f"""
+            SELECT (versus_rating / {RATING_BUCKET}) * {RATING_BUCKET} AS bucket, COUNT(*)
+            FROM ({latest_rows})
+            GROUP BY bucket
+            ORDER BY bucket
+        """, (latest_date,))
+        rating_histogram = [{'min': bucket, 'max': bucket + RATING_BUCKET, 'count': count}
+                            for bucket, count in cursor.fetchall()]
+
+        # Players without games have no win rate and are left out of this histogram
+        cursor.execute(f"""
+            SELECT MIN(versus_won * 100 / versus_plays / {WIN_RATE_BUCKET} * {WIN_RATE_BUCKET},
+                       {100 - WIN_RATE_BUCKET}) AS bucket,
+                   COUNT(*)
+            FROM ({latest_rows})
+            WHERE versus_plays > 0
+            GROUP BY bucket
+            ORDER BY bucket
+        """, (latest_date,))
+        win_rate_histogram = [{'min': bucket, 'max': bucket + WIN_RATE_BUCKET, 'count': count}
+                              for bucket, count in cursor.fetchall()]
+
+        cursor.execute(f"""
+            SELECT COALESCE(NULLIF(country, ''), 'unknown') AS country_code, COUNT(*)
+            FROM ({latest_rows})
+            GROUP BY country_code
+            ORDER BY COUNT(*) DESC
+        """, (latest_date,))
+        country_counts = dict(cursor.fetchall())
+
+        cursor.execute("""
+            INSERT INTO leaderboard_summary
+            (run_id, latest_date, total_players, avg_rating, avg_win_rate, total_wins, total_plays,
+             rating_histogram, win_rate_histogram, country_counts)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (run_id, latest_date, total_players, avg_rating, avg_win_rate, total_wins, total_plays,
+              json.dumps(rating_histogram), json.dumps(win_rate_histogram), json.dumps(country_counts)))
+        logger.info(f"Leaderboard summary stored for {latest_date}: {total_players} players, "
+                    f"{len(country_counts)} countries")
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the tgrcode API used when benchmarking the updater
+Serves /mm2/user_info_multiple/<pids> and /mm2/user_info/<code> from recorded
+or synthetic payloads, with configurable latency, error rate and rate limit
+"""
+
+import argparse
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from tgrcode_client import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+COUNTRIES = ['JP', 'US', 'CN', 'FR', 'DE', 'GB', 'KR', 'CA', 'ES', 'IT']
+
+
+class MockTgrcodeServer:
+    """Threaded HTTP server imitating the tgrcode user endpoints"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency_ms: float = 50.0,
+                 latency_per_pid_ms: float = 0.5, jitter_ms: float = 10.0, error_rate: float = 0.0,
+                 missing_rate: float = 0.0, rate_limit: float = 0.0, max_batch: int = 0,
+                 change_rate: float = 0.1, payloads: Optional[Dict[str, dict]] = None, seed: int = 0):
+        self.latency_ms = latency_ms  # Base latency of every request
+        self.latency_per_pid_ms = latency_per_pid_ms  # Extra latency per requested PID
+        self.jitter_ms = jitter_ms  # Uniform +/- jitter added to the latency
+        self.error_rate = error_rate  # Fraction of requests answered with a 500
+        self.missing_rate = missing_rate  # Fraction of PIDs the API does not know; always the same PIDs
+        self.max_batch = max_batch  # PIDs allowed per user_info_multiple call (0 = unlimited)
+        self.change_rate = change_rate  # Chance a synthetic player gained plays since the last request
+        self.payloads = payloads or {}  # Recorded users keyed by PID, served instead of synthetic ones
+        self.rate_limiter = TokenBucket(rate_limit)  # Requests per second before answering 429
+
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._plays = {}  # Synthetic play counts, so repeated runs see players progress
+        self._codes = {}  # Maker code -> PID for synthetic users served so far
+        self._stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'pids_requested': 0, 'pids_served': 0,
+                      'errors_injected': 0, 'rate_limited': 0, 'rejected': 0}
+
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def user_info_multiple_url(self) -> str:
+        """Value to use as PlayerStatsUpdater.api_base_url"""
+        return f"{self.url}/mm2/user_info_multiple/"
+
+    def start(self) -> 'MockTgrcodeServer':
+        """Serve from a background thread"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="MockTgrcodeServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Mock tgrcode server listening on {self.url}")
+        return self
+
+    def serve_forever(self):
+        logger.info(f"Mock tgrcode server listening on {self.url}")
+        self._httpd.serve_forever()
+
+    def stop(self):
+        if self._thread:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def _count(self, key: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def _chance(self, probability: float) -> bool:
+        if probability <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < probability
+
+    def _latency(self, pid_count: int) -> float:
+        with self._random_lock:
+            jitter = self._random.uniform(-self.jitter_ms, self.jitter_ms)
+        return max(0.0, self.latency_ms + self.latency_per_pid_ms * pid_count + jitter) / 1000
+
+    def synthetic_user(self, pid: str) -> dict:
+        """Stable profile per PID whose play count grows as it keeps being requested"""
+        seed = zlib.crc32(pid.encode())
+        code = f"{seed % 0xFFFFFFFFF:09X}"
+        with self._random_lock:
+            plays = self._plays.get(pid, 50 + seed % 5000)
+            if self._random.random() < self.change_rate:
+                plays += self._random.randint(1, 20)
+            self._plays[pid] = plays
+            self._codes[code] = pid
+        won = plays * (30 + seed % 40) // 100
+        return {
+            'pid': int(pid) if pid.isdigit() else pid,
+            'name': f"Player{seed % 100000:05d}",
+            'code': code,
+            'country': COUNTRIES[seed % len(COUNTRIES)],
+            'versus_rating': (seed >> 8) % 9000 + plays % 100,
+            'versus_won': won,
+            'versus_plays': plays,
+        }
+
+    def is_missing(self, pid: str) -> bool:
+        """Deleted or unknown accounts are left out of responses, like the real API does"""
+        if pid in self.payloads or self.missing_rate <= 0:
+            return False
+        return zlib.crc32(pid.encode()) % 10000 < self.missing_rate * 10000
+
+    def user(self, pid: str) -> dict:
+        return self.payloads.get(pid) or self.synthetic_user(pid)
+
+    def user_by_code(self, code: str) -> dict:
+        for user in self.payloads.values():
+            if user.get('code') == code:
+                return user
+        with self._random_lock:
+            pid = self._codes.get(code)
+        return self.synthetic_user(pid or str(zlib.crc32(code.encode())))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def send_json(self, status: int, payload, headers: Dict[str, str] = None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                server._count('requests')
+                path = self.path.split('?', 1)[0].rstrip('/')
+
+                if path.startswith('/mm2/user_info_multiple/'):
+                    pids = [pid for pid in path.rsplit('/', 1)[1].split(',') if pid]
+                elif path.startswith('/mm2/user_info/'):
+                    pids = None
+                else:
+                    server._count('rejected')
+                    self.send_json(404, {'error': 'Not found'})
+                    return
+
+                if not server.rate_limiter.try_acquire():
+                    server._count('rate_limited')
+                    self.send_json(429, {'error': 'Too many requests'}, {'Retry-After': '1'})
+                    return
+
+                time.sleep(server._latency(len(pids) if pids else 1))
+
+                if server._chance(server.error_rate):
+                    server._count('errors_injected')
+                    self.send_json(500, {'error': 'Injected failure'})
+                    return
+
+                if pids is None:
+                    server._count('pids_requested')
+                    server._count('pids_served')
+                    self.send_json(200, server.user_by_code(path.rsplit('/', 1)[1]))
+                    return
+
+                server._count('pids_requested', len(pids))
+                if server.max_batch and len(pids) > server.max_batch:
+                    server._count('rejected')
+                    self.send_json(400, {'error': f'At most {server.max_batch} ids per request'})
+                    return
+
+                users = [server.user(pid) for pid in pids if not server.is_missing(pid)]
+                server._count('pids_served', len(users))
+                self.send_json(200, {'users': users})
+
+        return Handler
+
+
+def load_payloads(path: str) -> Dict[str, dict]:
+    """Load recorded users from a saved user_info_multiple response or a list of users"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    users = data.get('users', []) if isinstance(data, dict) else data
+    return {str(user['pid']): user for user in users if isinstance(user, dict) and user.get('pid')}
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """Options shared by the standalone server and the ingestion benchmark"""
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Base response latency')
+    parser.add_argument('--latency-per-pid-ms', type=float, default=0.5, help='Extra latency per requested PID')
+    parser.add_argument('--jitter-ms', type=float, default=10.0, help='Uniform latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--missing-rate', type=float, default=0.0,
+                        help='Fraction of PIDs the API does not know (always left out of batch responses)')
+    parser.add_argument('--server-rate-limit', type=float, default=0.0,
+                        help='Requests per second before the server answers 429 (0 disables)')
+    parser.add_argument('--max-batch', type=int, default=0, help='Reject batches larger than this (0 = unlimited)')
+    parser.add_argument('--change-rate', type=float, default=0.1,
+                        help='Chance a synthetic player gained plays between requests')
+    parser.add_argument('--payloads', help='JSON file with recorded users to serve instead of synthetic ones')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for latency, errors and drift')
+
+
+def server_from_args(args, host: str = '127.0.0.1', port: int = 0) -> MockTgrcodeServer:
+    return MockTgrcodeServer(
+        host=host, port=port, latency_ms=args.latency_ms, latency_per_pid_ms=args.latency_per_pid_ms,
+        jitter_ms=args.jitter_ms, error_rate=args.error_rate, missing_rate=args.missing_rate,
+        rate_limit=args.server_rate_limit, max_batch=args.max_batch, change_rate=args.change_rate,
+        payloads=load_payloads(args.payloads) if args.payloads else None, seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local mock of the tgrcode user API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = server_from_args(args, args.host, args.port)
+    logger.info(f"Point the updater at {server.user_info_multiple_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        logger.info(f"Served: {server.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Trigram full-text index over player names, codes and PIDs
+An FTS5 table with the trigram tokenizer answers substring queries
+(including Japanese and other non-Latin names) from the index instead of
+scanning player with LIKE '%q%'. Triggers on player keep it in sync with
+every writer, so the updater only has to create and build it once
+"""
+
+import logging
+import sqlite3
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'player_search'
+MIN_QUERY_LENGTH = 3  # Trigrams cannot match anything shorter; such queries fall back to LIKE
+# Always one row when the index is usable; fails when it is missing or the reader's SQLite lacks the tokenizer
+SEARCH_INDEX_PROBE_SQL = f"SELECT COUNT(*) FROM (SELECT 1 FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH '\"probe\"' LIMIT 1)"
+# PIDs whose name, code or PID contain the phrase from match_expression
+SEARCH_PIDS_SQL = f"SELECT pid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH ?"
+
+# External-content table: the index stores no copy of the profiles and its rows share player's rowid
+SEARCH_TABLE_SQL = (f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+                    f"pid, name, code, content = 'player', content_rowid = 'rowid', tokenize = 'trigram')")
+
+# External content needs the old values to remove a row's trigrams, and the rowid to find it
+_DELETE_OLD = f"""
+    INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, pid, name, code)
+    VALUES ('delete', old.rowid, old.pid, old.name, old.code);
+"""
+_INSERT_NEW = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, pid, name, code) VALUES (new.rowid, new.pid, new.name, new.code);
+"""
+SEARCH_TRIGGERS = {
+    'player_search_insert': f"AFTER INSERT ON player BEGIN {_INSERT_NEW} END",
+    'player_search_update': f"AFTER UPDATE OF pid, name, code ON player BEGIN {_DELETE_OLD} {_INSERT_NEW} END",
+    'player_search_delete': f"AFTER DELETE ON player BEGIN {_DELETE_OLD} END",
+}
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 phrase matching `query` as a substring of any column, or None if it is too short"""
+    query = query.strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return None
+    return '"' + query.replace('"', '""') + '"'
+
+
+class PlayerSearch:
+    """Maintain the player_search index"""
+
+    @staticmethod
+    def ensure_schema(cursor: sqlite3.Cursor) -> bool:
+        """Create the index and its triggers, building it from player on first use
+
+        Returns False when this SQLite build lacks FTS5 or the trigram
+        tokenizer (3.34+); search then keeps using LIKE.
+        """
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,))
+        row = cursor.fetchone()
+        if row and 'content' not in row[0]:
+            # Earlier layout kept its own copy keyed by PID; replace it together with its triggers
+            logger.info("Replacing player search index with an external-content index")
+            for trigger_name in SEARCH_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_name}")
+            cursor.execute(f"DROP TABLE {SEARCH_TABLE}")
+            row = None
+        created = row is None
+        if created:
+            try:
+                cursor.execute(SEARCH_TABLE_SQL)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Player search index not available, search stays on LIKE: {e}")
+                return False
+        for trigger_name, body in SEARCH_TRIGGERS.items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {trigger_name} {body}")
+        if created:
+            PlayerSearch.rebuild(cursor)
+        return True
+
+    @staticmethod
+    def rebuild(cursor: sqlite3.Cursor):
+        """Rebuild the index from player
+
+        Needed after VACUUM, which may renumber the rowids of player (it has
+        no INTEGER PRIMARY KEY) and so detach the index from its rows.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (SEARCH_TABLE,))
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')")
+        logger.info("Rebuilt player search index")
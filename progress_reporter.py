@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Interval progress reporting for update runs
+Fetch engines only bump counters; a background thread samples them together
+with planner, in-flight and writer gauges and emits one log line (and
+optionally one JSON record) per interval, replacing per-batch INFO logging
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressReporter(threading.Thread):
+    """Aggregate per-batch outcomes and report throughput, backlog, writer lag and ETA"""
+
+    def __init__(self, interval: float = 10.0, jsonl_path: Optional[str] = None):
+        super().__init__(name="ProgressReporter", daemon=True)
+        self.interval = interval  # Seconds between reports
+        self.jsonl_path = jsonl_path  # Append each record as one JSON line when set
+        self.run_id = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        self._phase = None
+        self._phase_total = 0
+        self._phase_started = time.monotonic()
+        self._succeeded = 0  # Counters of the current phase
+        self._failed = 0
+        self._rows_fetched = 0  # Successful PIDs over all phases, compared with the writer's progress
+        self._last_report = (time.monotonic(), 0)  # (time, PIDs done) at the previous report
+
+        self._planner = None
+        self._in_flight = None
+        self._writer = None
+
+    def begin_phase(self, phase: str, total: int, planner=None,
+                    in_flight: Optional[Callable[[], int]] = None, writer=None):
+        """Start counting a fetch pass ('fetch' or 'retry') over `total` PIDs"""
+        if self._phase is not None:
+            self.report()  # Final numbers of the previous pass
+        with self._lock:
+            self._phase = phase
+            self._phase_total = total
+            self._phase_started = time.monotonic()
+            self._succeeded = 0
+            self._failed = 0
+            self._last_report = (self._phase_started, 0)
+            self._planner = planner
+            self._in_flight = in_flight
+            self._writer = writer
+
+    def record_batch(self, success_count: int, fail_count: int):
+        """Count one finished batch; the only call made from the fetch hot path"""
+        with self._lock:
+            self._succeeded += success_count
+            self._failed += fail_count
+            self._rows_fetched += success_count
+
+    def sample(self) -> Dict:
+        """Current counters and gauges as one record"""
+        now = time.monotonic()
+        with self._lock:
+            done = self._succeeded + self._failed
+            last_time, last_done = self._last_report
+            self._last_report = (now, done)
+            record = {
+                'run_id': self.run_id,
+                'phase': self._phase,
+                'elapsed': round(now - self._phase_started, 1),
+                'total': self._phase_total,
+                'done': done,
+                'succeeded': self._succeeded,
+                'failed': self._failed,
+            }
+            rows_fetched = self._rows_fetched
+            planner, in_flight, writer = self._planner, self._in_flight, self._writer
+
+        elapsed = now - self._phase_started
+        average_rate = done / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, record['total'] - done)
+        record.update({
+            'pids_per_second': round((done - last_done) / (now - last_time), 1) if now > last_time else 0.0,
+            'in_flight': in_flight() if in_flight else 0,
+            'queued_pids': planner.pending_pids if planner else 0,
+            'writer_queue': writer.queue_depth if writer else 0,
+            'writer_lag_rows': max(0, rows_fetched - writer.rows_written) if writer else 0,
+            'eta_seconds': round(remaining / average_rate) if average_rate > 0 else None,
+        })
+        return record
+
+    def report(self):
+        """Emit one progress record"""
+        record = self.sample()
+        if record['phase'] is None:
+            return
+        eta = f"{record['eta_seconds']}s" if record['eta_seconds'] is not None else "?"
+        logger.info(f"Progress [{record['phase']}] {record['done']}/{record['total']} PIDs "
+                    f"({record['failed']} failed), {record['pids_per_second']} PIDs/s, "
+                    f"{record['in_flight']} in flight, {record['queued_pids']} queued, "
+                    f"writer lag {record['writer_lag_rows']} rows ({record['writer_queue']} batches), ETA {eta}")
+        self._write_json('progress', record)
+
+    def report_summary(self, stats: Dict):
+        """Write the run's final statistics as a JSON record"""
+        summary = {key: value for key, value in stats.items() if key != 'batch_latencies'}
+        latencies = sorted(stats.get('batch_latencies', []))
+        if latencies:
+            summary['batch_latency_p50'] = round(latencies[len(latencies) // 2], 4)
+            summary['batch_latency_p95'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 4)
+        self._write_json('summary', summary)
+
+    def _write_json(self, event: str, record: Dict):
+        if not self.jsonl_path:
+            return
+        try:
+            with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'event': event, 'time': time.time(), **record}) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write progress record to {self.jsonl_path}: {e}")
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
+
+    def close(self):
+        """Stop the thread after one last report of the current phase"""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+        self.report()
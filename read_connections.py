@@ -0,0 +1,99 @@
+"""
+服务器本地数据库的只读连接池
+连接在请求之间复用（保留SQLite页缓存，并通过mmap共享操作系统缓存），
+以 query_only 打开；数据库文件被整体替换时自动换用新连接
+"""
+
+import os
+import sqlite3
+import threading
+from typing import List
+
+
+class ReadConnection(sqlite3.Connection):
+    """记录自己创建的游标，归还时全部关闭
+
+    未读完的游标会一直持有SHARED锁，挡住更新脚本发布快照，
+    所以连接回到池里之前必须结束所有语句。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.file_id = None  # 打开时数据库文件的 (st_dev, st_ino)
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        cursor = super().cursor(*args, **kwargs)
+        self._cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def reset(self):
+        """关闭本次借用期间的所有游标，释放读锁"""
+        for cursor in self._cursors:
+            cursor.close()
+        self._cursors = []
+
+
+class ReadConnectionPool:
+    """线程安全的只读连接池，后进先出以便复用最热的连接"""
+
+    def __init__(self, db_path: str, max_idle: int = 8, mmap_size: int = 256 * 1024 * 1024,
+                 cache_size_kib: int = 64 * 1024, timeout: float = 5.0):
+        self.db_path = db_path
+        self.max_idle = max_idle  # 池中最多保留的空闲连接数
+        self.mmap_size = mmap_size  # 每个连接的内存映射上限（字节）
+        self.cache_size_kib = cache_size_kib  # 每个连接的页缓存大小（KiB）
+        self.timeout = timeout  # 更新脚本持有写锁时的最长等待秒数
+        self._idle: List[ReadConnection] = []
+        self._lock = threading.Lock()
+
+    def _file_id(self) -> tuple:
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            raise sqlite3.OperationalError(f"unable to open database file {self.db_path}")
+        return stat.st_dev, stat.st_ino
+
+    def _open(self, file_id: tuple) -> ReadConnection:
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, timeout=self.timeout,
+                               factory=ReadConnection, check_same_thread=False)
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute(f"PRAGMA cache_size = -{int(self.cache_size_kib)}")
+        conn.execute("PRAGMA query_only = ON")
+        conn.reset()
+        conn.file_id = file_id
+        return conn
+
+    def acquire(self) -> ReadConnection:
+        """借出一个连接；用完必须 release"""
+        file_id = self._file_id()
+        stale = []
+        conn = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.pop()
+                if candidate.file_id == file_id:
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()  # 数据库文件已被替换（例如重新从S3下载）
+        return conn or self._open(file_id)
+
+    def release(self, conn: ReadConnection):
+        """归还连接；池已满时直接关闭"""
+        conn.reset()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Activity-tiered refresh scheduling for the player stats updater
+Players are sorted into tiers by how recently their versus_plays changed and
+each tier is refreshed at its own interval; a full sweep still runs periodically
+"""
+
+import logging
+import sqlite3
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Days since the last observed play-count change that still count as each tier
+DEFAULT_TIER_WINDOWS = {'active': 7, 'warm': 30}
+
+# Days between refreshes for each tier
+DEFAULT_TIER_INTERVALS = {'active': 1, 'warm': 3, 'dormant': 14}
+
+# Runs happen roughly daily, so a player checked a little under N days ago is already due
+DUE_SLACK_DAYS = 0.5
+
+
+class RefreshScheduler:
+    """Decide which PIDs a tiered run refreshes and keep per-player activity up to date"""
+
+    def __init__(self, db_path: str, full_sweep_days: int = 30,
+                 tier_windows: Dict[str, int] = None, tier_intervals: Dict[str, int] = None):
+        self.db_path = db_path
+        self.full_sweep_days = full_sweep_days  # Every PID is refreshed at least this often
+        self.tier_windows = dict(tier_windows or DEFAULT_TIER_WINDOWS)
+        self.tier_intervals = dict(tier_intervals or DEFAULT_TIER_INTERVALS)
+
+    @staticmethod
+    def ensure_schema(cursor: sqlite3.Cursor):
+        """Create the per-player schedule table"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_refresh_schedule (
+                pid TEXT PRIMARY KEY,
+                tier TEXT NOT NULL DEFAULT 'active',
+                last_checked_at TIMESTAMP,
+                last_changed_at TIMESTAMP,
+                last_plays INTEGER,
+                FOREIGN KEY (pid) REFERENCES player(pid)
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_refresh_schedule_tier ON player_refresh_schedule(tier)")
+
+    def is_full_sweep_due(self) -> bool:
+        """True when no completed full run happened within full_sweep_days"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT julianday('now') - julianday(MAX(started_at))
+                FROM update_runs
+                WHERE mode = 'full' AND status = 'completed'
+            """)
+            age_days = cursor.fetchone()[0]
+        if age_days is None:
+            logger.info("No completed full run on record, full sweep is due")
+            return True
+        if age_days >= self.full_sweep_days - DUE_SLACK_DAYS:
+            logger.info(f"Last full sweep was {age_days:.1f} days ago, full sweep is due")
+            return True
+        return False
+
+    def select_due_pids(self) -> List[str]:
+        """PIDs whose tier interval has elapsed, plus players that were never checked, minus quarantined ones"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT p.pid
+                FROM player p
+                LEFT JOIN player_refresh_schedule s ON s.pid = p.pid
+                WHERE (s.pid IS NULL
+                       OR s.last_checked_at IS NULL
+                       OR julianday('now') - julianday(s.last_checked_at) >=
+                          CASE s.tier WHEN 'active' THEN ? WHEN 'warm' THEN ? ELSE ? END - ?)
+                AND p.pid NOT IN (
+                    SELECT pid FROM update_dead_letters WHERE quarantined_until > CURRENT_TIMESTAMP
+                )
+                ORDER BY p.pid
+            """, (self.tier_intervals['active'], self.tier_intervals['warm'],
+                  self.tier_intervals['dormant'], DUE_SLACK_DAYS))
+            pids = [row[0] for row in cursor.fetchall()]
+
+            cursor.execute("SELECT tier, COUNT(*) FROM player_refresh_schedule GROUP BY tier")
+            tier_counts = dict(cursor.fetchall())
+        logger.info(f"Tiered refresh: {len(pids)} PIDs due (tiers: {tier_counts})")
+        return pids
+
+    def record_refresh(self, cursor: sqlite3.Cursor, run_id: int, staging_table: str, live_table: str):
+        """Update activity and tiers for every PID the run refreshed, in one set-based pass
+
+        Must run inside the publish transaction, before the staging table replaces
+        the live one, so the play-count change is measured against the old snapshot.
+        A player's first schedule row with unchanged plays takes its last change
+        from history: the first row showing the current play count after the
+        last row that showed a different one.
+        """
+        cursor.execute(f"""
+            INSERT INTO player_refresh_schedule (pid, tier, last_checked_at, last_changed_at, last_plays)
+            SELECT st.pid, 'active', st.created_at,
+                   CASE WHEN live.pid IS NULL OR live.versus_plays != st.versus_plays THEN st.created_at
+                        WHEN s.pid IS NULL THEN (
+                            SELECT MIN(h.created_at) FROM player_stats_history h
+                            WHERE h.pid = st.pid AND h.versus_plays = st.versus_plays
+                            AND h.created_at > IFNULL((
+                                SELECT MAX(d.created_at) FROM player_stats_history d
+                                WHERE d.pid = st.pid AND d.versus_plays != st.versus_plays
+                            ), '')
+                        )
+                   END,
+                   st.versus_plays
+            FROM {staging_table} st
+            JOIN update_checkpoints c ON c.run_id = ? AND c.pid = st.pid AND c.status = 'done'
+            LEFT JOIN {live_table} live ON live.pid = st.pid
+            LEFT JOIN player_refresh_schedule s ON s.pid = st.pid
+            WHERE true
+            ON CONFLICT(pid) DO UPDATE SET
+                last_checked_at = excluded.last_checked_at,
+                last_changed_at = COALESCE(excluded.last_changed_at, player_refresh_schedule.last_changed_at),
+                last_plays = excluded.last_plays
+        """, (run_id,))
+        refreshed = cursor.rowcount
+
+        # Re-tier only the rows just checked; the others keep the tier they were last checked with.
+        # No change seen yet (and none in history) is not evidence of dormancy, so such players stay warm
+        cursor.execute("""
+            UPDATE player_refresh_schedule
+            SET tier = CASE
+                WHEN last_changed_at IS NULL THEN 'warm'
+                WHEN julianday(last_checked_at) - julianday(last_changed_at) <= ? THEN 'active'
+                WHEN julianday(last_checked_at) - julianday(last_changed_at) <= ? THEN 'warm'
+                ELSE 'dormant'
+            END
+            WHERE pid IN (SELECT pid FROM update_checkpoints WHERE run_id = ? AND status = 'done')
+        """, (self.tier_windows['active'], self.tier_windows['warm'], run_id))
+        logger.info(f"Refresh schedule updated for {refreshed} players")
@@ -0,0 +1,46 @@
+"""
+API响应的进程内LRU缓存
+键由调用方决定（接口路径 + 规范化的查询参数 + 快照版本），
+快照版本变化后旧条目不再命中，按LRU顺序自然淘汰
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    """线程安全的LRU缓存，保存 (响应体, mimetype)"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries  # 最多缓存的响应数；0 表示关闭缓存
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, mimetype: str):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (body, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -94,6 +94,12 @@ class S3Database:
             return self._download_db_from_s3()
         return True
     
+    def current_path(self) -> Optional[str]:
+        """确保本地数据库最新并返回其路径；下载失败时返回None"""
+        if not self._ensure_local_db():
+            return None
+        return self._get_temp_db_path()
+    
     def get_connection(self) -> Optional[sqlite3.Connection]:
         """获取数据库连接"""
         if not self._ensure_local_db():
@@ -1,10 +1,19 @@
-from flask import Flask, jsonify, send_from_directory, request
+from flask import Flask, jsonify, send_from_directory, request, g
 from flask_cors import CORS
 import os
 import json
+import base64
 import csv
+import functools
+import hashlib
 import sqlite3
+import threading
+from datetime import datetime, timedelta, date
 from database_adapter import DatabaseAdapter
+from read_connections import ReadConnectionPool
+from response_cache import ResponseCache
+from player_search import SEARCH_INDEX_PROBE_SQL, SEARCH_PIDS_SQL, match_expression
+from snapshot_ranks import RANK_COLUMNS
 
 app = Flask(__name__)
 CORS(app)
@@ -12,6 +21,62 @@ CORS(app)
 # 初始化数据库适配器
 db = DatabaseAdapter()
 
+# 本地数据库的只读连接池：连接跨请求复用，页缓存和mmap不会在每次请求后丢失
+read_pool = ReadConnectionPool('mario_filtered.db')
+
+def get_read_db():
+    """当前请求使用的只读连接，请求结束时自动归还连接池"""
+    if 'read_db' not in g:
+        g.read_db = read_pool.acquire()
+    return g.read_db
+
+@app.teardown_appcontext
+def release_read_db(exception):
+    conn = g.pop('read_db', None)
+    if conn is not None:
+        read_pool.release(conn)
+
+# 按快照版本缓存的API响应；RESPONSE_CACHE_SIZE=0 关闭进程内缓存（ETag仍然有效）
+response_cache = ResponseCache(int(os.environ.get('RESPONSE_CACHE_SIZE', 256)))
+RESPONSE_MAX_AGE = int(os.environ.get('RESPONSE_MAX_AGE', 60))  # 浏览器和边缘节点无需重新验证的秒数
+
+def snapshot_version():
+    """当前数据版本：发布快照时新增的汇总行id、最近一次历史保留的时间和UTC日期（历史窗口按天滑动）
+
+    只取决于数据内容：S3重新下载同一份文件、更新脚本写入暂存表都不会让缓存失效。
+    """
+    summary, retention = read_data_state()
+    snapshot = f"s{summary[9]}" if summary else "s0"
+    return f"{snapshot}.r{retention or 0}.{datetime.utcnow().date().isoformat()}"
+
+def cached_response(view):
+    """以 (路径, 规范化查询参数, 快照版本) 为键缓存成功的响应，并返回对应的ETag
+
+    If-None-Match 命中时直接返回304，不执行查询。
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        params = tuple(sorted((key, value.strip()) for key, value in request.args.items(multi=True) if value.strip()))
+        key = (request.path, params, snapshot_version())
+        etag = hashlib.md5(repr(key).encode()).hexdigest()
+        
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            cached = response_cache.get(key)
+            if cached:
+                body, mimetype = cached
+                response = app.response_class(body, mimetype=mimetype)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response  # 错误不缓存
+                response_cache.put(key, response.get_data(), response.mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"public, max-age={RESPONSE_MAX_AGE}, must-revalidate"
+        return response
+    return wrapper
+
 # 在应用启动时加载cron.log中的玩家名字（仅对本地数据库有效）
 if not db.is_s3:
     db.load_player_names_from_cron_log()
@@ -236,9 +301,8 @@ def search_by_code():
             else:
                 return jsonify({'success': False, 'message': f'Player with code "{code}" not found'})
         else:
-            # 本地数据库连接
-            import sqlite3
-            conn = sqlite3.connect('mario_filtered.db')
+            # 本地数据库连接（连接池复用，请求结束时自动归还）
+            conn = get_read_db()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -253,7 +317,6 @@ def search_by_code():
             """, (code,))
             
             row = cursor.fetchone()
-            conn.close()
             
             if row:
                 player_data = {
@@ -296,8 +359,102 @@ def get_player_names():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 窗口开始之前玩家的最后一条历史记录
+HISTORY_ANCHOR_QUERY = """
+    SELECT versus_rating, versus_won, versus_plays, win_rate, created_at
+    FROM player_stats_history
+    WHERE pid = ?
+    AND created_at < datetime('now', '-{} days')
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+
+def history_window_start(days):
+    """与 datetime('now', '-N days') 对应的窗口起始日期（UTC）"""
+    return (datetime.utcnow() - timedelta(days=days)).date()
+
+def _history_days(start_day, latest_history_at):
+    """从窗口起始日到历史表最新日期的逐日列表"""
+    if not latest_history_at:
+        return []
+    end_day = date.fromisoformat(str(latest_history_at)[:10])
+    days = []
+    day = start_day
+    while day <= end_day:
+        days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+def fill_history_gaps(rows, anchor_row, start_day, latest_history_at):
+    """把只记录变化的历史行展开为逐日序列
+
+    rows 按时间升序；没有记录的日期沿用此前最近一条记录的数值，
+    created_at 记为当天零点。已有记录原样保留，因此完整记录的数据不受影响。
+    """
+    rows_by_day = {}
+    for row in rows:
+        rows_by_day.setdefault(str(row[4])[:10], []).append(tuple(row))
+
+    filled = []
+    last_row = tuple(anchor_row) if anchor_row else None
+    for day in _history_days(start_day, latest_history_at):
+        if day in rows_by_day:
+            filled.extend(rows_by_day.pop(day))
+            last_row = filled[-1]
+        elif last_row is not None:
+            filled.append(last_row[:4] + (f"{day} 00:00:00",))
+
+    # 理论上不会出现晚于最新日期的记录，出现时也不丢弃
+    for day_rows in rows_by_day.values():
+        filled.extend(day_rows)
+    return sorted(filled, key=lambda row: str(row[4]))
+
+def fill_trend_gaps(trend_rows, anchor_row, start_day, latest_history_at):
+    """为每日趋势补齐缺失日期：沿用最近的评分和胜率，records_count 为 0"""
+    trends_by_day = {str(row[0]): tuple(row) for row in trend_rows}
+    last_values = (anchor_row[0], anchor_row[3]) if anchor_row else None
+
+    filled = []
+    for day in _history_days(start_day, latest_history_at):
+        if day in trends_by_day:
+            row = trends_by_day.pop(day)
+            filled.append(row)
+            last_values = (row[1], row[2])
+        elif last_values is not None:
+            filled.append((day, last_values[0], last_values[1], 0))
+
+    filled.extend(trends_by_day.values())
+    return sorted(filled, key=lambda row: str(row[0]))
+
+def format_history(rows):
+    """(rating, won, plays, win_rate, created_at) 行转换为接口输出格式"""
+    return [{
+        'versus_rating': row[0],
+        'versus_won': row[1],
+        'versus_plays': row[2],
+        'win_rate': round(row[3], 2) if row[3] else 0,
+        'created_at': row[4]
+    } for row in rows]
+
+def history_stats(formatted_history):
+    """历史序列的最高/最低/平均评分和胜率"""
+    if not formatted_history:
+        return {}
+    ratings = [h['versus_rating'] for h in formatted_history]
+    win_rates = [h['win_rate'] for h in formatted_history]
+    return {
+        'max_rating': max(ratings),
+        'min_rating': min(ratings),
+        'avg_rating': round(sum(ratings) / len(ratings), 2),
+        'max_win_rate': max(win_rates),
+        'min_win_rate': min(win_rates),
+        'avg_win_rate': round(sum(win_rates) / len(win_rates), 2),
+        'total_records': len(formatted_history)
+    }
+
 # 新API：获取玩家历史数据
 @app.route('/api/player-history/<pid>')
+@cached_response
 def get_player_history(pid):
     """获取指定玩家的历史数据"""
     try:
@@ -319,6 +476,12 @@ def get_player_history(pid):
             history_result = db.db.execute_query(history_query, (pid,))
             history_data = history_result if history_result else []
             
+            # 窗口开始前的最后一条记录，用于补齐仅记录变化的历史数据
+            anchor_result = db.db.execute_query(HISTORY_ANCHOR_QUERY.format(days), (pid,))
+            anchor_row = anchor_result[0] if anchor_result else None
+            latest_result = db.db.execute_query("SELECT MAX(created_at) FROM player_stats_history")
+            latest_history_at = latest_result[0][0] if latest_result else None
+            
             # 获取玩家基本信息
             player_query = """
                 SELECT p.name, p.code, p.country, pss.versus_rating, pss.versus_won, pss.versus_plays
@@ -330,9 +493,8 @@ def get_player_history(pid):
             player_info = player_result[0] if player_result else None
             
         else:
-            # 本地数据库连接
-            import sqlite3
-            conn = sqlite3.connect('mario_filtered.db')
+            # 本地数据库连接（连接池复用，请求结束时自动归还）
+            conn = get_read_db()
             cursor = conn.cursor()
             
             # 获取历史数据
@@ -346,6 +508,12 @@ def get_player_history(pid):
             
             history_data = cursor.fetchall()
             
+            # 窗口开始前的最后一条记录，用于补齐仅记录变化的历史数据
+            cursor.execute(HISTORY_ANCHOR_QUERY.format(days), (pid,))
+            anchor_row = cursor.fetchone()
+            cursor.execute("SELECT MAX(created_at) FROM player_stats_history")
+            latest_history_at = cursor.fetchone()[0]
+            
             # 获取玩家基本信息
             cursor.execute("""
                 SELECT p.name, p.code, p.country, pss.versus_rating, pss.versus_won, pss.versus_plays
@@ -355,37 +523,20 @@ def get_player_history(pid):
             """, (pid,))
             
             player_info = cursor.fetchone()
-            conn.close()
         
         if not player_info:
             return jsonify({'error': 'Player not found'}), 404
         
-        # 格式化历史数据
-        formatted_history = []
-        for row in history_data:
-            formatted_history.append({
-                'versus_rating': row[0],
-                'versus_won': row[1],
-                'versus_plays': row[2],
-                'win_rate': round(row[3], 2) if row[3] else 0,
-                'created_at': row[4]
-            })
+        # 补齐没有变化的日期（历史表可能只记录变化），再按时间倒序输出
+        history_data = fill_history_gaps(
+            list(reversed(history_data)), anchor_row,
+            history_window_start(days), latest_history_at
+        )
+        history_data.reverse()
         
-        # 计算统计信息
-        stats = {}
-        if formatted_history:
-            ratings = [h['versus_rating'] for h in formatted_history]
-            win_rates = [h['win_rate'] for h in formatted_history]
-            
-            stats = {
-                'max_rating': max(ratings),
-                'min_rating': min(ratings),
-                'avg_rating': round(sum(ratings) / len(ratings), 2),
-                'max_win_rate': max(win_rates),
-                'min_win_rate': min(win_rates),
-                'avg_win_rate': round(sum(win_rates) / len(win_rates), 2),
-                'total_records': len(formatted_history)
-            }
+        # 格式化历史数据并计算统计信息
+        formatted_history = format_history(history_data)
+        stats = history_stats(formatted_history)
         
         # 计算当前胜率
         current_win_rate = 0
@@ -411,6 +562,111 @@ def get_player_history(pid):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+MAX_BATCH_PIDS = 100  # 批量历史接口一次最多查询的玩家数
+MAX_HISTORY_DAYS = 365  # 历史接口最多返回的天数（补齐空缺的日子也算在内）
+
+# 多个玩家窗口内的历史，以及每人窗口开始前的最后一条记录（用于补齐），一条语句按 (pid, created_at) 索引读取
+BATCH_HISTORY_QUERY = """
+    SELECT pid, versus_rating, versus_won, versus_plays, win_rate, created_at
+    FROM player_stats_history
+    WHERE pid IN ({placeholders}) AND created_at >= ? AND created_at < ?
+    UNION ALL
+    SELECT pid, versus_rating, versus_won, versus_plays, win_rate, created_at
+    FROM player_stats_history
+    WHERE id IN (
+        SELECT (
+            SELECT a.id FROM player_stats_history a
+            WHERE a.pid = p.pid AND a.created_at < ?
+            ORDER BY a.created_at DESC
+            LIMIT 1
+        )
+        FROM player p
+        WHERE p.pid IN ({placeholders})
+    )
+    ORDER BY pid, created_at
+"""
+
+# 新API：一次获取多个玩家的历史数据
+@app.route('/api/player-history/batch')
+@cached_response
+def get_players_history_batch():
+    """批量获取玩家历史：pids 逗号分隔（可重复传参），start/end 为包含端点的日期，缺省时取最近 days 天"""
+    try:
+        pids = []
+        for value in request.args.getlist('pids'):
+            for pid in value.split(','):
+                pid = pid.strip()
+                if pid and pid not in pids:
+                    pids.append(pid)
+        if not pids:
+            return jsonify({'error': 'pids is required'}), 400
+        if len(pids) > MAX_BATCH_PIDS:
+            return jsonify({'error': f'At most {MAX_BATCH_PIDS} pids per request'}), 400
+        
+        try:
+            start = request.args.get('start')
+            end = request.args.get('end')
+            if start:
+                start_day = date.fromisoformat(start)
+            else:
+                days = request.args.get('days', 30, type=int)
+                if days <= 0:
+                    return jsonify({'error': 'days must be a positive integer'}), 400
+                start_day = history_window_start(min(days, MAX_HISTORY_DAYS))
+            end_day = date.fromisoformat(end) if end else None
+        except ValueError:
+            return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+        # 空窗口直接拒绝，避免返回看似正常的空结果
+        if end_day and start_day > end_day:
+            return jsonify({'error': 'start must not be after end'}), 400
+        # 每天都会补齐一行，窗口过长会生成海量数据；未给 end 时窗口延伸到今天
+        if ((end_day or datetime.utcnow().date()) - start_day).days > MAX_HISTORY_DAYS:
+            return jsonify({'error': f'start and end may span at most {MAX_HISTORY_DAYS} days'}), 400
+        end_bound = (end_day + timedelta(days=1)).isoformat() if end_day else '9999-12-31'
+        
+        placeholders = ', '.join('?' * len(pids))
+        query = BATCH_HISTORY_QUERY.format(placeholders=placeholders)
+        params = pids + [start_day.isoformat(), end_bound, start_day.isoformat()] + pids
+        latest_query = "SELECT MAX(created_at) FROM player_stats_history"
+        if db.is_s3:
+            rows = db.db.execute_query(query, tuple(params)) or []
+            latest_result = db.db.execute_query(latest_query)
+            latest_history_at = latest_result[0][0] if latest_result else None
+        else:
+            conn = get_read_db()
+            rows = conn.execute(query, params).fetchall()
+            latest_history_at = conn.execute(latest_query).fetchone()[0]
+        
+        # 补齐只到结束日期为止
+        if end_day and latest_history_at and str(latest_history_at)[:10] > end_day.isoformat():
+            latest_history_at = end_day.isoformat()
+        
+        window_start = start_day.isoformat()
+        series = {pid: ([], None) for pid in pids}
+        for row in rows:
+            history_rows, anchor_row = series[row[0]]
+            if str(row[5]) < window_start:
+                series[row[0]] = (history_rows, row[1:])
+            else:
+                history_rows.append(row[1:])
+        
+        players = {}
+        for pid, (history_rows, anchor_row) in series.items():
+            # 补齐没有变化的日期，与单个玩家接口一样按时间倒序输出
+            history_data = fill_history_gaps(history_rows, anchor_row, start_day, latest_history_at)
+            history_data.reverse()
+            formatted_history = format_history(history_data)
+            players[pid] = {'history': formatted_history, 'stats': history_stats(formatted_history)}
+        
+        return jsonify({
+            'players': players,
+            'start': window_start,
+            'end': end_day.isoformat() if end_day else None
+        })
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 新API：获取玩家近期表现趋势
 @app.route('/api/player-trends/<pid>')
 def get_player_trends(pid):
@@ -438,10 +694,14 @@ def get_player_trends(pid):
             trends_result = db.db.execute_query(trends_query, (pid,))
             trends_data = trends_result if trends_result else []
             
+            anchor_result = db.db.execute_query(HISTORY_ANCHOR_QUERY.format(days), (pid,))
+            anchor_row = anchor_result[0] if anchor_result else None
+            latest_result = db.db.execute_query("SELECT MAX(created_at) FROM player_stats_history")
+            latest_history_at = latest_result[0][0] if latest_result else None
+            
         else:
-            # 本地数据库连接
-            import sqlite3
-            conn = sqlite3.connect('mario_filtered.db')
+            # 本地数据库连接（连接池复用，请求结束时自动归还）
+            conn = get_read_db()
             cursor = conn.cursor()
             
             # 按日期分组获取每日数据
@@ -458,7 +718,14 @@ def get_player_trends(pid):
             """.format(days), (pid,))
             
             trends_data = cursor.fetchall()
-            conn.close()
+            
+            cursor.execute(HISTORY_ANCHOR_QUERY.format(days), (pid,))
+            anchor_row = cursor.fetchone()
+            cursor.execute("SELECT MAX(created_at) FROM player_stats_history")
+            latest_history_at = cursor.fetchone()[0]
+        
+        # 补齐没有历史记录的日期，沿用最近一次的评分和胜率
+        trends_data = fill_trend_gaps(trends_data, anchor_row, history_window_start(days), latest_history_at)
         
         # 格式化趋势数据
         formatted_trends = []
@@ -479,220 +746,182 @@ def get_player_trends(pid):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 排行榜可排序的列；每个表达式都有对应的索引（见 update_player_stats.SNAPSHOT_INDEXES）
+LEADERBOARD_SORT_KEYS = {
+    'versus_rating': 'pss.versus_rating',
+    'versus_won': 'pss.versus_won',
+    'versus_plays': 'pss.versus_plays',
+    'win_rate': 'CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END',
+    'name': "IFNULL(p.name, '')",
+}
+# 结果行中与排序列对应的位置，用于生成下一页游标
+LEADERBOARD_SORT_COLUMNS = {'versus_rating': 2, 'versus_won': 3, 'versus_plays': 4, 'win_rate': 6}
+RANK_FILTER_LIMITS = {'top10': 10, 'top25': 25, 'top50': 50, 'top100': 100}
+
+def encode_page_cursor(sort_value, name, pid, rank):
+    """把本页最后一行的 (排序值, 名字, pid, 排名) 编码成不透明的游标"""
+    return base64.urlsafe_b64encode(json.dumps([sort_value, name, pid, rank]).encode()).decode()
+
+def decode_page_cursor(token):
+    try:
+        sort_value, name, pid, rank = json.loads(base64.urlsafe_b64decode(token.encode()))
+        return sort_value, str(name), str(pid), int(rank)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def keyset_condition(sort_by, descending, cursor):
+    """排在游标之后的行：(排序值, 名字, pid) 依次比较，名字和pid始终升序"""
+    sort_value, name, pid, _ = cursor
+    # 第一项只用于让SQLite在排序索引上做范围扫描
+    name_expr = LEADERBOARD_SORT_KEYS['name']
+    op = '<' if descending else '>'
+    if sort_by == 'name':
+        return (f"{name_expr} {op}= ? AND ({name_expr} {op} ? OR ({name_expr} = ? AND pss.pid > ?))",
+                [name, name, name, pid])
+    sort_expr = LEADERBOARD_SORT_KEYS[sort_by]
+    condition = (f"{sort_expr} {op}= ? AND ({sort_expr} {op} ? OR ({sort_expr} = ? AND "
+                 f"({name_expr} > ? OR ({name_expr} = ? AND pss.pid > ?))))")
+    return condition, [sort_value, sort_value, sort_value, name, name, pid]
+
 # 更新现有的API，适应新的数据库结构
 @app.route('/api/player-stats-snapshot')
+@cached_response
 def get_player_stats_snapshot():
     try:
         # 获取查询参数
-        page = request.args.get('page', 1, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = min(request.args.get('per_page', 50, type=int), 100)
         search = request.args.get('search', '').strip()
         sort_by = request.args.get('sort_by', 'versus_rating')
         sort_order = request.args.get('sort_order', 'desc')
         rank_filter = request.args.get('rank_filter', '')
+        cursor_token = request.args.get('cursor', '').strip()
         
-        # 使用DatabaseAdapter处理数据库连接
+        if sort_by not in LEADERBOARD_SORT_KEYS:
+            sort_by = 'versus_rating'
+        if sort_order.lower() not in ['asc', 'desc']:
+            sort_order = 'desc'
+        descending = sort_order.lower() == 'desc'
+        try:
+            cursor = decode_page_cursor(cursor_token) if cursor_token else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        # S3和本地数据库执行同样的SQL
         if db.is_s3:
-            # S3数据库查询
-            base_query = """
-                SELECT p.name, pss.pid, pss.versus_rating, pss.versus_won, pss.versus_plays, pss.created_at,
-                       CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END as win_rate
-                FROM player p 
-                JOIN player_stats_snapshot pss ON p.pid = pss.pid
-            """
-            
-            # 添加搜索条件
-            where_conditions = []
-            params = []
-            
-            # 获取最新日期的数据
-            latest_date_query = "SELECT MAX(DATE(created_at)) FROM player_stats_snapshot"
-            latest_date_result = db.db.execute_query(latest_date_query)
-            latest_date = latest_date_result[0][0] if latest_date_result and latest_date_result[0] else None
-            
-            if latest_date:
-                where_conditions.append("DATE(pss.created_at) = ?")
-                params.append(latest_date)
-            
-            if search:
-                where_conditions.append("(p.name LIKE ? OR pss.pid LIKE ? OR p.code LIKE ?)")
-                params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
-            
-            if where_conditions:
-                base_query += " WHERE " + " AND ".join(where_conditions)
-            
-            # 添加排序
-            valid_sort_columns = ['versus_rating', 'versus_won', 'versus_plays', 'name', 'win_rate']
-            if sort_by not in valid_sort_columns:
-                sort_by = 'versus_rating'
-            
-            if sort_order.lower() not in ['asc', 'desc']:
-                sort_order = 'desc'
-            
-            order_query = f" ORDER BY {sort_by} {sort_order.upper()}"
-            if sort_by != 'name':
-                order_query += ", p.name ASC"
-            
-            # 执行查询
-            full_query = base_query + order_query
-            all_results = db.db.execute_query(full_query, params)
-            
-            # 应用排名过滤
-            if rank_filter:
-                if rank_filter == 'top10':
-                    filtered_results = all_results[:10]
-                elif rank_filter == 'top25':
-                    filtered_results = all_results[:25]
-                elif rank_filter == 'top50':
-                    filtered_results = all_results[:50]
-                elif rank_filter == 'top100':
-                    filtered_results = all_results[:100]
-                else:
-                    filtered_results = all_results
-                
-                total_count = len(filtered_results)
-                
-                # 应用分页
-                offset = (page - 1) * per_page
-                results = filtered_results[offset:offset + per_page]
-            else:
-                total_count = len(all_results)
-                
-                # 应用分页
-                offset = (page - 1) * per_page
-                results = all_results[offset:offset + per_page]
-                all_results = None
-
+            def run_query(query, params=()):
+                return db.db.execute_query(query, params) or []
         else:
-            # 本地数据库连接
-            import sqlite3
-            conn = sqlite3.connect('mario_filtered.db')
-            cursor = conn.cursor()
-            
-            # 构建基础查询 - 添加胜率计算
-            base_query = """
-                SELECT p.name, pss.pid, pss.versus_rating, pss.versus_won, pss.versus_plays, pss.created_at,
-                       CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END as win_rate
-                FROM player p 
-                JOIN player_stats_snapshot pss ON p.pid = pss.pid
-            """
-            
-            # 添加搜索条件
-            where_conditions = []
-            params = []
-            
-            # 获取最新日期的数据
-            cursor.execute("SELECT MAX(DATE(created_at)) FROM player_stats_snapshot")
-            latest_date = cursor.fetchone()[0]
-            if latest_date:
-                where_conditions.append("DATE(pss.created_at) = ?")
-                params.append(latest_date)
-            
-            if search:
+            def run_query(query, params=()):
+                return get_read_db().execute(query, params).fetchall()
+        
+        # 发布快照时已算好最新日期和总人数，不必每次扫描全表
+        summary = read_leaderboard_summary()
+        # 有汇总行的数据库一定已有 snapshot_date 列
+        has_date_column = bool(summary) or has_snapshot_date_column(run_query)
+        if summary:
+            latest_date = summary[5]
+        else:
+            latest_date = run_query(
+                f"SELECT MAX({snapshot_date_expr(has_date_column)}) FROM player_stats_snapshot")[0][0]
+        
+        base_query = """
+            SELECT p.name, pss.pid, pss.versus_rating, pss.versus_won, pss.versus_plays, pss.created_at,
+                   CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END as win_rate
+            FROM player p 
+            JOIN player_stats_snapshot pss ON p.pid = pss.pid
+        """
+        
+        # 添加搜索条件
+        where_conditions = []
+        params = []
+        if latest_date:
+            # 几乎所有行都是最新日期，"+"让SQLite改用排序列的索引而不是日期索引
+            where_conditions.append(f"+{snapshot_date_expr(has_date_column, 'pss.')} = ?")
+            params.append(latest_date)
+        if search:
+            # 有三元组全文索引时走索引，否则（或搜索词太短）退回LIKE全表扫描
+            match = match_expression(search)
+            if match:
+                try:
+                    match = match if run_query(SEARCH_INDEX_PROBE_SQL) else None
+                except sqlite3.OperationalError:
+                    match = None  # 没有索引，或本机SQLite不支持trigram分词器
+            if match:
+                where_conditions.append(f"pss.pid IN ({SEARCH_PIDS_SQL})")
+                params.append(match)
+            else:
                 where_conditions.append("(p.name LIKE ? OR pss.pid LIKE ? OR p.code LIKE ?)")
                 params.extend([f'%{search}%', f'%{search}%', f'%{search}%'])
-            
-            if where_conditions:
-                base_query += " WHERE " + " AND ".join(where_conditions)
-            
-            # 添加排序 - 增加胜率排序支持
-            valid_sort_columns = ['versus_rating', 'versus_won', 'versus_plays', 'name', 'win_rate']
-            if sort_by not in valid_sort_columns:
-                sort_by = 'versus_rating'
-            
-            if sort_order.lower() not in ['asc', 'desc']:
-                sort_order = 'desc'
-            
-            order_query = f" ORDER BY {sort_by} {sort_order.upper()}"
-            if sort_by != 'name':
-                order_query += ", p.name ASC"
-            
-            # 如果有排名过滤，需要先获取完整排序结果
-            if rank_filter:
-                # 获取完整排序的数据用于排名过滤
-                full_query = base_query + order_query
-                cursor.execute(full_query, params)
-                all_results = cursor.fetchall()
-                
-                # 应用排名过滤
-                if rank_filter == 'top10':
-                    filtered_results = all_results[:10]
-                elif rank_filter == 'top25':
-                    filtered_results = all_results[:25]
-                elif rank_filter == 'top50':
-                    filtered_results = all_results[:50]
-                elif rank_filter == 'top100':
-                    filtered_results = all_results[:100]
-                else:
-                    filtered_results = all_results
-                
-                total_count = len(filtered_results)
-                
-                # 应用分页到过滤后的结果
-                offset = (page - 1) * per_page
-                results = filtered_results[offset:offset + per_page]
-            else:
-                # 获取总数
-                count_query = f"SELECT COUNT(*) FROM ({base_query}) as subquery"
-                cursor.execute(count_query, params)
-                total_count = cursor.fetchone()[0]
-                
-                # 添加分页
-                offset = (page - 1) * per_page
-                paginated_query = base_query + order_query + " LIMIT ? OFFSET ?"
-                params.extend([per_page, offset])
-                
-                # 执行查询
-                cursor.execute(paginated_query, params)
-                results = cursor.fetchall()
-                all_results = None
-            
-            conn.close()
         
-        # 格式化数据
-        players_data = []
+        # 总数：无搜索时直接用汇总表里的人数
+        if summary and not search:
+            total_count = summary[0]
+        else:
+            count_query = base_query + (" WHERE " + " AND ".join(where_conditions) if where_conditions else "")
+            total_count = run_query(f"SELECT COUNT(*) FROM ({count_query}) as subquery", params)[0][0]
+        rank_limit = RANK_FILTER_LIMITS.get(rank_filter)
+        if rank_limit:
+            total_count = min(total_count, rank_limit)
         
-        if rank_filter and all_results:
-            # 对于排名过滤，排名就是在过滤结果中的位置
-            for i, row in enumerate(results):
-                name, pid, rating, won, plays, created_at, win_rate = row
-                # 计算在完整排序中的实际排名
-                actual_rank = i + 1
-                for j, full_row in enumerate(all_results):
-                    if full_row[1] == pid:  # 比较pid
-                        actual_rank = j + 1
-                        break
-                        
-                players_data.append({
-                    'name': name,
-                    'pid': pid,
-                    'versus_rating': rating,
-                    'versus_won': won,
-                    'versus_plays': plays,
-                    'win_rate': round(win_rate, 2),
-                    'created_at': created_at,  # 使用 created_at 替代 stat_date
-                    'rank': actual_rank
-                })
+        offset = cursor[3] if cursor else (page - 1) * per_page
+        page = offset // per_page + 1
+        
+        # 排名过滤只保留前N名
+        page_size = per_page if not rank_limit else max(0, min(per_page, rank_limit - offset))
+        
+        # 发布快照时已按降序算好名次：无搜索的降序排行直接按名次列做范围读取
+        rank_column = RANK_COLUMNS.get(sort_by, (None,))[0] if summary and descending and not search else None
+        direction = 'DESC' if descending else 'ASC'
+        if rank_column:
+            where_conditions = [f"pss.{rank_column} > ?"]
+            params = [offset]
+            order_query = f" ORDER BY pss.{rank_column}"
         else:
-            # 常规分页，计算页面排名
-            base_rank = (page - 1) * per_page + 1
-            for i, row in enumerate(results):
-                name, pid, rating, won, plays, created_at, win_rate = row
-                actual_rank = base_rank + i
-                    
-                players_data.append({
-                    'name': name,
-                    'pid': pid,
-                    'versus_rating': rating,
-                    'versus_won': won,
-                    'versus_plays': plays,
-                    'win_rate': round(win_rate, 2),
-                    'created_at': created_at,  # 使用 created_at 替代 stat_date
-                    'rank': actual_rank
-                })
+            # 游标分页：从上一页最后一行之后继续，每页代价恒定；否则按页码用OFFSET
+            if cursor:
+                condition, condition_params = keyset_condition(sort_by, descending, cursor)
+                where_conditions.append(condition)
+                params.extend(condition_params)
+            if sort_by == 'name':
+                order_query = f" ORDER BY {LEADERBOARD_SORT_KEYS['name']} {direction}, pss.pid ASC"
+            else:
+                order_query = (f" ORDER BY {LEADERBOARD_SORT_KEYS[sort_by]} {direction}, "
+                               f"{LEADERBOARD_SORT_KEYS['name']} ASC, pss.pid ASC")
+        
+        if where_conditions:
+            base_query += " WHERE " + " AND ".join(where_conditions)
+        
+        results = []
+        if page_size:
+            if cursor or rank_column:
+                results = run_query(base_query + order_query + " LIMIT ?", params + [page_size])
+            else:
+                results = run_query(base_query + order_query + " LIMIT ? OFFSET ?", params + [page_size, offset])
+        
+        # 格式化数据，排名即在完整排序中的位置
+        players_data = []
+        for i, row in enumerate(results):
+            name, pid, rating, won, plays, created_at, win_rate = row
+            players_data.append({
+                'name': name,
+                'pid': pid,
+                'versus_rating': rating,
+                'versus_won': won,
+                'versus_plays': plays,
+                'win_rate': round(win_rate, 2),
+                'created_at': created_at,  # 使用 created_at 替代 stat_date
+                'rank': offset + i + 1
+            })
         
         # 计算分页信息
         total_pages = (total_count + per_page - 1) // per_page
+        last_rank = offset + len(results)
+        next_cursor = None
+        if results and last_rank < total_count:
+            last = results[-1]
+            sort_value = (last[0] or '') if sort_by == 'name' else last[LEADERBOARD_SORT_COLUMNS[sort_by]]
+            next_cursor = encode_page_cursor(sort_value, last[0] or '', last[1], last_rank)
         
         return jsonify({
             'players': players_data,
@@ -701,8 +930,9 @@ def get_player_stats_snapshot():
                 'per_page': per_page,
                 'total_count': total_count,
                 'total_pages': total_pages,
-                'has_next': page < total_pages,
-                'has_prev': page > 1
+                'has_next': last_rank < total_count,
+                'has_prev': offset > 0,
+                'next_cursor': next_cursor
             },
             'filters': {
                 'sort_by': sort_by,
@@ -715,20 +945,102 @@ def get_player_stats_snapshot():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def has_snapshot_date_column(run_query):
+    """快照表是否已有 snapshot_date 列；新版更新脚本运行之前的数据库（例如S3上的旧文件）没有"""
+    return bool(run_query(
+        "SELECT 1 FROM pragma_table_xinfo('player_stats_snapshot') WHERE name = 'snapshot_date'"))
+
+def snapshot_date_expr(has_date_column, prefix=''):
+    """快照日期的列表达式；没有 snapshot_date 列时退回 DATE(created_at)"""
+    return f"{prefix}snapshot_date" if has_date_column else f"DATE({prefix}created_at)"
+
+# 更新脚本发布快照时预先计算好的排行榜汇总，取最新一行
+LEADERBOARD_SUMMARY_QUERY = """
+    SELECT total_players, avg_rating, avg_win_rate, total_wins, total_plays, latest_date,
+           rating_histogram, win_rate_histogram, country_counts, id
+    FROM leaderboard_summary
+    ORDER BY id DESC
+    LIMIT 1
+"""
+
+# HistoryRetention 每次整理历史都会推进水位；发布之外只有它会改动历史数据
+RETENTION_STATE_QUERY = "SELECT MAX(updated_at) FROM history_retention_state"
+
+# 汇总行和历史保留水位缓存在内存里，数据库文件变化后才重新查询
+_summary_cache = {'file_state': None, 'summary': None, 'retention': None}
+_summary_lock = threading.Lock()
+
+def database_file_state():
+    """数据库文件及其WAL文件的 (inode, 修改时间, 大小)；更新脚本每次提交或S3重新下载后都会变化"""
+    path = db.db.current_path() if db.is_s3 else read_pool.db_path
+    state = []
+    for suffix in ('', '-wal'):
+        try:
+            stat = os.stat(f"{path}{suffix}")
+            state.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        except (OSError, TypeError):
+            state.append(None)
+    return tuple(state)
+
+def read_data_state():
+    """(汇总行, 历史保留水位)，数据库文件不变时直接用缓存；表不存在或为空时对应项为None"""
+    file_state = database_file_state()
+    with _summary_lock:
+        if _summary_cache['file_state'] == file_state:
+            return _summary_cache['summary'], _summary_cache['retention']
+    summary = query_first_row(LEADERBOARD_SUMMARY_QUERY)
+    retention = query_first_row(RETENTION_STATE_QUERY)
+    retention = retention[0] if retention else None
+    with _summary_lock:
+        _summary_cache.update(file_state=file_state, summary=summary, retention=retention)
+    return summary, retention
+
+def read_leaderboard_summary():
+    """读取预计算的汇总行；表不存在或为空时返回None"""
+    return read_data_state()[0]
+
+def query_first_row(query):
+    if db.is_s3:
+        result = db.db.execute_query(query)
+        return result[0] if result else None
+    try:
+        return get_read_db().execute(query).fetchone()
+    except sqlite3.OperationalError:
+        return None
+
 # 更新排名统计信息API
 @app.route('/api/ranking-stats')
+@cached_response
 def get_ranking_stats():
     try:
+        summary = read_leaderboard_summary()
+        if summary:
+            (total_players, avg_rating, avg_win_rate, total_wins, total_plays, latest_date,
+             rating_histogram, win_rate_histogram, country_counts) = summary[:9]
+            return jsonify({
+                'total_players': total_players,
+                'avg_rating': round(avg_rating, 2) if avg_rating else 0,
+                'avg_win_rate': round(avg_win_rate, 2) if avg_win_rate else 0,
+                'total_wins': total_wins,
+                'total_plays': total_plays,
+                'latest_date': latest_date,
+                'rating_histogram': json.loads(rating_histogram or '[]'),
+                'win_rate_histogram': json.loads(win_rate_histogram or '[]'),
+                'country_counts': json.loads(country_counts or '{}')
+            })
+        
+        # 还没有汇总行（旧数据库），退回到实时聚合
         # 使用DatabaseAdapter处理数据库连接
         if db.is_s3:
             # S3数据库查询
+            has_date_column = has_snapshot_date_column(lambda query: db.db.execute_query(query))
             # 获取最新日期
-            latest_date_query = "SELECT MAX(DATE(created_at)) FROM player_stats_snapshot"
+            latest_date_query = f"SELECT MAX({snapshot_date_expr(has_date_column)}) FROM player_stats_snapshot"
             latest_date_result = db.db.execute_query(latest_date_query)
             latest_date = latest_date_result[0][0] if latest_date_result and latest_date_result[0] else None
             
             # 获取总玩家数
-            stats_query = """
+            stats_query = f"""
                 SELECT COUNT(*) as total_players,
                        AVG(pss.versus_rating) as avg_rating,
                        AVG(CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END) as avg_win_rate,
@@ -736,23 +1048,23 @@ def get_ranking_stats():
                        SUM(pss.versus_plays) as total_plays
                 FROM player p 
                 JOIN player_stats_snapshot pss ON p.pid = pss.pid
-                WHERE DATE(pss.created_at) = ?
+                WHERE {snapshot_date_expr(has_date_column, 'pss.')} = ?
             """
             stats_result = db.db.execute_query(stats_query, (latest_date,))
             stats = stats_result[0] if stats_result else (0, 0, 0, 0, 0)
             total_players, avg_rating, avg_win_rate, total_wins, total_plays = stats
         else:
-            # 本地数据库连接
-            import sqlite3
-            conn = sqlite3.connect('mario_filtered.db')
+            # 本地数据库连接（连接池复用，请求结束时自动归还）
+            conn = get_read_db()
             cursor = conn.cursor()
+            has_date_column = has_snapshot_date_column(lambda query: conn.execute(query).fetchall())
             
             # 获取最新日期
-            cursor.execute("SELECT MAX(DATE(created_at)) FROM player_stats_snapshot")
+            cursor.execute(f"SELECT MAX({snapshot_date_expr(has_date_column)}) FROM player_stats_snapshot")
             latest_date = cursor.fetchone()[0]
             
             # 获取总玩家数
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT COUNT(*) as total_players,
                        AVG(pss.versus_rating) as avg_rating,
                        AVG(CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END) as avg_win_rate,
@@ -760,12 +1072,11 @@ def get_ranking_stats():
                        SUM(pss.versus_plays) as total_plays
                 FROM player p 
                 JOIN player_stats_snapshot pss ON p.pid = pss.pid
-                WHERE DATE(pss.created_at) = ?
+                WHERE {snapshot_date_expr(has_date_column, 'pss.')} = ?
             """, (latest_date,))
             
             stats = cursor.fetchone()
             total_players, avg_rating, avg_win_rate, total_wins, total_plays = stats
-            conn.close()
 
         # 格式化响应数据
         return jsonify({
@@ -780,6 +1091,79 @@ def get_ranking_stats():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 玩家每日统计变化（由更新脚本在发布快照时写入player_stats_delta）
+@app.route('/api/player-delta/<pid>')
+def get_player_delta(pid):
+    """获取指定玩家按天的统计变化"""
+    try:
+        limit = min(request.args.get('limit', 30, type=int), 365)
+
+        if db.is_s3:
+            deltas = db.get_player_stats_delta(pid, limit)
+        else:
+            # 本地数据库连接
+            try:
+                rows = get_read_db().execute("""
+                    SELECT pid, stat_date, delta_rating, delta_won, delta_plays
+                    FROM player_stats_delta
+                    WHERE pid = ?
+                    ORDER BY stat_date DESC
+                    LIMIT ?
+                """, (pid, limit)).fetchall()
+            except sqlite3.OperationalError:
+                rows = []  # 更新脚本尚未创建该表
+            deltas = [{
+                'pid': row[0], 'stat_date': row[1], 'delta_rating': row[2],
+                'delta_won': row[3], 'delta_plays': row[4]
+            } for row in rows]
+
+        return jsonify({'pid': pid, 'deltas': deltas})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# 某天分数变化最大的玩家，走(stat_date, delta_rating)索引
+RATING_MOVERS_QUERY = """
+    SELECT d.pid, p.name, p.code, p.country, d.delta_rating, d.delta_won, d.delta_plays
+    FROM player_stats_delta d
+    LEFT JOIN player p ON p.pid = d.pid
+    WHERE d.stat_date = ?
+    ORDER BY d.delta_rating {order}
+    LIMIT ?
+"""
+
+@app.route('/api/rating-movers')
+def get_rating_movers():
+    """获取某天分数上升（direction=up）或下降（direction=down）最多的玩家"""
+    try:
+        stat_date = request.args.get('date', '').strip()
+        direction = request.args.get('direction', 'up')
+        limit = min(request.args.get('limit', 20, type=int), 100)
+        order = 'ASC' if direction == 'down' else 'DESC'
+        query = RATING_MOVERS_QUERY.format(order=order)
+
+        if db.is_s3:
+            if not stat_date:
+                date_result = db.db.execute_query("SELECT MAX(stat_date) FROM player_stats_delta")
+                stat_date = date_result[0][0] if date_result and date_result[0] else None
+            rows = db.db.execute_query(query, (stat_date, limit)) or []
+        else:
+            # 本地数据库连接
+            conn = get_read_db()
+            try:
+                if not stat_date:
+                    stat_date = conn.execute("SELECT MAX(stat_date) FROM player_stats_delta").fetchone()[0]
+                rows = conn.execute(query, (stat_date, limit)).fetchall()
+            except sqlite3.OperationalError:
+                rows = []  # 更新脚本尚未创建该表
+
+        movers = [{
+            'pid': row[0], 'name': row[1], 'code': row[2], 'country': row[3],
+            'delta_rating': row[4], 'delta_won': row[5], 'delta_plays': row[6]
+        } for row in rows]
+        return jsonify({'date': stat_date or None, 'direction': 'down' if order == 'ASC' else 'up', 'movers': movers})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 保持向后兼容的CSV数据读取（如果数据库中没有数据）
 def read_csv_data(player_id):
     """读取CSV文件数据作为后备方案"""
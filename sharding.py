@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Hash partitioning of the PID space for sharded updater runs
+Each shard process fetches its partition into its own SQLite file (a minimal
+copy of the updater schema) so shards can run in separate processes or on
+separate machines; PlayerStatsUpdater.merge_shards loads the finished files
+back into the main database
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import zlib
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+SHARD_FILE_PATTERN = re.compile(r'^shard_(\d+)_of_(\d+)\.db$')
+
+
+def shard_of(pid: str, shard_count: int) -> int:
+    """Stable shard index for a PID; crc32 is identical on every machine and Python version"""
+    return zlib.crc32(pid.encode()) % shard_count
+
+
+def parse_shard_spec(spec: str) -> tuple:
+    """Parse 'INDEX/COUNT' (0-based index) into (index, count)"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}', expected INDEX/COUNT such as 0/4")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}', index must be between 0 and {count - 1}")
+    return index, count
+
+
+def shard_path(shard_dir: str, shard_index: int, shard_count: int) -> str:
+    return os.path.join(shard_dir, f"shard_{shard_index}_of_{shard_count}.db")
+
+
+def find_shard_files(shard_dir: str) -> List[str]:
+    """Shard files in a directory, in index order"""
+    matches = []
+    for name in os.listdir(shard_dir):
+        match = SHARD_FILE_PATTERN.match(name)
+        if match:
+            matches.append((int(match.group(2)), int(match.group(1)), os.path.join(shard_dir, name)))
+    return [path for _, _, path in sorted(matches)]
+
+
+def create_shard_database(source_db: str, path: str, shard_index: int, shard_count: int,
+                          snapshot_table_sql: str) -> int:
+    """Create a fresh shard file holding the partition's PIDs; returns how many it got
+
+    The file gets its own player table (PIDs only, so fetched profiles stand out
+    at merge time) and an empty live snapshot; the updater adds the rest of its
+    schema when it opens the file.
+    """
+    with sqlite3.connect(f"file:{source_db}?mode=ro", uri=True) as source:
+        quarantine_filter = ""
+        if source.execute("SELECT 1 FROM sqlite_master WHERE name = 'update_dead_letters'").fetchone():
+            # Quarantine lives in the main database; shard files never see those PIDs
+            quarantine_filter = ("WHERE pid NOT IN (SELECT pid FROM update_dead_letters "
+                                 "WHERE quarantined_until > CURRENT_TIMESTAMP)")
+        pids = [row[0] for row in source.execute(f"SELECT pid FROM player {quarantine_filter} ORDER BY pid")]
+    shard_pids = [pid for pid in pids if shard_of(pid, shard_count) == shard_index]
+
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with sqlite3.connect(path) as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+        cursor.execute(snapshot_table_sql.format(table='player_stats_snapshot'))
+        cursor.execute("""
+            CREATE TABLE shard_info (
+                shard_index INTEGER NOT NULL,
+                shard_count INTEGER NOT NULL,
+                source_pids INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        cursor.execute("INSERT INTO shard_info (shard_index, shard_count, source_pids) VALUES (?, ?, ?)",
+                       (shard_index, shard_count, len(pids)))
+        cursor.executemany("INSERT INTO player (pid) VALUES (?)", [(pid,) for pid in shard_pids])
+        conn.commit()
+
+    logger.info(f"Created shard {shard_index}/{shard_count} at {path} with {len(shard_pids)} of {len(pids)} PIDs")
+    return len(shard_pids)
+
+
+def read_shard_info(path: str) -> Optional[dict]:
+    """Shard identity and the status of its latest run; None if the file is not a shard"""
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT shard_index, shard_count, source_pids FROM shard_info")
+            shard_index, shard_count, source_pids = cursor.fetchone()
+            cursor.execute("SELECT id, status FROM update_runs ORDER BY id DESC LIMIT 1")
+            run = cursor.fetchone()
+        except (sqlite3.Error, TypeError):
+            return None
+    return {
+        'path': path,
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'source_pids': source_pids,
+        'run_id': run[0] if run else None,
+        'status': run[1] if run else None,
+    }
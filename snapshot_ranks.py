@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Leaderboard ranks materialized once per published snapshot
+Window functions number the latest day's players by rating, wins, plays and
+win rate, with the same tie-breaking as /api/player-stats-snapshot (name,
+then pid). The ranks are stored in indexed snapshot columns, so top-N filters
+and rank display become range reads on those indexes
+"""
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# Sort key of the leaderboard -> (rank column, expression ranked in descending order)
+RANK_COLUMNS = {
+    'versus_rating': ('rating_rank', 'pss.versus_rating'),
+    'versus_won': ('won_rank', 'pss.versus_won'),
+    'versus_plays': ('plays_rank', 'pss.versus_plays'),
+    'win_rate': ('win_rate_rank',
+                 'CASE WHEN pss.versus_plays > 0 THEN (pss.versus_won * 100.0 / pss.versus_plays) ELSE 0 END'),
+}
+
+
+class SnapshotRanks:
+    """Maintain the rank columns of a snapshot table"""
+
+    @staticmethod
+    def ensure_schema(cursor: sqlite3.Cursor, snapshot_table: str = 'player_stats_snapshot') -> bool:
+        """Add missing rank columns to an existing snapshot; returns True if any were added"""
+        cursor.execute(f"PRAGMA table_info({snapshot_table})")
+        existing = {column[1] for column in cursor.fetchall()}
+        added = False
+        for column, _ in RANK_COLUMNS.values():
+            if column not in existing:
+                logger.info(f"Adding '{column}' column to {snapshot_table} table")
+                cursor.execute(f"ALTER TABLE {snapshot_table} ADD COLUMN {column} INTEGER")
+                added = True
+        return added
+
+    @staticmethod
+    def compute(cursor: sqlite3.Cursor, snapshot_table: str) -> int:
+        """Rank the snapshot's latest-day players; everyone else gets NULL ranks
+
+        Meant for the staging table inside the publish transaction, before its
+        secondary indexes exist, so the full-table UPDATE does not maintain them.
+        """
+        cursor.execute(f"SELECT MAX(snapshot_date) FROM {snapshot_table}")
+        latest_date = cursor.fetchone()[0]
+
+        columns = [column for column, _ in RANK_COLUMNS.values()]
+        windows = ",\n".join(
+            f"ROW_NUMBER() OVER (ORDER BY {expression} DESC, IFNULL(p.name, '') ASC, pss.pid ASC)"
+            for _, expression in RANK_COLUMNS.values()
+        )
+        cursor.execute("DROP TABLE IF EXISTS temp.snapshot_ranks")
+        cursor.execute(f"CREATE TEMP TABLE snapshot_ranks (id INTEGER PRIMARY KEY, {', '.join(columns)})")
+        # Same population as the leaderboard: latest day's rows with a player profile
+        cursor.execute(f"""
+            INSERT INTO temp.snapshot_ranks (id, {', '.join(columns)})
+            SELECT pss.id, {windows}
+            FROM player p
+            JOIN {snapshot_table} pss ON p.pid = pss.pid
+            WHERE pss.snapshot_date = ?
+        """, (latest_date,))
+        ranked = cursor.rowcount
+
+        cursor.execute(f"""
+            UPDATE {snapshot_table} SET ({', '.join(columns)}) = (
+                SELECT {', '.join(columns)} FROM temp.snapshot_ranks r WHERE r.id = {snapshot_table}.id
+            )
+        """)
+        cursor.execute("DROP TABLE temp.snapshot_ranks")
+        logger.info(f"Ranked {ranked} players of the {latest_date} snapshot")
+        return ranked
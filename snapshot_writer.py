@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Single-writer stage for player_stats_snapshot inserts
+Fetch workers hand parsed players to a bounded queue; one long-lived SQLite
+connection drains it and writes them in large executemany transactions.
+When a run id is given, the run's PID checkpoints are updated in the same
+transaction as the snapshot rows they describe. Profile changes can be
+staged the same way and applied to player when the snapshot is published
+"""
+
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # Queue sentinel telling the writer to flush and exit
+
+# Row layouts produced by PlayerStatsUpdater.process_api_response
+PROFILE_STAGE_INSERT_SQL = """
+    INSERT OR REPLACE INTO temp.incoming_profiles (code, country, name, pid)
+    VALUES (?, ?, ?, ?)
+"""
+SNAPSHOT_INSERT_SQL = """
+    INSERT OR REPLACE INTO {table}
+    (pid, versus_rating, versus_won, versus_plays, created_at, fetched_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# Profile changes fetched by an update run, applied to player in the publish transaction
+PROFILE_STAGING_TABLE = 'player_profile_staging'
+PROFILE_STAGING_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {PROFILE_STAGING_TABLE} (
+        pid TEXT PRIMARY KEY,
+        code TEXT,
+        country TEXT,
+        name TEXT
+    )
+"""
+
+# Incoming rows whose non-empty values differ from the stored profile
+_CHANGED_PROFILES = """
+    FROM {source} i
+    JOIN player p ON p.pid = i.pid
+    WHERE (i.code IS NOT NULL AND i.code IS NOT p.code)
+    OR (i.country IS NOT NULL AND i.country IS NOT p.country)
+    OR (i.name IS NOT NULL AND i.name IS NOT p.name)
+"""
+# Only players whose stored profile differs from a non-empty incoming value are rewritten
+PROFILE_CHANGES_UPDATE_SQL = """
+    UPDATE player
+    SET code = COALESCE((SELECT i.code FROM {source} i WHERE i.pid = player.pid), code),
+        country = COALESCE((SELECT i.country FROM {source} i WHERE i.pid = player.pid), country),
+        name = COALESCE((SELECT i.name FROM {source} i WHERE i.pid = player.pid), name)
+    WHERE pid IN (SELECT i.pid """ + _CHANGED_PROFILES + """)
+"""
+# A later non-empty value for the same player replaces the staged one
+PROFILE_CHANGES_STAGE_SQL = f"""
+    INSERT INTO {PROFILE_STAGING_TABLE} (pid, code, country, name)
+    SELECT i.pid, i.code, i.country, i.name """ + _CHANGED_PROFILES.format(source='temp.incoming_profiles') + """
+    ON CONFLICT(pid) DO UPDATE SET
+        code = COALESCE(excluded.code, code),
+        country = COALESCE(excluded.country, country),
+        name = COALESCE(excluded.name, name)
+"""
+
+
+def _load_incoming_profiles(cursor: sqlite3.Cursor, profile_rows: List[tuple]):
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS incoming_profiles (
+            pid TEXT PRIMARY KEY,
+            code TEXT,
+            country TEXT,
+            name TEXT
+        )
+    """)
+    cursor.executemany(PROFILE_STAGE_INSERT_SQL, profile_rows)
+
+
+def apply_profile_changes(cursor: sqlite3.Cursor, profile_rows: List[tuple]) -> int:
+    """Stage (code, country, name, pid) rows in a temp table and update only the changed players
+
+    Runs in the caller's transaction; returns how many player rows were modified.
+    """
+    if not profile_rows:
+        return 0
+    _load_incoming_profiles(cursor, profile_rows)
+    cursor.execute(PROFILE_CHANGES_UPDATE_SQL.format(source='temp.incoming_profiles'))
+    changed = cursor.rowcount
+    cursor.execute("DELETE FROM temp.incoming_profiles")
+    return changed
+
+
+def stage_profile_changes(cursor: sqlite3.Cursor, profile_rows: List[tuple]) -> int:
+    """Like apply_profile_changes, but keep the changes in the profile staging table
+
+    player itself is untouched until apply_staged_profiles runs at publish time,
+    so an abandoned or failed run changes no live profile. Returns how many
+    staged rows were written.
+    """
+    if not profile_rows:
+        return 0
+    _load_incoming_profiles(cursor, profile_rows)
+    cursor.execute(PROFILE_CHANGES_STAGE_SQL)
+    staged = cursor.rowcount
+    cursor.execute("DELETE FROM temp.incoming_profiles")
+    return staged
+
+
+def apply_staged_profiles(cursor: sqlite3.Cursor) -> int:
+    """Apply and clear the staged profile changes in the caller's transaction; returns players modified"""
+    cursor.execute(PROFILE_CHANGES_UPDATE_SQL.format(source=PROFILE_STAGING_TABLE))
+    changed = cursor.rowcount
+    cursor.execute(f"DELETE FROM {PROFILE_STAGING_TABLE}")
+    return changed
+
+
+class SnapshotWriter(threading.Thread):
+    """Background thread that owns the only write connection during an update run"""
+
+    def __init__(self, db_path: str, commit_size: int = 2000, queue_size: int = 100,
+                 flush_interval: float = 2.0, run_id: Optional[int] = None,
+                 snapshot_table: str = 'player_stats_snapshot', stage_profiles: bool = False):
+        super().__init__(name="SnapshotWriter", daemon=True)
+        self.db_path = db_path
+        self.run_id = run_id  # update_runs.id whose checkpoints are maintained, if any
+        self.snapshot_table = snapshot_table  # Live table or the run's staging table
+        self.stage_profiles = stage_profiles  # Hold profile changes back for the publish instead of applying them
+        self.commit_size = commit_size  # Players per transaction
+        self.flush_interval = flush_interval  # Max seconds a partial transaction may wait
+        self.queue = queue.Queue(maxsize=queue_size)  # Bounded so fetchers slow down if writes lag
+
+        self.rows_written = 0
+        self.profiles_changed = 0  # Player rows whose code, country or name actually changed (or will on publish)
+        self.commits = 0
+        self.write_seconds = 0.0
+        self.error = None  # First exception raised by the writer thread
+
+    def submit(self, snapshot_rows: List[tuple], profile_rows: List[tuple]):
+        """Queue parsed rows for writing; blocks while the queue is full"""
+        if self.error:
+            raise RuntimeError(f"Snapshot writer failed: {self.error}")
+        if snapshot_rows:
+            self.queue.put(('players', (snapshot_rows, profile_rows)))
+
+    def submit_failures(self, pids: List[str], reason: str = 'request_failed'):
+        """Queue PIDs whose fetch failed so their checkpoints record the attempt and reason"""
+        if self.error:
+            raise RuntimeError(f"Snapshot writer failed: {self.error}")
+        if pids and self.run_id is not None:
+            self.queue.put(('failed', [(reason, self.run_id, pid) for pid in pids]))
+
+    def close(self):
+        """Flush everything still queued and wait for the writer to finish"""
+        self.queue.put(_STOP)
+        self.join()
+        if self.error:
+            raise RuntimeError(f"Snapshot writer failed: {self.error}")
+        logger.info(f"Snapshot writer finished: {self.rows_written} rows in {self.commits} commits, "
+                    f"{self.profiles_changed} player profiles changed ({self.write_seconds:.2f}s spent writing)")
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path)
+        pending = []
+        pending_profiles = []
+        failures = []
+        last_flush = time.monotonic()
+        stopped = False
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    stopped = True
+                    break
+                if item:
+                    kind, payload = item
+                    if kind == 'players':
+                        pending.extend(payload[0])
+                        pending_profiles.extend(payload[1])
+                    else:
+                        failures.extend(payload)
+
+                if len(pending) >= self.commit_size or (
+                        (pending or failures) and time.monotonic() - last_flush >= self.flush_interval):
+                    self._write(conn, pending, pending_profiles, failures)
+                    pending = []
+                    pending_profiles = []
+                    failures = []
+                    last_flush = time.monotonic()
+
+            if pending or failures:
+                self._write(conn, pending, pending_profiles, failures)
+        except Exception as e:
+            logger.error(f"Error in snapshot writer: {e}")
+            self.error = e
+            # Keep draining so producers blocked on a full queue are released
+            if not stopped:
+                self._drain()
+        finally:
+            conn.close()
+
+    def _drain(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+
+    def _write(self, conn: sqlite3.Connection, snapshot_rows: List[tuple], profile_rows: List[tuple],
+               failures: List[tuple]):
+        """Write one transaction worth of players and checkpoint updates"""
+        start = time.monotonic()
+        cursor = conn.cursor()
+
+        # Update player code, country and name where the API reports new values
+        if self.stage_profiles:
+            profiles_changed = stage_profile_changes(cursor, profile_rows)
+        else:
+            profiles_changed = apply_profile_changes(cursor, profile_rows)
+        cursor.executemany(SNAPSHOT_INSERT_SQL.format(table=self.snapshot_table), snapshot_rows)
+
+        if self.run_id is not None:
+            cursor.executemany("""
+                UPDATE update_checkpoints
+                SET status = 'done', attempts = attempts + 1, error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE run_id = ? AND pid = ?
+            """, [(self.run_id, row[0]) for row in snapshot_rows])
+            # failures are (reason, run_id, pid) tuples
+            cursor.executemany("""
+                UPDATE update_checkpoints
+                SET status = 'failed', attempts = attempts + 1, error = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE run_id = ? AND pid = ?
+            """, failures)
+
+        conn.commit()
+        self.rows_written += len(snapshot_rows)
+        self.profiles_changed += profiles_changed
+        self.commits += 1
+        self.write_seconds += time.monotonic() - start
+        logger.debug("Snapshot writer committed %d players (total %d, queue depth %d)",
+                     len(snapshot_rows), self.rows_written, self.queue.qsize())
+
+    @property
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
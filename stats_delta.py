@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Per-player day-over-day stat changes, recorded at publish time
+The updater diffs the new snapshot against the live one in a single
+INSERT ... SELECT so movers and per-player deltas are indexed lookups
+instead of scans over player_stats_history
+"""
+
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+class StatsDelta:
+    """Maintain the player_stats_delta table read by DatabaseAdapter.get_player_stats_delta"""
+
+    @staticmethod
+    def ensure_schema(cursor: sqlite3.Cursor):
+        """Create the delta table; column order matches DatabaseAdapter.get_player_stats_delta"""
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS player_stats_delta (
+                pid TEXT NOT NULL,
+                stat_date DATE NOT NULL,
+                delta_rating INTEGER NOT NULL DEFAULT 0,
+                delta_won INTEGER NOT NULL DEFAULT 0,
+                delta_plays INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (pid, stat_date),
+                FOREIGN KEY (pid) REFERENCES player(pid)
+            ) WITHOUT ROWID
+        """)
+        # Movers for a day, ordered by rating change
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_stats_delta_date_rating "
+                       "ON player_stats_delta(stat_date, delta_rating)")
+
+    @staticmethod
+    def record(cursor: sqlite3.Cursor, new_table: str, live_table: str) -> int:
+        """Store the change of every player whose stats differ between the two snapshots
+
+        Must run inside the publish transaction, before the new table replaces
+        the live one. Players new to the snapshot have no previous row and are
+        skipped; unchanged (including carried-over) players produce no row. A
+        second run on the same day adds onto that day's row, so it keeps
+        holding the change since the previous day's last snapshot.
+        """
+        cursor.execute(f"""
+            INSERT INTO player_stats_delta (pid, stat_date, delta_rating, delta_won, delta_plays)
+            SELECT s.pid, DATE(s.created_at),
+                   s.versus_rating - l.versus_rating,
+                   s.versus_won - l.versus_won,
+                   s.versus_plays - l.versus_plays
+            FROM {new_table} s
+            JOIN {live_table} l ON l.pid = s.pid
+            WHERE s.versus_rating != l.versus_rating
+            OR s.versus_won != l.versus_won
+            OR s.versus_plays != l.versus_plays
+            ON CONFLICT(pid, stat_date) DO UPDATE SET
+                delta_rating = player_stats_delta.delta_rating + excluded.delta_rating,
+                delta_won = player_stats_delta.delta_won + excluded.delta_won,
+                delta_plays = player_stats_delta.delta_plays + excluded.delta_plays
+        """)
+        changed = cursor.rowcount
+        logger.info(f"Recorded stat deltas for {changed} players")
+        return changed
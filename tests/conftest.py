@@ -0,0 +1,48 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PLAYER_COUNT = 230
+
+
+def build_leaderboard_db(db_path, player_count=PLAYER_COUNT):
+    """Create a database with one published snapshot; ratings and names repeat to exercise tie-breaking"""
+    from snapshot_writer import SNAPSHOT_INSERT_SQL
+    from update_player_stats import SNAPSHOT_TABLE, SNAPSHOT_TABLE_SQL, STAGING_TABLE, PlayerStatsUpdater
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+        conn.executemany("INSERT INTO player VALUES (?, ?, ?, ?)", [
+            (f"{1000 + i}", None if i % 17 == 0 else f"player{i % 40}", f"CODE{i:04d}", 'JP')
+            for i in range(player_count)
+        ])
+        conn.execute(SNAPSHOT_TABLE_SQL.format(table=SNAPSHOT_TABLE))
+
+    updater = PlayerStatsUpdater(db_path)
+    updater.prepare_staging_table()
+    run_id = updater.start_run([], mode='full')
+    now = datetime.now().isoformat()
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(SNAPSHOT_INSERT_SQL.format(table=STAGING_TABLE), [
+            (f"{1000 + i}", (i * 37) % 13 * 100, i % 7, i % 5 * 3, now, now)
+            for i in range(player_count)
+        ])
+    updater.publish_snapshot(run_id)
+
+
+@pytest.fixture
+def server_client(tmp_path, monkeypatch):
+    """Flask test client of server.py reading a fresh leaderboard database"""
+    monkeypatch.chdir(tmp_path)
+    build_leaderboard_db(str(tmp_path / 'mario_filtered.db'))
+    import server
+    server.read_pool.close()
+    server.response_cache.clear()
+    server._summary_cache.update(file_state=None, summary=None, retention=None)
+    return server.app.test_client()
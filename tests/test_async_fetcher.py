@@ -0,0 +1,42 @@
+import asyncio
+
+from async_fetcher import AIMDController, AsyncBatchFetcher
+from batch_planner import PidBatch
+from tgrcode_client import RetryPolicy, TgrcodeClient, TokenBucket
+
+
+class SteadyResponse:
+    """200 after a constant 10ms, an API that is never congested"""
+    status = 200
+    headers = {}
+
+    async def __aenter__(self):
+        await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def read(self):
+        return b'{"users": []}'
+
+
+class SteadySession:
+    def get(self, url):
+        return SteadyResponse()
+
+
+def test_rate_limiter_wait_holds_back_concurrency():
+    client = TgrcodeClient(retry=RetryPolicy(max_retries=0))
+    client.rate_limiter = TokenBucket(rate=200, capacity=1)
+    controller = AIMDController(initial_limit=4)
+    fetcher = AsyncBatchFetcher('http://api/', controller, client)
+
+    async def fetch_all():
+        return await asyncio.gather(*(fetcher.fetch_batch(SteadySession(), PidBatch([str(i)], i))
+                                      for i in range(30)))
+
+    results = asyncio.run(fetch_all())
+    assert all(data == {'users': []} for data, _, _ in results)
+    # The API keeps up, but the client cap does not allow more requests in flight
+    assert controller.limit <= 4
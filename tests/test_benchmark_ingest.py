@@ -0,0 +1,12 @@
+from benchmark_ingest import parse_args, print_report, run_benchmark
+
+
+def test_report_groups_failures_by_reason(capsys):
+    args = parse_args(['--players', '200', '--missing-rate', '0.1', '--latency-ms', '0', '--seed', '1'])
+    result = run_benchmark(args)
+
+    assert result['ok']
+    assert result['failed'] > 0
+    assert result['failure_reasons'] == {'missing_from_response': result['failed']}
+    print_report(args, result)
+    assert f"{result['failed']} missing_from_response" in capsys.readouterr().out
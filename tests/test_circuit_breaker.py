@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from async_fetcher import AIMDController, AsyncBatchFetcher
+from batch_planner import PidBatch
+from tgrcode_client import CircuitBreaker, RetryPolicy, TgrcodeClient
+
+
+class FakeResponse:
+    status_code = 200
+    content = b'{"users": []}'
+    headers = {}
+
+
+def open_breaker(reset_timeout=0.01):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    time.sleep(reset_timeout * 2)
+    return breaker
+
+
+def make_client(breaker):
+    return TgrcodeClient(rate_limit=1000, retry=RetryPolicy(max_retries=0), breaker=breaker)
+
+
+def test_unexpected_error_during_probe_releases_it(monkeypatch):
+    breaker = open_breaker()
+    client = make_client(breaker)
+
+    def broken_get(url, timeout):
+        raise requests.exceptions.ChunkedEncodingError("connection broken")
+
+    monkeypatch.setattr(client.session, 'get', broken_get)
+    assert client.fetch_json('http://api/1')[0] is None
+    assert breaker.state == 'open'
+
+    time.sleep(0.02)
+    monkeypatch.setattr(client.session, 'get', lambda url, timeout: FakeResponse())
+    assert client.fetch_json('http://api/1')[0] == {'users': []}
+    assert breaker.state == 'closed'
+
+
+def test_cancelled_async_probe_releases_it():
+    breaker = open_breaker()
+    fetcher = AsyncBatchFetcher('http://api/', AIMDController(), make_client(breaker))
+
+    class CancelledRequest:
+        async def __aenter__(self):
+            raise asyncio.CancelledError()
+
+        async def __aexit__(self, *exc):
+            return False
+
+    class Session:
+        def get(self, url):
+            return CancelledRequest()
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(fetcher.fetch_batch(Session(), PidBatch(['1'], 0)))
+    # The abandoned probe no longer blocks the next caller
+    assert breaker.wait_time() == 0.0
+    assert breaker.state == 'half-open'
@@ -0,0 +1,68 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from conftest import build_leaderboard_db
+from update_player_stats import SNAPSHOT_TABLE, PlayerStatsUpdater
+
+
+def test_fill_history_gaps_carries_the_last_row_forward(server_client):
+    from server import fill_history_gaps
+
+    start = date(2026, 3, 1)
+    anchor = (900, 9, 18, 50.0, '2026-02-20 08:00:00')
+    rows = [(1000, 10, 20, 50.0, '2026-03-02 09:00:00'), (1100, 12, 22, 54.5, '2026-03-04 09:00:00')]
+
+    filled = fill_history_gaps(rows, anchor, start, '2026-03-05 09:00:00')
+
+    assert [(row[0], row[4]) for row in filled] == [
+        (900, '2026-03-01 00:00:00'),
+        (1000, '2026-03-02 09:00:00'),
+        (1000, '2026-03-03 00:00:00'),
+        (1100, '2026-03-04 09:00:00'),
+        (1100, '2026-03-05 00:00:00'),
+    ]
+    # Without an anchor nothing is invented before the first recorded row
+    assert [row[4] for row in fill_history_gaps(rows[:1], None, start, '2026-03-03 10:00:00')] == [
+        '2026-03-02 09:00:00', '2026-03-03 00:00:00']
+
+
+def test_fill_trend_gaps_marks_filled_days_without_records(server_client):
+    from server import fill_trend_gaps
+
+    trends = [('2026-03-02', 1000.0, 50.0, 2)]
+    filled = fill_trend_gaps(trends, (900, 9, 18, 45.0, '2026-02-20'), date(2026, 3, 1), '2026-03-03 09:00:00')
+    assert filled == [('2026-03-01', 900, 45.0, 0), ('2026-03-02', 1000.0, 50.0, 2), ('2026-03-03', 1000.0, 50.0, 0)]
+
+
+def test_changes_mode_backs_up_only_moved_players(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path, player_count=20)
+    updater = PlayerStatsUpdater(db_path)
+    updater.history_mode = 'changes'
+
+    updater.backup_current_snapshot_to_history()
+    updater.backup_current_snapshot_to_history()
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM player_stats_history").fetchone()[0] == 20
+        conn.execute(f"UPDATE {SNAPSHOT_TABLE} SET versus_plays = versus_plays + 1 WHERE pid = '1003'")
+
+    updater.backup_current_snapshot_to_history()
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM player_stats_history").fetchone()[0] == 21
+        assert conn.execute("SELECT COUNT(*) FROM player_stats_history WHERE pid = '1003'").fetchone()[0] == 2
+
+
+def test_history_endpoint_serves_change_only_history_as_a_daily_series(server_client):
+    today = datetime.utcnow().date()
+    with sqlite3.connect('mario_filtered.db') as conn:
+        conn.executemany("""
+            INSERT INTO player_stats_history (pid, versus_rating, versus_won, versus_plays, win_rate, created_at)
+            VALUES (?, ?, 1, 2, 50.0, ?)
+        """, [('1001', 1000, f"{today - timedelta(days=5)} 12:00:00"),
+              ('1001', 1200, f"{today - timedelta(days=2)} 12:00:00"),
+              ('1002', 500, f"{today} 12:00:00")])  # Another player's row marks today as the latest day
+
+    history = server_client.get('/api/player-history/1001?days=7').get_json()['history']
+
+    assert [(row['created_at'][:10], row['versus_rating']) for row in reversed(history)] == [
+        ((today - timedelta(days=offset)).isoformat(), 1000 if offset > 2 else 1200) for offset in range(5, -1, -1)]
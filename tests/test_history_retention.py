@@ -0,0 +1,92 @@
+import sqlite3
+from datetime import date, timedelta
+
+from conftest import build_leaderboard_db
+from history_retention import HistoryRetention
+
+
+def sql_date(db_path, expression):
+    with sqlite3.connect(db_path) as conn:
+        return date.fromisoformat(conn.execute(f"SELECT {expression}").fetchone()[0])
+
+
+def add_history(db_path, rows):
+    """rows: (pid, day, rating); win rate is rating / 100"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM player_stats_history")
+        conn.executemany("""
+            INSERT INTO player_stats_history (pid, versus_rating, versus_won, versus_plays, win_rate, created_at)
+            VALUES (?, ?, ?, 100, ?, ?)
+        """, [(pid, rating, rating // 100, rating / 100, f"{day.isoformat()} 12:00:00") for pid, day, rating in rows])
+
+
+def table(db_path, query):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute(query).fetchall()
+
+
+def make_db(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path, player_count=3)
+    return db_path
+
+
+def test_weekly_rollup_stops_at_the_raw_window(tmp_path):
+    db_path = make_db(tmp_path)
+    # First Monday that stays at full resolution
+    cutoff = sql_date(db_path, "date(date('now', '-90 days'), 'weekday 0', '-6 days')")
+    week = cutoff - timedelta(days=7)
+    ratings = [1200, 900, 1500, 1100, 1000, 1300, 1250]
+    add_history(db_path, [('1001', week + timedelta(days=i), rating) for i, rating in enumerate(ratings)]
+                + [('1001', cutoff, 2000), ('1001', cutoff + timedelta(days=1), 2100)])
+
+    stats = HistoryRetention(db_path).run()
+
+    assert stats['weekly_rollups'] == 1
+    assert stats['weekly_pruned'] == 6
+    assert table(db_path, """
+        SELECT period, period_start, samples, min_rating, max_rating, min_win_rate, max_win_rate,
+               last_rating, last_won, last_plays, last_win_rate, DATE(last_created_at)
+        FROM player_stats_history_rollup
+    """) == [('week', week.isoformat(), 7, 900, 1500, 9.0, 15.0, 1250, 12, 100, 12.5,
+              (cutoff - timedelta(days=1)).isoformat())]
+    # The last row of the rolled-up week and everything inside the raw window survive
+    assert table(db_path, "SELECT versus_rating FROM player_stats_history ORDER BY created_at") == [
+        (1250,), (2000,), (2100,)]
+
+
+def test_monthly_rollup_merges_weeks_and_keeps_the_last_row(tmp_path):
+    db_path = make_db(tmp_path)
+    month = sql_date(db_path, "date(date('now', '-400 days'), 'start of month')")
+    monday = month + timedelta(days=(7 - month.weekday()) % 7)
+    days = [monday, monday + timedelta(days=1), monday + timedelta(days=7),
+            monday + timedelta(days=8), monday + timedelta(days=14)]
+    ratings = [1000, 1400, 800, 1100, 1200]
+    add_history(db_path, [('1002', day, rating) for day, rating in zip(days, ratings)])
+
+    stats = HistoryRetention(db_path).run()
+
+    assert stats['weekly_rollups'] == 3
+    assert stats['monthly_rollups'] == 1
+    assert table(db_path, """
+        SELECT period, period_start, samples, min_rating, max_rating, last_rating, DATE(last_created_at)
+        FROM player_stats_history_rollup
+    """) == [('month', month.isoformat(), 5, 800, 1400, 1200, days[-1].isoformat())]
+    assert table(db_path, "SELECT pid, versus_rating FROM player_stats_history") == [('1002', 1200)]
+
+
+def test_second_pass_is_a_no_op(tmp_path):
+    db_path = make_db(tmp_path)
+    cutoff = sql_date(db_path, "date(date('now', '-90 days'), 'weekday 0', '-6 days')")
+    add_history(db_path, [(pid, cutoff - timedelta(days=offset), 1000 + offset)
+                          for pid in ('1000', '1001') for offset in range(1, 120, 3)])
+
+    retention = HistoryRetention(db_path)
+    first = retention.run()
+    assert first['weekly_pruned'] > 0
+    history = table(db_path, "SELECT * FROM player_stats_history ORDER BY id")
+    rollups = table(db_path, "SELECT * FROM player_stats_history_rollup ORDER BY pid, period, period_start")
+
+    assert retention.run() == {'weekly_rollups': 0, 'weekly_pruned': 0, 'monthly_rollups': 0, 'monthly_pruned': 0}
+    assert table(db_path, "SELECT * FROM player_stats_history ORDER BY id") == history
+    assert table(db_path, "SELECT * FROM player_stats_history_rollup ORDER BY pid, period, period_start") == rollups
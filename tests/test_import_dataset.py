@@ -0,0 +1,43 @@
+import sqlite3
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.parquet as pq
+
+from import_dataset import DatasetImporter
+
+
+def write_dataset(path, pids):
+    table = pa.table({
+        'pid': pids,
+        'name': [f'player {pid}' for pid in pids],
+        'versus_rating': [1000 + int(pid) for pid in pids],
+        'versus_won': [5] * len(pids),
+        'versus_plays': [10] * len(pids),
+    })
+    pq.write_table(table, str(path))
+
+
+def test_as_of_dates_the_whole_snapshot_including_carried_over_players(tmp_path):
+    db_path = str(tmp_path / 'mario.db')
+    first, second = tmp_path / 'first.parquet', tmp_path / 'second.parquet'
+    write_dataset(first, ['1', '2', '3'])
+    write_dataset(second, ['1', '2'])
+
+    importer = DatasetImporter(db_path)
+    importer.run(str(first), snapshot=True, as_of='2026-01-01')
+    importer.run(str(second), snapshot=True, as_of='2026-02-01')
+
+    with sqlite3.connect(db_path) as conn:
+        dates = conn.execute("SELECT DISTINCT snapshot_date FROM player_stats_snapshot").fetchall()
+        ranked = conn.execute("SELECT COUNT(rating_rank) FROM player_stats_snapshot").fetchone()[0]
+    assert dates == [('2026-02-01',)]
+    assert ranked == 3
+
+
+def test_invalid_as_of_is_rejected(tmp_path):
+    path = tmp_path / 'data.parquet'
+    write_dataset(path, ['1'])
+    with pytest.raises(ValueError):
+        DatasetImporter(str(tmp_path / 'mario.db')).run(str(path), snapshot=True, as_of='yesterday')
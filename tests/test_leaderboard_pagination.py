@@ -0,0 +1,94 @@
+import base64
+import json
+
+import pytest
+
+from conftest import PLAYER_COUNT
+
+URL = '/api/player-stats-snapshot'
+SORT_KEYS = ['versus_rating', 'versus_won', 'versus_plays', 'win_rate', 'name']
+
+
+def get_page(client, **params):
+    response = client.get(URL, query_string=params)
+    assert response.status_code == 200, response.get_data()
+    return response.get_json()
+
+
+def walk_cursor(client, **params):
+    """Every page reached by following next_cursor from the first one"""
+    pages = [get_page(client, **params)]
+    while pages[-1]['pagination']['next_cursor']:
+        pages.append(get_page(client, cursor=pages[-1]['pagination']['next_cursor'], **params))
+    return pages
+
+
+def players(pages):
+    return [(player['rank'], player['pid']) for page in pages for player in page['players']]
+
+
+@pytest.mark.parametrize('sort_order', ['desc', 'asc'])
+@pytest.mark.parametrize('sort_by', SORT_KEYS)
+def test_cursor_walk_matches_offset_pages(server_client, sort_by, sort_order):
+    params = {'sort_by': sort_by, 'sort_order': sort_order, 'per_page': 37}
+    by_cursor = players(walk_cursor(server_client, **params))
+    page_count = -(-PLAYER_COUNT // 37)
+    by_offset = players(get_page(server_client, page=page, **params) for page in range(1, page_count + 1))
+
+    assert by_cursor == by_offset
+    assert [rank for rank, _ in by_cursor] == list(range(1, PLAYER_COUNT + 1))
+    assert len({pid for _, pid in by_cursor}) == PLAYER_COUNT
+
+
+@pytest.mark.parametrize('sort_by', SORT_KEYS)
+def test_cursor_walk_with_search(server_client, sort_by):
+    # Search disables the precomputed rank columns, so every sort key takes the keyset path
+    params = {'sort_by': sort_by, 'search': 'player1', 'per_page': 7}
+    by_cursor = players(walk_cursor(server_client, **params))
+    total = get_page(server_client, **params)['pagination']['total_count']
+    by_offset = players(get_page(server_client, page=page, **params) for page in range(1, -(-total // 7) + 1))
+
+    assert total > 7
+    assert by_cursor == by_offset
+    assert [rank for rank, _ in by_cursor] == list(range(1, total + 1))
+
+
+def test_rank_filter_stops_at_the_limit(server_client):
+    pages = walk_cursor(server_client, rank_filter='top25', per_page=10)
+    assert [[player['rank'] for player in page['players']] for page in pages] == [
+        list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+    assert pages[-1]['pagination']['next_cursor'] is None
+    assert pages[-1]['pagination']['has_next'] is False
+    assert pages[-1]['pagination']['total_count'] == 25
+
+    third = get_page(server_client, rank_filter='top25', per_page=10, page=3)
+    assert players([third]) == players(pages[2:])
+    assert get_page(server_client, rank_filter='top25', per_page=10, page=4)['players'] == []
+
+
+@pytest.mark.parametrize('token', [
+    'not a cursor',
+    base64.urlsafe_b64encode(b'{"rank": 3}').decode(),
+    base64.urlsafe_b64encode(json.dumps([1, 'a', '1001']).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps([1, 'a', '1001', 'x']).encode()).decode(),
+])
+def test_invalid_cursor_is_rejected(server_client, token):
+    response = server_client.get(URL, query_string={'cursor': token})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid cursor'
+
+
+def test_cursor_pages_revalidate_with_304(server_client):
+    cursor = get_page(server_client, per_page=20)['pagination']['next_cursor']
+    first = server_client.get(URL, query_string={'per_page': 20, 'cursor': cursor})
+    assert first.status_code == 200
+
+    revalidated = server_client.get(URL, query_string={'per_page': 20, 'cursor': cursor},
+                                    headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+
+    other_page = server_client.get(URL, query_string={'per_page': 20, 'page': 3},
+                                   headers={'If-None-Match': first.headers['ETag']})
+    assert other_page.status_code == 200
+    assert other_page.headers['ETag'] != first.headers['ETag']
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+
+import pytest
+
+from conftest import PLAYER_COUNT
+
+
+def latest_summary():
+    with sqlite3.connect('mario_filtered.db') as conn:
+        conn.row_factory = sqlite3.Row
+        return dict(conn.execute("SELECT * FROM leaderboard_summary ORDER BY id DESC LIMIT 1").fetchone())
+
+
+def test_summary_matches_the_published_snapshot(server_client):
+    ratings = [(i * 37) % 13 * 100 for i in range(PLAYER_COUNT)]
+    won = [i % 7 for i in range(PLAYER_COUNT)]
+    plays = [i % 5 * 3 for i in range(PLAYER_COUNT)]
+    win_rates = [w * 100.0 / p if p else 0 for w, p in zip(won, plays)]
+
+    summary = latest_summary()
+    assert summary['total_players'] == PLAYER_COUNT
+    assert summary['avg_rating'] == pytest.approx(sum(ratings) / PLAYER_COUNT)
+    assert summary['avg_win_rate'] == pytest.approx(sum(win_rates) / PLAYER_COUNT)
+    assert (summary['total_wins'], summary['total_plays']) == (sum(won), sum(plays))
+    assert json.loads(summary['country_counts']) == {'JP': PLAYER_COUNT}
+    assert sum(bucket['count'] for bucket in json.loads(summary['rating_histogram'])) == PLAYER_COUNT
+    # Players without games have no win rate
+    assert sum(bucket['count'] for bucket in json.loads(summary['win_rate_histogram'])) == sum(1 for p in plays if p)
+
+
+def test_ranking_stats_from_the_summary_match_live_aggregation(server_client):
+    from_summary = server_client.get('/api/ranking-stats').get_json()
+
+    with sqlite3.connect('mario_filtered.db') as conn:
+        conn.execute("DELETE FROM leaderboard_summary")
+    live = server_client.get('/api/ranking-stats').get_json()
+
+    assert 'rating_histogram' not in live
+    assert {key: from_summary[key] for key in live} == live
+
+
+def test_histogram_buckets_are_half_open(tmp_path):
+    from leaderboard_summary import LeaderboardSummary
+    from update_player_stats import SNAPSHOT_TABLE, SNAPSHOT_TABLE_SQL
+
+    # (rating, won, plays)
+    players = [(0, 1, 10), (499, 199, 1000), (500, 2, 10), (999, 9, 10), (1000, 10, 10), (1200, 0, 0)]
+    with sqlite3.connect(str(tmp_path / 'summary.db')) as conn:
+        cursor = conn.cursor()
+        cursor.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+        cursor.execute(SNAPSHOT_TABLE_SQL.format(table=SNAPSHOT_TABLE))
+        for i, (rating, won, plays) in enumerate(players):
+            cursor.execute("INSERT INTO player (pid) VALUES (?)", (str(i),))
+            cursor.execute(f"INSERT INTO {SNAPSHOT_TABLE} (pid, versus_rating, versus_won, versus_plays) "
+                           f"VALUES (?, ?, ?, ?)", (str(i), rating, won, plays))
+        LeaderboardSummary.ensure_schema(cursor)
+        LeaderboardSummary.refresh(cursor, None, SNAPSHOT_TABLE)
+        rating_histogram, win_rate_histogram = cursor.execute(
+            "SELECT rating_histogram, win_rate_histogram FROM leaderboard_summary").fetchone()
+
+    assert json.loads(rating_histogram) == [
+        {'min': 0, 'max': 500, 'count': 2},
+        {'min': 500, 'max': 1000, 'count': 2},
+        {'min': 1000, 'max': 1500, 'count': 2},
+    ]
+    # 19.9% stays below 20; 100% joins the top bucket
+    assert json.loads(win_rate_histogram) == [
+        {'min': 10, 'max': 20, 'count': 2},
+        {'min': 20, 'max': 30, 'count': 1},
+        {'min': 90, 'max': 100, 'count': 2},
+    ]
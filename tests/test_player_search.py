@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from player_search import SEARCH_PIDS_SQL, SEARCH_TRIGGERS, PlayerSearch, match_expression
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+    conn.execute("INSERT INTO player VALUES ('1000', 'マリオ太郎', 'ABC123', 'JP')")
+    if not PlayerSearch.ensure_schema(conn.cursor()):
+        pytest.skip("SQLite without the FTS5 trigram tokenizer")
+    return conn
+
+
+def search(conn, query):
+    return sorted(row[0] for row in conn.execute(SEARCH_PIDS_SQL, (match_expression(query),)))
+
+
+def check_index(conn):
+    # Raises if the index holds entries that no longer match the player rows
+    conn.execute("INSERT INTO player_search (player_search) VALUES ('integrity-check')")
+
+
+def test_index_follows_inserts_updates_and_deletes_of_short_pids(conn):
+    conn.execute("INSERT INTO player (pid, name) VALUES ('ab', 'ルイージ')")
+    conn.execute("UPDATE player SET name = 'ピーチ姫' WHERE pid = 'ab'")
+    assert search(conn, 'ピーチ') == ['ab']
+    assert search(conn, 'ルイージ') == []
+    conn.execute("DELETE FROM player WHERE pid = 'ab'")
+    check_index(conn)
+    assert search(conn, 'ピーチ') == []
+    assert conn.execute("SELECT COUNT(*) FROM player_search").fetchone()[0] == 1
+
+
+def test_substring_search_on_names_and_codes(conn):
+    assert search(conn, 'リオ太') == ['1000']
+    assert search(conn, 'abc1') == ['1000']
+
+
+def test_earlier_pid_keyed_index_is_replaced():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+    conn.execute("INSERT INTO player VALUES ('1000', 'マリオ', NULL, NULL)")
+    try:
+        conn.execute("CREATE VIRTUAL TABLE player_search USING fts5(pid, name, code, tokenize = 'trigram')")
+    except sqlite3.OperationalError:
+        pytest.skip("SQLite without the FTS5 trigram tokenizer")
+    conn.execute("CREATE TRIGGER player_search_insert AFTER INSERT ON player BEGIN SELECT 1; END")
+    assert PlayerSearch.ensure_schema(conn.cursor())
+    check_index(conn)
+    conn.execute("INSERT INTO player (pid, name) VALUES ('2000', 'ヨッシー')")
+    assert search(conn, 'ヨッシ') == ['2000']
+    assert len(SEARCH_TRIGGERS) == conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'player_search_%'").fetchone()[0]
+
+
+def test_rebuild_after_vacuum(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'db.sqlite'))
+    conn.execute("CREATE TABLE player (pid TEXT PRIMARY KEY, name TEXT, code TEXT, country TEXT)")
+    conn.executemany("INSERT INTO player (pid, name) VALUES (?, ?)", [(str(i), f'name{i}') for i in range(50)])
+    if not PlayerSearch.ensure_schema(conn.cursor()):
+        pytest.skip("SQLite without the FTS5 trigram tokenizer")
+    conn.execute("DELETE FROM player WHERE CAST(pid AS INTEGER) % 2 = 0")
+    conn.commit()
+    conn.execute("VACUUM")
+    PlayerSearch.rebuild(conn.cursor())
+    check_index(conn)
+    assert search(conn, 'name13') == ['13']
@@ -0,0 +1,45 @@
+import sqlite3
+
+from conftest import build_leaderboard_db
+from update_player_stats import SNAPSHOT_TABLE, STAGING_TABLE, PlayerStatsUpdater
+
+
+def republish_tiered(db_path, pids):
+    """Publish a tiered run that refreshes `pids` with unchanged stats"""
+    updater = PlayerStatsUpdater(db_path)
+    updater.prepare_staging_table()
+    run_id = updater.start_run(pids, mode='tiered')
+    with sqlite3.connect(db_path) as conn:
+        placeholders = ', '.join('?' * len(pids))
+        conn.execute(f"""
+            INSERT INTO {STAGING_TABLE} (pid, versus_rating, versus_won, versus_plays, created_at, fetched_at)
+            SELECT pid, versus_rating, versus_won, versus_plays, datetime('now'), datetime('now')
+            FROM {SNAPSHOT_TABLE} WHERE pid IN ({placeholders})
+        """, pids)
+        conn.execute("UPDATE update_checkpoints SET status = 'done' WHERE run_id = ?", (run_id,))
+    updater.publish_snapshot(run_id)
+
+
+def test_first_schedule_row_takes_last_change_from_history(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM player_refresh_schedule")
+        conn.execute("DELETE FROM player_stats_history")
+        plays = dict(conn.execute(f"SELECT pid, versus_plays FROM {SNAPSHOT_TABLE}"))
+        history = [
+            ('1001', plays['1001'] - 1, '-3 days'),  # Played two days ago
+            ('1001', plays['1001'], '-2 days'),
+            ('1002', plays['1002'], '-20 days'),  # Unchanged for 20 days
+            ('1003', plays['1003'], '-60 days'),  # Unchanged for 60 days
+        ]
+        conn.executemany("""
+            INSERT INTO player_stats_history (pid, versus_rating, versus_won, versus_plays, win_rate, created_at)
+            VALUES (?, -1, 0, ?, 0, datetime('now', ?))
+        """, history)
+
+    republish_tiered(db_path, ['1001', '1002', '1003'])
+
+    with sqlite3.connect(db_path) as conn:
+        tiers = dict(conn.execute("SELECT pid, tier FROM player_refresh_schedule"))
+    assert tiers == {'1001': 'active', '1002': 'warm', '1003': 'dormant'}
@@ -0,0 +1,110 @@
+import sqlite3
+
+from conftest import PLAYER_COUNT
+
+
+def leaderboard(client, **params):
+    response = client.get('/api/player-stats-snapshot', query_string=params)
+    assert response.status_code == 200, response.get_data()
+    return response.get_json()
+
+
+def test_search_uses_index(server_client):
+    data = leaderboard(server_client, search='CODE012', per_page=100)
+    assert sorted(player['pid'] for player in data['players']) == [str(1000 + i) for i in range(120, 130)]
+
+
+def test_search_falls_back_to_like_when_index_unusable(server_client):
+    # A plain table in place of the FTS index makes MATCH fail like a missing trigram tokenizer would
+    with sqlite3.connect('mario_filtered.db') as conn:
+        conn.execute("DROP TABLE player_search")
+        conn.execute("CREATE TABLE player_search (pid TEXT, name TEXT, code TEXT)")
+    data = leaderboard(server_client, search='CODE012', per_page=100)
+    assert data['pagination']['total_count'] == 10
+
+
+def test_etag_revalidation_returns_304(server_client):
+    first = server_client.get('/api/ranking-stats')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'].startswith('public')
+    etag = first.headers['ETag']
+
+    revalidated = server_client.get('/api/ranking-stats', headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.get_data() == b''
+    assert revalidated.headers['ETag'] == etag
+
+    # Query parameter order and empty values do not change the cache key
+    a = server_client.get('/api/player-stats-snapshot?page=2&sort_by=win_rate')
+    b = server_client.get('/api/player-stats-snapshot?sort_by=win_rate&search=&page=2')
+    assert a.headers['ETag'] == b.headers['ETag']
+
+
+def test_history_retention_invalidates_the_cache(server_client):
+    from history_retention import HistoryRetention
+
+    with sqlite3.connect('mario_filtered.db') as conn:
+        conn.executemany("""
+            INSERT INTO player_stats_history (pid, versus_rating, versus_won, versus_plays, win_rate, created_at)
+            VALUES ('1001', ?, 1, 2, 50.0, datetime('now', ?))
+        """, [(1000 + day, f'-{day} days') for day in range(60, 74)])
+    url = '/api/player-history/1001?days=365'
+    first = server_client.get(url)
+    assert len(first.get_json()['history']) == 14
+
+    # Retention thins history after a publish without adding a summary row
+    assert HistoryRetention('mario_filtered.db', raw_days=30).run()['weekly_pruned'] > 0
+
+    second = server_client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert len(second.get_json()['history']) < 14
+
+
+def test_writes_that_leave_served_data_alone_keep_the_etag(server_client):
+    first = server_client.get('/api/ranking-stats')
+
+    # Like an ingest in progress: staging rows and checkpoints change the file, not the published data
+    from update_player_stats import PlayerStatsUpdater
+    updater = PlayerStatsUpdater('mario_filtered.db')
+    updater.prepare_staging_table()
+    updater.start_run(['1001', '1002'])
+
+    second = server_client.get('/api/ranking-stats', headers={'If-None-Match': first.headers['ETag']})
+    assert second.status_code == 304
+
+
+def test_batch_history_rejects_empty_windows(server_client):
+    url = '/api/player-history/batch'
+    assert server_client.get(url, query_string={'pids': '1001', 'start': '2026-03-02', 'end': '2026-03-01'}).status_code == 400
+    assert server_client.get(url, query_string={'pids': '1001', 'days': 0}).status_code == 400
+    assert server_client.get(url, query_string={'pids': '1001', 'days': -7}).status_code == 400
+    assert server_client.get(url, query_string={'pids': '1001', 'start': '2026-03-01', 'end': '2026-03-01'}).status_code == 200
+    assert server_client.get(url, query_string={'pids': '1001', 'days': 7}).status_code == 200
+
+
+def test_batch_history_caps_explicit_windows(server_client):
+    url = '/api/player-history/batch'
+    assert server_client.get(url, query_string={'pids': '1001', 'start': '2000-01-01'}).status_code == 400
+    assert server_client.get(url, query_string={'pids': '1001', 'start': '2024-01-01', 'end': '2025-01-01'}).status_code == 400
+    assert server_client.get(url, query_string={'pids': '1001', 'start': '2024-01-01', 'end': '2024-12-31'}).status_code == 200
+    assert server_client.get(url, query_string={'pids': '1001', 'days': 1000}).status_code == 200
+
+
+def test_database_without_snapshot_date_column(server_client):
+    # Layout of a database the current updater has not touched yet: no summary rows, no generated date column
+    with sqlite3.connect('mario_filtered.db') as conn:
+        conn.execute("DROP TABLE leaderboard_summary")
+        conn.execute("""
+            CREATE TABLE legacy_snapshot AS
+            SELECT id, pid, versus_rating, versus_won, versus_plays, created_at FROM player_stats_snapshot
+        """)
+        conn.execute("DROP TABLE player_stats_snapshot")
+        conn.execute("ALTER TABLE legacy_snapshot RENAME TO player_stats_snapshot")
+
+    stats = server_client.get('/api/ranking-stats')
+    assert stats.status_code == 200, stats.get_data()
+    assert stats.get_json()['total_players'] == PLAYER_COUNT
+    data = leaderboard(server_client, per_page=100, sort_by='win_rate')
+    assert data['pagination']['total_count'] == PLAYER_COUNT
+    assert len(data['players']) == 100
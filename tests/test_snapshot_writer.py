@@ -0,0 +1,110 @@
+import sqlite3
+
+import pytest
+
+from conftest import build_leaderboard_db
+from snapshot_writer import SnapshotWriter
+from player_search import SEARCH_PIDS_SQL, match_expression
+from update_player_stats import STAGING_TABLE, PlayerStatsUpdater
+
+
+def start_run(tmp_path, pids):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path, player_count=10)
+    updater = PlayerStatsUpdater(db_path)
+    updater.prepare_staging_table()
+    return db_path, updater.start_run(pids)
+
+
+def snapshot_row(pid, rating):
+    return (pid, rating, 1, 2, '2026-01-01T00:00:00', '2026-01-01T00:00:00')
+
+
+def test_rows_and_checkpoints_commit_together(tmp_path):
+    pids = [str(1000 + i) for i in range(10)]
+    db_path, run_id = start_run(tmp_path, pids)
+    writer = SnapshotWriter(db_path, commit_size=4, run_id=run_id, snapshot_table=STAGING_TABLE)
+    writer.start()
+    for pid in pids[:8]:
+        writer.submit([snapshot_row(pid, 1000)], [])
+    writer.submit_failures(pids[8:], 'invalid_response')
+    writer.close()
+
+    assert writer.rows_written == 8
+    assert writer.commits >= 2  # Batches of commit_size, then the remainder at close
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {STAGING_TABLE}").fetchone()[0] == 8
+        checkpoints = dict(conn.execute(
+            "SELECT pid, status || ':' || IFNULL(error, '') FROM update_checkpoints WHERE run_id = ?", (run_id,)))
+    assert checkpoints == {**{pid: 'done:' for pid in pids[:8]}, **{pid: 'failed:invalid_response' for pid in pids[8:]}}
+
+
+def test_only_changed_profiles_are_rewritten(tmp_path):
+    db_path, run_id = start_run(tmp_path, ['1001', '1002'])
+    with sqlite3.connect(db_path) as conn:
+        name, code, country = conn.execute("SELECT name, code, country FROM player WHERE pid = '1001'").fetchone()
+    writer = SnapshotWriter(db_path, run_id=run_id, snapshot_table=STAGING_TABLE)
+    writer.start()
+    # (code, country, name, pid); None keeps the stored value
+    writer.submit([snapshot_row('1001', 1), snapshot_row('1002', 2)],
+                  [(code, country, name, '1001'), (None, 'US', None, '1002')])
+    writer.close()
+
+    assert writer.profiles_changed == 1
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT country, code FROM player WHERE pid = '1002'").fetchone() == ('US', 'CODE0002')
+
+
+def stage_rename(db_path, run_id, name):
+    writer = SnapshotWriter(db_path, run_id=run_id, snapshot_table=STAGING_TABLE, stage_profiles=True)
+    writer.start()
+    writer.submit([snapshot_row('1001', 1)], [(None, None, name, '1001')])
+    writer.close()
+    return writer
+
+
+def profile_state(db_path, name):
+    with sqlite3.connect(db_path) as conn:
+        stored = conn.execute("SELECT name FROM player WHERE pid = '1001'").fetchone()[0]
+        found = [row[0] for row in conn.execute(SEARCH_PIDS_SQL, (match_expression(name),))]
+    return stored, found
+
+
+def test_staged_profiles_go_live_with_the_published_snapshot(tmp_path):
+    db_path, run_id = start_run(tmp_path, ['1001'])
+    original = profile_state(db_path, 'player1')
+    writer = stage_rename(db_path, run_id, 'renamedplayer')
+
+    assert writer.profiles_changed == 1
+    # Neither the player table nor the search index sees the change mid-run
+    assert profile_state(db_path, 'player1') == original
+    assert profile_state(db_path, 'renamedplayer')[1] == []
+
+    PlayerStatsUpdater(db_path).publish_snapshot(run_id)
+    assert profile_state(db_path, 'renamedplayer') == ('renamedplayer', ['1001'])
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM player_profile_staging").fetchone()[0] == 0
+
+
+def test_abandoned_run_leaves_live_profiles_alone(tmp_path):
+    db_path, run_id = start_run(tmp_path, ['1001'])
+    original = profile_state(db_path, 'player1')
+    stage_rename(db_path, run_id, 'abandonedname')
+
+    # A fresh run discards the previous run's staged snapshot and profiles
+    updater = PlayerStatsUpdater(db_path)
+    updater.prepare_staging_table()
+    updater.publish_snapshot(updater.start_run(['1002']))
+    assert profile_state(db_path, 'player1') == original
+    assert profile_state(db_path, 'abandonedname') == (original[0], [])
+
+
+def test_write_errors_reach_the_producers(tmp_path):
+    db_path, run_id = start_run(tmp_path, ['1001'])
+    writer = SnapshotWriter(db_path, run_id=run_id, snapshot_table='missing_table')
+    writer.start()
+    writer.submit([snapshot_row('1001', 1)], [])
+    with pytest.raises(RuntimeError, match='Snapshot writer failed'):
+        writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit([snapshot_row('1001', 1)], [])
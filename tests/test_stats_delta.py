@@ -0,0 +1,57 @@
+import sqlite3
+
+from update_player_stats import SNAPSHOT_TABLE, STAGING_TABLE, PlayerStatsUpdater
+
+DB_PATH = 'mario_filtered.db'
+
+
+def republish(changes):
+    """Publish a tiered run refreshing the players in `changes`: pid -> (rating, won, plays) added to live stats"""
+    updater = PlayerStatsUpdater(DB_PATH)
+    updater.prepare_staging_table()
+    run_id = updater.start_run(list(changes), mode='tiered')
+    with sqlite3.connect(DB_PATH) as conn:
+        live = {row[0]: row[1:] for row in conn.execute(
+            f"SELECT pid, versus_rating, versus_won, versus_plays FROM {SNAPSHOT_TABLE}")}
+        conn.executemany(f"""
+            INSERT INTO {STAGING_TABLE} (pid, versus_rating, versus_won, versus_plays, created_at, fetched_at)
+            VALUES (?, ?, ?, ?, datetime('now'), datetime('now'))
+        """, [(pid, *(base + delta for base, delta in zip(live.get(pid, (0, 0, 0)), change)))
+              for pid, change in changes.items()])
+        conn.execute("UPDATE update_checkpoints SET status = 'done' WHERE run_id = ?", (run_id,))
+    updater.publish_snapshot(run_id)
+
+
+def deltas():
+    with sqlite3.connect(DB_PATH) as conn:
+        return {row[0]: row[1:] for row in conn.execute(
+            "SELECT pid, delta_rating, delta_won, delta_plays FROM player_stats_delta")}
+
+
+def test_only_changed_players_get_a_delta(server_client):
+    with sqlite3.connect(DB_PATH) as conn:
+        conn.execute("INSERT INTO player (pid, name) VALUES ('9999', 'newcomer')")
+
+    republish({'1001': (50, 1, 2), '1002': (0, 0, 0), '1003': (-100, 0, 1), '9999': (1500, 3, 4)})
+
+    # Unchanged and new players have no previous day to compare with
+    assert deltas() == {'1001': (50, 1, 2), '1003': (-100, 0, 1)}
+
+
+def test_second_publish_on_a_day_adds_onto_its_delta(server_client):
+    republish({'1001': (50, 1, 2)})
+    republish({'1001': (25, 0, 1)})
+    assert deltas() == {'1001': (75, 1, 3)}
+
+
+def test_delta_and_movers_endpoints(server_client):
+    republish({'1001': (50, 1, 2), '1003': (-100, 0, 1), '1004': (20, 1, 1)})
+
+    player = server_client.get('/api/player-delta/1001').get_json()
+    assert [(d['delta_rating'], d['delta_won'], d['delta_plays']) for d in player['deltas']] == [(50, 1, 2)]
+
+    up = server_client.get('/api/rating-movers?direction=up').get_json()
+    assert [mover['pid'] for mover in up['movers']][:2] == ['1001', '1004']
+    down = server_client.get('/api/rating-movers?direction=down').get_json()
+    assert down['movers'][0]['pid'] == '1003'
+    assert down['date'] == player['deltas'][0]['stat_date']
@@ -0,0 +1,124 @@
+import sqlite3
+
+import pytest
+
+from conftest import PLAYER_COUNT, build_leaderboard_db
+from update_player_stats import SNAPSHOT_TABLE, STAGING_TABLE, PlayerStatsUpdater, parse_args
+
+
+def fake_engine(db_path, done_share, reason='request_failed'):
+    """Engine that fetches `done_share` of the run's pending PIDs and fails the rest with `reason`"""
+    def run_engine(planner, phase='fetch'):
+        with sqlite3.connect(db_path) as conn:
+            run_id = conn.execute("SELECT MAX(id) FROM update_runs").fetchone()[0]
+            pending = [pid for (pid,) in conn.execute(
+                "SELECT pid FROM update_checkpoints WHERE run_id = ? AND status != 'done' ORDER BY pid", (run_id,))]
+            done = pending[:int(len(pending) * done_share)]
+            conn.executemany(f"""
+                INSERT INTO {STAGING_TABLE} (pid, versus_rating, versus_won, versus_plays, created_at, fetched_at)
+                VALUES (?, 0, 0, 0, datetime('now'), datetime('now'))
+            """, [(pid,) for pid in done])
+            conn.executemany("UPDATE update_checkpoints SET status = 'done' WHERE run_id = ? AND pid = ?",
+                             [(run_id, pid) for pid in done])
+            conn.executemany("UPDATE update_checkpoints SET status = 'failed', error = ? WHERE run_id = ? AND pid = ?",
+                             [(reason, run_id, pid) for pid in pending[len(done):]])
+        return len(done), len(pending) - len(done)
+    return run_engine
+
+
+def test_mostly_failed_full_run_stays_resumable(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path)
+    updater = PlayerStatsUpdater(db_path)
+    updater.retry_batch_size = 0
+
+    updater._run_engine = fake_engine(db_path, 0.5)
+    assert updater.update_all_players() is False
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT status FROM update_runs ORDER BY id DESC LIMIT 1").fetchone()[0] == 'failed'
+        assert conn.execute(f"SELECT COUNT(*) FROM {SNAPSHOT_TABLE}").fetchone()[0] == PLAYER_COUNT
+    assert updater.staging_table_exists()
+
+    updater._run_engine = fake_engine(db_path, 1.0)
+    assert updater.update_all_players(resume=True) is True
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {SNAPSHOT_TABLE}").fetchone()[0] == PLAYER_COUNT
+        assert conn.execute(f"SELECT COUNT(*) FROM {SNAPSHOT_TABLE} WHERE versus_rating != 0").fetchone()[0] == 0
+
+
+
+def test_pids_missing_from_the_api_do_not_block_publishing(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path)
+    updater = PlayerStatsUpdater(db_path)
+    updater.retry_batch_size = 0
+    missing = PLAYER_COUNT - int(PLAYER_COUNT * 0.92)
+
+    # Deleted accounts fail every run; publishing moves them towards quarantine
+    updater._run_engine = fake_engine(db_path, 0.92, 'missing_from_response')
+    for _ in range(updater.quarantine_after_runs):
+        assert updater.update_all_players() is True
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(*) FROM {SNAPSHOT_TABLE}").fetchone()[0] == PLAYER_COUNT - missing
+        assert conn.execute("""
+            SELECT COUNT(*) FROM update_dead_letters
+            WHERE reason = 'missing_from_response' AND quarantined_until > CURRENT_TIMESTAMP
+        """).fetchone()[0] == missing
+    assert len(updater.get_all_pids()) == PLAYER_COUNT - missing
+
+    # Request failures above the threshold still keep the run unpublished
+    updater._run_engine = fake_engine(db_path, 0.9)
+    assert updater.update_all_players() is False
+
+
+
+def test_rows_fetched_on_different_days_publish_as_one_snapshot(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path)
+    updater = PlayerStatsUpdater(db_path)
+    updater.retry_batch_size = 0
+
+    updater._run_engine = fake_engine(db_path, 0.5)
+    assert updater.update_all_players() is False
+    # The resumed half is fetched the next day
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(f"UPDATE {STAGING_TABLE} SET created_at = datetime('now', '-1 day'), "
+                     f"fetched_at = datetime('now', '-1 day')")
+    updater._run_engine = fake_engine(db_path, 1.0)
+    assert updater.update_all_players(resume=True) is True
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute(f"SELECT COUNT(DISTINCT snapshot_date) FROM {SNAPSHOT_TABLE}").fetchone()[0] == 1
+        assert conn.execute(f"SELECT COUNT(*) FROM {SNAPSHOT_TABLE} WHERE rating_rank IS NULL").fetchone()[0] == 0
+        assert conn.execute(f"SELECT COUNT(DISTINCT DATE(fetched_at)) FROM {SNAPSHOT_TABLE}").fetchone()[0] == 2
+        assert conn.execute(
+            "SELECT total_players FROM leaderboard_summary ORDER BY id DESC LIMIT 1").fetchone()[0] == PLAYER_COUNT
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.failures = []
+
+    def submit_failures(self, pids, reason):
+        self.failures.append((list(pids), reason))
+
+
+def test_non_object_response_is_an_invalid_response(tmp_path):
+    db_path = str(tmp_path / 'mario_filtered.db')
+    build_leaderboard_db(db_path)
+    updater = PlayerStatsUpdater(db_path)
+    updater._writer = RecordingWriter()
+
+    for body in (['1001', '1002'], 'error', 0):
+        updater._writer.failures.clear()
+        assert updater.handle_batch_result(['1001', '1002'], 1, body) == (0, 2)
+        assert updater._writer.failures == [(['1001', '1002'], 'invalid_response')]
+
+
+def test_batch_size_outside_explicit_limits_is_an_error():
+    assert parse_args(['--batch-size', '200']).batch_size == 200
+    assert parse_args(['--batch-size', '200', '--max-batch-size', '250']).batch_size == 200
+    with pytest.raises(SystemExit):
+        parse_args(['--batch-size', '200', '--max-batch-size', '100'])
+    with pytest.raises(SystemExit):
+        parse_args(['--batch-size', '10', '--min-batch-size', '20'])
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for the tgrcode API
+One pooled keep-alive session for all workers, a token-bucket rate limiter,
+jittered exponential retry on 5xx/429/timeouts and a circuit breaker
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    # Optional: several times faster than the stdlib decoder on large user_info_multiple payloads
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth retrying; other 4xx responses fail immediately
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def loads_json(body: bytes):
+    """Decode a JSON response body with orjson when installed; raises ValueError on bad input"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+class TokenBucket:
+    """Thread-safe token bucket; rate <= 0 disables limiting"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate  # Tokens added per second
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take one token and return how long the caller must wait before using it"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            # Negative balance means the token is borrowed from the future
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block until a token is available"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def try_acquire(self) -> bool:
+        """Take one token only if it is available right now"""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """Stop hammering the API after repeated failures, then probe it again
+
+    closed: requests flow. open: requests wait until reset_timeout has passed.
+    half-open: a single probe request decides whether to close or reopen.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold  # Consecutive failures that open the circuit
+        self.reset_timeout = reset_timeout  # Seconds to stay open before probing
+        self.state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """Seconds the caller must wait before sending; 0 means go ahead"""
+        with self._lock:
+            if self.state == 'closed':
+                return 0.0
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self._probe_in_flight:
+                # Someone else is probing; check back shortly
+                return min(1.0, self.reset_timeout)
+            self.state = 'half-open'
+            self._probe_in_flight = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info("Circuit breaker closed, API is responding again")
+            self.state = 'closed'
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == 'half-open' or self._failures >= self.failure_threshold:
+                if self.state != 'open':
+                    logger.warning(f"Circuit breaker opened after {self._failures} consecutive failures, "
+                                   f"pausing requests for {self.reset_timeout:.0f}s")
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def release_probe(self):
+        """Give up a probe that ended without an outcome (e.g. cancelled) so another caller can probe"""
+        with self._lock:
+            self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """Full-jitter exponential backoff"""
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 30.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before retry number `attempt` (0-based), honouring Retry-After when given"""
+        if retry_after:
+            try:
+                return min(self.max_delay, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class TgrcodeClient:
+    """Pooled, rate-limited, retrying GET client shared by all fetch workers"""
+
+    def __init__(self, rate_limit: float = 5.0, burst: Optional[float] = None, pool_size: int = 32,
+                 timeout: int = 30, retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_json(self, url: str) -> Optional[dict]:
+        """GET a JSON document, retrying transient failures; None when all attempts fail"""
+        return self.fetch_json(url)[0]
+
+    def fetch_json(self, url: str) -> Tuple[Optional[dict], float, int]:
+        """Like get_json but also returns (latency, payload_bytes) of the last attempt"""
+        latency = 0.0
+        payload_bytes = 0
+        for attempt in range(self.retry.max_retries + 1):
+            wait = self.breaker.wait_time()
+            if wait > 0:
+                time.sleep(wait)
+                wait = self.breaker.wait_time()
+                if wait > 0:
+                    # Still open (another worker's probe failed); count it as a failed attempt
+                    continue
+            self.rate_limiter.acquire()
+
+            retry_after = None
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+                latency = time.monotonic() - start
+                payload_bytes = len(response.content)
+                if response.status_code == 200:
+                    try:
+                        data = loads_json(response.content)
+                    except ValueError as e:
+                        logger.error(f"Failed to parse JSON response: {e}")
+                        logger.error(f"Response text: {response.text[:500]}...")
+                        self.breaker.record_success()
+                        return None, latency, payload_bytes
+                    self.breaker.record_success()
+                    return data, latency, payload_bytes
+
+                if response.status_code not in RETRYABLE_STATUSES:
+                    logger.error(f"API request failed with status {response.status_code}")
+                    logger.error(f"Response: {response.text[:500]}...")
+                    self.breaker.record_success()
+                    return None, latency, payload_bytes
+
+                logger.warning(f"API request returned {response.status_code} "
+                               f"(attempt {attempt + 1}/{self.retry.max_retries + 1})")
+                retry_after = response.headers.get('Retry-After')
+            except (requests.Timeout, requests.ConnectionError) as e:
+                latency = time.monotonic() - start
+                logger.warning(f"API request error: {e} (attempt {attempt + 1}/{self.retry.max_retries + 1})")
+            except Exception as e:
+                logger.error(f"Exception during API call: {e}")
+                # Still a failed attempt; also releases the half-open probe if this was it
+                self.breaker.record_failure()
+                return None, time.monotonic() - start, 0
+
+            self.breaker.record_failure()
+            if attempt < self.retry.max_retries:
+                time.sleep(self.retry.backoff(attempt, retry_after))
+
+        logger.error(f"API request failed after {self.retry.max_retries + 1} attempts")
+        return None, latency, payload_bytes
+
+    def close(self):
+        self.session.close()
@@ -1,23 +1,34 @@
 #!/usr/bin/env python3
 """
 Script to update player_stats_snapshot table using batch API calls
-Clears existing snapshot data and fetches fresh data from API
+Builds a fresh snapshot in a staging table and swaps it in atomically
 Enhanced with multi-threading support and code/country fields
 Updated for new database schema with created_at and history table
 """
 
 import sqlite3
-import requests
-import json
-import time
 import logging
 import sys
+import time
 from datetime import datetime, date
 from typing import List, Dict, Optional
 import os
 import concurrent.futures
 from threading import Lock
-import threading
+import argparse
+import asyncio
+from snapshot_writer import (PROFILE_STAGING_TABLE, PROFILE_STAGING_TABLE_SQL, SNAPSHOT_INSERT_SQL, SnapshotWriter,
+                             apply_profile_changes, apply_staged_profiles, stage_profile_changes)
+from refresh_scheduler import RefreshScheduler
+from leaderboard_summary import LeaderboardSummary
+from player_search import PlayerSearch
+from snapshot_ranks import SnapshotRanks
+from stats_delta import StatsDelta
+from progress_reporter import ProgressReporter
+from history_retention import HistoryRetention
+from tgrcode_client import TgrcodeClient
+from batch_planner import AdaptiveBatchSizer, BatchPlanner, PidBatch
+from sharding import create_shard_database, find_shard_files, parse_shard_spec, read_shard_info, shard_path
 
 # Configure logging
 logging.basicConfig(
@@ -30,14 +41,86 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+SNAPSHOT_TABLE = 'player_stats_snapshot'
+STAGING_TABLE = 'player_stats_snapshot_staging'
+
+# Live and staging snapshot tables share one definition so a swap keeps the schema
+SNAPSHOT_TABLE_SQL = """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        pid TEXT NOT NULL,
+        versus_rating INTEGER NOT NULL DEFAULT 0,
+        versus_won INTEGER NOT NULL DEFAULT 0,
+        versus_plays INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        fetched_at TIMESTAMP,
+        snapshot_date DATE GENERATED ALWAYS AS (DATE(created_at)) VIRTUAL,
+        rating_rank INTEGER,
+        won_rank INTEGER,
+        plays_rank INTEGER,
+        win_rate_rank INTEGER,
+        FOREIGN KEY (pid) REFERENCES player(pid)
+    )
+"""
+
+# PIDs left out of runs until their quarantine expires
+QUARANTINED_PIDS_SQL = "SELECT pid FROM update_dead_letters WHERE quarantined_until > CURRENT_TIMESTAMP"
+
+# Run modes whose snapshot only covers some players; the rest are carried over from the live table
+CARRY_OVER_MODES = ('tiered', 'partial', 'import')
+
+# Secondary indexes are only built on the live table, after the bulk load;
+# the sort-key ones back keyset pagination of /api/player-stats-snapshot
+SNAPSHOT_INDEXES = [
+    ('idx_player_stats_snapshot_pid', 'pid'),
+    ('idx_player_stats_snapshot_created_at', 'created_at'),
+    ('idx_player_stats_snapshot_snapshot_date', 'snapshot_date'),
+    ('idx_player_stats_snapshot_versus_rating', 'versus_rating'),
+    ('idx_player_stats_snapshot_versus_won', 'versus_won'),
+    ('idx_player_stats_snapshot_versus_plays', 'versus_plays'),
+    ('idx_player_stats_snapshot_win_rate',
+     'CASE WHEN versus_plays > 0 THEN (versus_won * 100.0 / versus_plays) ELSE 0 END'),
+    ('idx_player_stats_snapshot_rating_rank', 'rating_rank'),
+    ('idx_player_stats_snapshot_won_rank', 'won_rank'),
+    ('idx_player_stats_snapshot_plays_rank', 'plays_rank'),
+    ('idx_player_stats_snapshot_win_rate_rank', 'win_rate_rank'),
+]
+
 class PlayerStatsUpdater:
-    def __init__(self, db_path: str = "mario_filtered.db"):
+    ENGINES = ('threads', 'asyncio')
+    HISTORY_MODES = ('full', 'changes')
+
+    def __init__(self, db_path: str = "mario_filtered.db", engine: str = "threads"):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown fetch engine '{engine}', expected one of {self.ENGINES}")
+
         self.db_path = db_path
         self.api_base_url = "https://tgrcode.com/mm2/user_info_multiple/"
-        self.batch_size = 50  # Number of PIDs to process in one API call
-        self.request_delay = 1  # Reduced delay between API calls in seconds
+        self.batch_size = 50  # Initial number of PIDs per API call
+        self.min_batch_size = 20  # Adaptive batch size limits; set both to batch_size for fixed batches
+        self.max_batch_size = 100
+        self.max_split_depth = 3  # Times a failed batch may be halved and retried
+        self.retry_batch_size = 5  # Batch size of the end-of-run retry pass (0 disables it)
+        self.quarantine_after_runs = 3  # Consecutive failed runs before a PID is quarantined
+        self.quarantine_days = 7  # How long quarantined PIDs are left out of runs
+        self.rate_limit = 5.0  # Max API requests per second across all workers (0 disables)
         self.max_workers = 4  # Number of concurrent threads
         self.db_lock = Lock()  # Database access lock
+        self._client = None  # Shared TgrcodeClient, created on first use
+        self._client_lock = Lock()
+        self.engine = engine  # 'threads' (fixed pool) or 'asyncio' (AIMD-tuned concurrency)
+        self.max_concurrency = 32  # Upper bound for the asyncio engine's in-flight requests
+        self.commit_size = 2000  # Players per writer transaction
+        self.writer_queue_size = 100  # Parsed batches buffered between fetchers and the writer
+        self._writer = None  # SnapshotWriter active during update_all_players
+        self._failed_pids = []  # PIDs that failed in the current pass, for the retry pass
+        self.progress_interval = 10.0  # Seconds between progress reports (0 reports only at phase ends)
+        self.progress_jsonl = None  # Optional path receiving progress and summary records as JSON lines
+        self._progress = None  # ProgressReporter active during update_all_players
+        self.last_run_stats = {}  # Timings and counts of the latest update_all_players call
+        self.history_mode = 'full'  # 'full' copies every snapshot row, 'changes' only rows whose stats moved
+        self.max_failure_ratio = 0.05  # A full run with more failed PIDs than this stays unpublished and resumable
+        self.scheduler = RefreshScheduler(db_path)  # Picks the due PIDs for tiered runs
         
         # Initialize database schema with new fields
         self._ensure_database_schema()
@@ -63,6 +146,8 @@ class PlayerStatsUpdater:
                 # Create index for code field for faster searching
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_code ON player(code)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_country ON player(country)")
+                # Name sort key of the leaderboard's keyset pagination
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_name_sort ON player(IFNULL(name, ''))")
                 
                 # Check if player_stats_snapshot has the new schema
                 cursor.execute("PRAGMA table_info(player_stats_snapshot)")
@@ -71,6 +156,16 @@ class PlayerStatsUpdater:
                 if 'created_at' not in snapshot_columns:
                     logger.warning("player_stats_snapshot table needs migration to new schema")
                     logger.warning("Please run migrate_database.py first")
+                elif 'fetched_at' not in snapshot_columns:
+                    logger.info("Adding 'fetched_at' column to player_stats_snapshot table")
+                    cursor.execute("ALTER TABLE player_stats_snapshot ADD COLUMN fetched_at TIMESTAMP")
+                if 'created_at' in snapshot_columns:
+                    for table in (SNAPSHOT_TABLE, STAGING_TABLE):
+                        self._add_snapshot_columns(cursor, table)
+                if snapshot_columns:
+                    # Existing databases get indexes added since their last publish
+                    for index_name, columns in SNAPSHOT_INDEXES:
+                        cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {SNAPSHOT_TABLE}({columns})")
                 
                 # Ensure history table exists
                 cursor.execute("""
@@ -91,6 +186,65 @@ class PlayerStatsUpdater:
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_stats_history_created_at ON player_stats_history(created_at)")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_player_stats_history_pid_created_at ON player_stats_history(pid, created_at)")
                 
+                # Run ledger and per-PID checkpoints used by --resume
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS update_runs (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        status TEXT NOT NULL DEFAULT 'running',
+                        total_pids INTEGER NOT NULL DEFAULT 0,
+                        successful_updates INTEGER NOT NULL DEFAULT 0,
+                        failed_updates INTEGER NOT NULL DEFAULT 0,
+                        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        finished_at TIMESTAMP
+                    )
+                """)
+                cursor.execute("PRAGMA table_info(update_runs)")
+                run_columns = [column[1] for column in cursor.fetchall()]
+                if 'mode' not in run_columns:
+                    cursor.execute("ALTER TABLE update_runs ADD COLUMN mode TEXT NOT NULL DEFAULT 'full'")
+                if 'snapshot_at' not in run_columns:
+                    # Timestamp of the run's snapshot rows when it is not "now" (dataset imports with --as-of)
+                    cursor.execute("ALTER TABLE update_runs ADD COLUMN snapshot_at TIMESTAMP")
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS update_checkpoints (
+                        run_id INTEGER NOT NULL,
+                        pid TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        updated_at TIMESTAMP,
+                        PRIMARY KEY (run_id, pid),
+                        FOREIGN KEY (run_id) REFERENCES update_runs(id)
+                    ) WITHOUT ROWID
+                """)
+                cursor.execute("PRAGMA table_info(update_checkpoints)")
+                if 'error' not in [column[1] for column in cursor.fetchall()]:
+                    cursor.execute("ALTER TABLE update_checkpoints ADD COLUMN error TEXT")
+                
+                # Dead-letter queue: PIDs whose last fetch failed, quarantined when they keep failing
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS update_dead_letters (
+                        pid TEXT PRIMARY KEY,
+                        reason TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        failed_runs INTEGER NOT NULL DEFAULT 0,
+                        first_failed_at TIMESTAMP,
+                        last_failed_at TIMESTAMP,
+                        last_run_id INTEGER,
+                        quarantined_until TIMESTAMP,
+                        FOREIGN KEY (pid) REFERENCES player(pid)
+                    )
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_update_dead_letters_quarantined_until ON update_dead_letters(quarantined_until)")
+                
+                # Profile changes fetched by the current run, applied to player when its snapshot is published
+                cursor.execute(PROFILE_STAGING_TABLE_SQL)
+                
+                RefreshScheduler.ensure_schema(cursor)
+                LeaderboardSummary.ensure_schema(cursor)
+                StatsDelta.ensure_schema(cursor)
+                HistoryRetention.ensure_schema(cursor)
+                PlayerSearch.ensure_schema(cursor)
+                
                 conn.commit()
                 logger.info("Database schema updated successfully")
                 
@@ -99,13 +253,19 @@ class PlayerStatsUpdater:
             raise
     
     def get_all_pids(self) -> List[str]:
-        """Get all PIDs from the player table"""
+        """Get all PIDs from the player table, leaving out quarantined ones"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT pid FROM player ORDER BY pid")
+                cursor.execute(f"""
+                    SELECT pid FROM player
+                    WHERE pid NOT IN ({QUARANTINED_PIDS_SQL})
+                    ORDER BY pid
+                """)
                 pids = [row[0] for row in cursor.fetchall()]
-                logger.info(f"Retrieved {len(pids)} PIDs from database")
+                cursor.execute(f"SELECT COUNT(*) FROM ({QUARANTINED_PIDS_SQL})")
+                quarantined = cursor.fetchone()[0]
+                logger.info(f"Retrieved {len(pids)} PIDs from database ({quarantined} quarantined)")
                 return pids
         except Exception as e:
             logger.error(f"Error retrieving PIDs from database: {e}")
@@ -113,36 +273,318 @@ class PlayerStatsUpdater:
     
     def backup_current_snapshot_to_history(self):
         """Backup current snapshot data to history table before clearing"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                self._backup_snapshot_to_history(cursor)
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error backing up snapshot data: {e}")
+            raise
+    
+    def _backup_snapshot_to_history(self, cursor: sqlite3.Cursor) -> int:
+        """Copy the live snapshot into the history table using the caller's transaction"""
+        # Check if snapshot table has data
+        cursor.execute("SELECT COUNT(*) FROM player_stats_snapshot")
+        snapshot_count = cursor.fetchone()[0]
+        
+        if snapshot_count == 0:
+            logger.info("No snapshot data to backup")
+            return 0
+        
+        logger.info(f"Backing up {snapshot_count} snapshot records to history table ({self.history_mode} mode)...")
+        
+        if self.history_mode == 'changes':
+            # Skip players whose latest history row already holds the same stats;
+            # the history endpoints carry the last row forward over unchanged days
+            change_filter = """
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM (
+                        SELECT h.versus_rating, h.versus_won, h.versus_plays
+                        FROM player_stats_history h
+                        WHERE h.pid = s.pid
+                        ORDER BY h.created_at DESC
+                        LIMIT 1
+                    ) last
+                    WHERE last.versus_rating = s.versus_rating
+                    AND last.versus_won = s.versus_won
+                    AND last.versus_plays = s.versus_plays
+                )
+            """
+        else:
+            change_filter = ""
+        
+        # Insert current snapshot data into history with calculated win_rate
+        cursor.execute(f"""
+            INSERT INTO player_stats_history (pid, versus_rating, versus_won, versus_plays, win_rate, created_at)
+            SELECT s.pid, s.versus_rating, s.versus_won, s.versus_plays,
+                   CASE WHEN s.versus_plays > 0 THEN (s.versus_won * 100.0 / s.versus_plays) ELSE 0 END as win_rate,
+                   s.created_at
+            FROM player_stats_snapshot s
+            {change_filter}
+        """)
+        
+        backed_up_count = cursor.rowcount
+        logger.info(f"Successfully backed up {backed_up_count} records to history table")
+        return backed_up_count
+    
+    def _add_snapshot_columns(self, cursor: sqlite3.Cursor, table: str):
+        """Bring a live or staging snapshot table from an older release up to SNAPSHOT_TABLE_SQL"""
+        cursor.execute(f"PRAGMA table_xinfo({table})")
+        columns = [column[1] for column in cursor.fetchall()]
+        if not columns:
+            return
+        if 'snapshot_date' not in columns:
+            logger.info(f"Adding 'snapshot_date' column to {table} table")
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN snapshot_date DATE "
+                           f"GENERATED ALWAYS AS (DATE(created_at)) VIRTUAL")
+        if SnapshotRanks.ensure_schema(cursor, table) and table == SNAPSHOT_TABLE:
+            SnapshotRanks.compute(cursor, table)
+    
+    def prepare_staging_table(self):
+        """Create an empty, index-free staging table for the next snapshot"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+                cursor.execute(SNAPSHOT_TABLE_SQL.format(table=STAGING_TABLE))
+                # Profiles staged by an abandoned run are dropped along with its snapshot rows
+                cursor.execute(f"DELETE FROM {PROFILE_STAGING_TABLE}")
+                conn.commit()
+                logger.info(f"Prepared empty staging table {STAGING_TABLE}")
+        except Exception as e:
+            logger.error(f"Error preparing staging table: {e}")
+            raise
+    
+    def staging_table_exists(self) -> bool:
+        """Check whether a staging snapshot is waiting to be published"""
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (STAGING_TABLE,))
+            return cursor.fetchone() is not None
+    
+    def publish_snapshot(self, run_id: int):
+        """Back up the live snapshot and swap the staging table in, all in one transaction
+        
+        Readers keep seeing the previous snapshot until the commit and the new one
+        right after it; there is no window with a partial or empty leaderboard.
+        """
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            # Rename by name only; do not rewrite references held by other schema objects
+            cursor.execute("PRAGMA legacy_alter_table = ON")
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            self._backup_snapshot_to_history(cursor)
+            # Profiles go live with the snapshot; the search index triggers fire in this transaction
+            profiles_changed = apply_staged_profiles(cursor)
+            
+            cursor.execute("SELECT mode, snapshot_at FROM update_runs WHERE id = ?", (run_id,))
+            mode, snapshot_at = cursor.fetchone()
+            snapshot_at = snapshot_at or datetime.now().isoformat()
+            # Resumed runs, runs crossing midnight and shard merges fetched rows on several days;
+            # the leaderboard reads the latest snapshot_date, so the whole snapshot shares one time
+            cursor.execute(f"""
+                UPDATE {STAGING_TABLE} SET fetched_at = COALESCE(fetched_at, created_at), created_at = ?
+            """, (snapshot_at,))
+            if mode in CARRY_OVER_MODES:
+                self._carry_over_unrefreshed(cursor, run_id, snapshot_at)
+            self.scheduler.record_refresh(cursor, run_id, STAGING_TABLE, SNAPSHOT_TABLE)
+            self._record_dead_letters(cursor, run_id)
+            StatsDelta.record(cursor, STAGING_TABLE, SNAPSHOT_TABLE)
+            SnapshotRanks.compute(cursor, STAGING_TABLE)
+            
+            cursor.execute(f"ALTER TABLE {SNAPSHOT_TABLE} RENAME TO {SNAPSHOT_TABLE}_old")
+            cursor.execute(f"ALTER TABLE {STAGING_TABLE} RENAME TO {SNAPSHOT_TABLE}")
+            cursor.execute(f"DROP TABLE {SNAPSHOT_TABLE}_old")
+            for index_name, columns in SNAPSHOT_INDEXES:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {SNAPSHOT_TABLE}({columns})")
+            LeaderboardSummary.refresh(cursor, run_id, SNAPSHOT_TABLE)
+            
+            self._mark_run(cursor, run_id, 'completed')
+            cursor.execute("COMMIT")
+            logger.info(f"Published snapshot from update run {run_id} ({profiles_changed} player profiles changed)")
+        except Exception as e:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            logger.error(f"Error publishing snapshot: {e}")
+            raise
+        finally:
+            conn.close()
+    
+    def _carry_over_unrefreshed(self, cursor: sqlite3.Cursor, run_id: int, created_at: str):
+        """Copy live rows for players this run did not refresh into the staging table
+        
+        Carried rows join the new snapshot (created_at is the snapshot time) while
+        fetched_at keeps the time their stats were actually fetched.
+        """
+        cursor.execute(f"PRAGMA table_info({SNAPSHOT_TABLE})")
+        live_columns = [column[1] for column in cursor.fetchall()]
+        fetched_at = "COALESCE(fetched_at, created_at)" if 'fetched_at' in live_columns else "created_at"
+        
+        cursor.execute(f"""
+            INSERT INTO {STAGING_TABLE} (pid, versus_rating, versus_won, versus_plays, created_at, fetched_at)
+            SELECT pid, versus_rating, versus_won, versus_plays, ?, {fetched_at}
+            FROM {SNAPSHOT_TABLE} live
+            WHERE NOT EXISTS (
+                SELECT 1 FROM update_checkpoints c
+                WHERE c.run_id = ? AND c.pid = live.pid AND c.status = 'done'
+            )
+        """, (created_at, run_id))
+        logger.info(f"Carried over {cursor.rowcount} unrefreshed players into the new snapshot")
+    
+    def _record_dead_letters(self, cursor: sqlite3.Cursor, run_id: int):
+        """Move the run's failed PIDs into the dead-letter table and quarantine repeat offenders
+        
+        Runs at publish time only, so an API outage that fails a whole run does
+        not count against every player.
+        """
+        cursor.execute("""
+            DELETE FROM update_dead_letters
+            WHERE pid IN (SELECT pid FROM update_checkpoints WHERE run_id = ? AND status = 'done')
+        """, (run_id,))
+        recovered = cursor.rowcount
+        
+        cursor.execute("""
+            INSERT INTO update_dead_letters
+            (pid, reason, attempts, failed_runs, first_failed_at, last_failed_at, last_run_id)
+            SELECT pid, error, attempts, 1, updated_at, updated_at, run_id
+            FROM update_checkpoints
+            WHERE run_id = ? AND status = 'failed'
+            ON CONFLICT(pid) DO UPDATE SET
+                reason = excluded.reason,
+                attempts = update_dead_letters.attempts + excluded.attempts,
+                failed_runs = update_dead_letters.failed_runs + 1,
+                last_failed_at = excluded.last_failed_at,
+                last_run_id = excluded.last_run_id
+        """, (run_id,))
+        dead_letters = cursor.rowcount
+        
+        cursor.execute("""
+            UPDATE update_dead_letters
+            SET quarantined_until = datetime('now', ?)
+            WHERE last_run_id = ? AND failed_runs >= ?
+        """, (f'+{self.quarantine_days} days', run_id, self.quarantine_after_runs))
+        quarantined = cursor.rowcount
+        
+        logger.info(f"Dead-letter queue: {dead_letters} PIDs failed this run, {recovered} recovered, "
+                    f"{quarantined} quarantined for {self.quarantine_days} days")
+    
+    def start_run(self, pids: List[str], mode: str = 'full', snapshot_at: Optional[str] = None) -> int:
+        """Record a new update run and a pending checkpoint for each of its PIDs
+        
+        snapshot_at, when given, is the created_at of every row the run publishes,
+        including players carried over from the live snapshot; otherwise the
+        publish time is used.
+        """
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # Check if snapshot table has data
-                cursor.execute("SELECT COUNT(*) FROM player_stats_snapshot")
-                snapshot_count = cursor.fetchone()[0]
+                # A fresh run supersedes whatever was left unfinished
+                cursor.execute("""
+                    UPDATE update_runs SET status = 'abandoned', finished_at = CURRENT_TIMESTAMP
+                    WHERE status IN ('running', 'failed')
+                """)
+                if cursor.rowcount:
+                    logger.info(f"Marked {cursor.rowcount} unfinished update run(s) as abandoned")
+                # Checkpoints only matter while a run can still be resumed
+                cursor.execute("DELETE FROM update_checkpoints")
                 
-                if snapshot_count > 0:
-                    logger.info(f"Backing up {snapshot_count} snapshot records to history table...")
-                    
-                    # Insert current snapshot data into history with calculated win_rate
-                    cursor.execute("""
-                        INSERT INTO player_stats_history (pid, versus_rating, versus_won, versus_plays, win_rate, created_at)
-                        SELECT pid, versus_rating, versus_won, versus_plays,
-                               CASE WHEN versus_plays > 0 THEN (versus_won * 100.0 / versus_plays) ELSE 0 END as win_rate,
-                               created_at
-                        FROM player_stats_snapshot
-                    """)
-                    
-                    backed_up_count = cursor.rowcount
-                    conn.commit()
-                    logger.info(f"Successfully backed up {backed_up_count} records to history table")
-                else:
-                    logger.info("No snapshot data to backup")
-                    
+                cursor.execute(
+                    "INSERT INTO update_runs (status, total_pids, mode, snapshot_at) VALUES ('running', ?, ?, ?)",
+                    (len(pids), mode, snapshot_at)
+                )
+                run_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO update_checkpoints (run_id, pid) VALUES (?, ?)",
+                    ((run_id, pid) for pid in pids)
+                )
+                conn.commit()
+                logger.info(f"Started {mode} update run {run_id} with {len(pids)} PIDs")
+                return run_id
         except Exception as e:
-            logger.error(f"Error backing up snapshot data: {e}")
+            logger.error(f"Error starting update run: {e}")
+            raise
+    
+    def find_resumable_run(self) -> Optional[tuple]:
+        """Return (run_id, pending_pids) for the latest unfinished run, or None"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT id FROM update_runs
+                    WHERE status IN ('running', 'failed')
+                    ORDER BY id DESC
+                    LIMIT 1
+                """)
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                
+                run_id = row[0]
+                cursor.execute("""
+                    SELECT pid FROM update_checkpoints
+                    WHERE run_id = ? AND status != 'done'
+                    ORDER BY pid
+                """, (run_id,))
+                pending_pids = [r[0] for r in cursor.fetchall()]
+                
+                cursor.execute("UPDATE update_runs SET status = 'running', finished_at = NULL WHERE id = ?", (run_id,))
+                conn.commit()
+                logger.info(f"Resuming update run {run_id}: {len(pending_pids)} PIDs still pending")
+                return run_id, pending_pids
+        except Exception as e:
+            logger.error(f"Error looking up resumable run: {e}")
             raise
     
+    def _run_outcome(self, run_id: int) -> tuple:
+        """(mode, PIDs not done, PIDs in total) of a run, over all of its passes and resumes
+        
+        PIDs the API answered without are left out of both counts: they are
+        unknown to the API (deleted accounts), refetching will not help, and
+        publishing is what moves them into the dead-letter queue and quarantine.
+        """
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT mode FROM update_runs WHERE id = ?", (run_id,))
+            mode = cursor.fetchone()[0]
+            cursor.execute("""
+                SELECT COALESCE(SUM(status != 'done'), 0), COUNT(*) FROM update_checkpoints
+                WHERE run_id = ? AND error IS NOT 'missing_from_response'
+            """, (run_id,))
+            unfinished, total = cursor.fetchone()
+        return mode, unfinished, total
+    
+    def finish_run(self, run_id: int, status: str):
+        """Close an update run in the ledger with counts taken from its checkpoints"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                self._mark_run(cursor, run_id, status)
+                conn.commit()
+                logger.info(f"Update run {run_id} marked as {status}")
+        except Exception as e:
+            logger.error(f"Error finishing update run {run_id}: {e}")
+    
+    def _mark_run(self, cursor: sqlite3.Cursor, run_id: int, status: str):
+        """Set a run's status and derive its counts from the checkpoints"""
+        cursor.execute("""
+            UPDATE update_runs
+            SET status = ?,
+                successful_updates = (
+                    SELECT COUNT(*) FROM update_checkpoints
+                    WHERE run_id = update_runs.id AND status = 'done'
+                ),
+                failed_updates = (
+                    SELECT COUNT(*) FROM update_checkpoints
+                    WHERE run_id = update_runs.id AND status != 'done'
+                ),
+                finished_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (status, run_id))
+    
     def clear_snapshot_data(self):
         """Clear all existing data from player_stats_snapshot table"""
         try:
@@ -156,202 +598,336 @@ class PlayerStatsUpdater:
             logger.error(f"Error clearing snapshot data: {e}")
             raise
     
+    @property
+    def client(self) -> TgrcodeClient:
+        """HTTP client shared by every worker (keep-alive pool, rate limit, retries)"""
+        with self._client_lock:
+            if self._client is None:
+                self._client = TgrcodeClient(
+                    rate_limit=self.rate_limit,
+                    pool_size=max(self.max_workers, self.max_concurrency)
+                )
+            return self._client
+    
     def call_api_batch(self, pids: List[str]) -> Optional[Dict]:
         """Call API with batch of PIDs"""
-        try:
-            # Join PIDs with comma and put them in the URL path
-            pid_string = ",".join(pids)
-            api_url = f"{self.api_base_url}{pid_string}"
-            
-            # Make API request with timeout
-            response = requests.get(api_url, timeout=30)
-            
-            thread_id = threading.get_ident()
-            logger.info(f"[Thread-{thread_id}] API call for {len(pids)} PIDs - Status: {response.status_code}")
-            
-            if response.status_code == 200:
-                try:
-                    data = response.json()
-                    return data
-                except json.JSONDecodeError as e:
-                    logger.error(f"[Thread-{thread_id}] Failed to parse JSON response: {e}")
-                    logger.error(f"[Thread-{thread_id}] Response text: {response.text[:500]}...")
-                    return None
-            else:
-                logger.error(f"[Thread-{thread_id}] API request failed with status {response.status_code}")
-                logger.error(f"[Thread-{thread_id}] Response: {response.text[:500]}...")
-                return None
-                
-        except Exception as e:
-            thread_id = threading.get_ident()
-            logger.error(f"[Thread-{thread_id}] Exception during API call: {e}")
-            return None
+        # Join PIDs with comma and put them in the URL path
+        pid_string = ",".join(pids)
+        api_url = f"{self.api_base_url}{pid_string}"
+        
+        data = self.client.get_json(api_url)
+        
+        logger.debug("API call for %d PIDs - %s", len(pids), 'OK' if data is not None else 'failed')
+        return data
     
-    def process_api_response(self, api_data: Dict, requested_pids: List[str]) -> List[Dict]:
-        """Process API response and extract player data"""
-        processed_players = []
+    def process_api_response(self, api_data: Dict, requested_pids: List[str]) -> tuple:
+        """Process API response into rows ready for executemany
+        
+        Returns (snapshot_rows, profile_rows) in the column order of
+        SNAPSHOT_INSERT_SQL and apply_profile_changes. Every row of one response
+        shares a single timestamp.
+        """
+        snapshot_rows = []
+        profile_rows = []
         
         try:
-            if 'users' in api_data:
-                users_data = api_data['users']
+            users_data = api_data.get('users')
+            if users_data:
+                requested = set(requested_pids)
+                created_at = datetime.now().isoformat()
                 
                 for user_data in users_data:
-                    if isinstance(user_data, dict):
-                        # Extract player information - convert PID to string for consistency
-                        raw_pid = user_data.get('pid', '')
-                        pid_str = str(raw_pid) if raw_pid else ''
-                        
-                        player_info = {
-                            'pid': pid_str,
-                            'name': user_data.get('name', ''),
-                            'code': user_data.get('code', ''),
-                            'country': user_data.get('country', ''),
-                            'versus_rating': user_data.get('versus_rating', 0),
-                            'versus_won': user_data.get('versus_won', 0),
-                            'versus_plays': user_data.get('versus_plays', 0),
-                            'created_at': datetime.now().isoformat()  # Use current timestamp
-                        }
-                        
-                        # Validate required fields - now comparing string PIDs
-                        if player_info['pid'] and player_info['pid'] in requested_pids:
-                            processed_players.append(player_info)
-                
-                thread_id = threading.get_ident()
-                logger.info(f"[Thread-{thread_id}] Processed {len(processed_players)} players from API response")
-                
-            return processed_players
+                    if not isinstance(user_data, dict):
+                        continue
+                    # Convert PID to string for consistency with the player table
+                    raw_pid = user_data.get('pid')
+                    if not raw_pid:
+                        continue
+                    pid = str(raw_pid)
+                    if pid not in requested:
+                        continue
+                    
+                    snapshot_rows.append((
+                        pid,
+                        user_data.get('versus_rating', 0),
+                        user_data.get('versus_won', 0),
+                        user_data.get('versus_plays', 0),
+                        created_at,
+                        created_at
+                    ))
+                    
+                    code = user_data.get('code') or None
+                    country = user_data.get('country') or None
+                    name = user_data.get('name') or None
+                    if code or country or name:
+                        profile_rows.append((code, country, name, pid))
+                
+                logger.debug("Processed %d players from API response", len(snapshot_rows))
+                
+            return snapshot_rows, profile_rows
             
         except Exception as e:
-            thread_id = threading.get_ident()
-            logger.error(f"[Thread-{thread_id}] Error processing API response: {e}")
-            return []
+            logger.error(f"Error processing API response: {e}")
+            return [], []
     
-    def insert_snapshot_data(self, players_data: List[Dict]):
+    def insert_snapshot_data(self, snapshot_rows: List[tuple], profile_rows: List[tuple]):
         """Insert new snapshot data into database with thread safety"""
-        if not players_data:
+        if not snapshot_rows:
             logger.warning("No player data to insert")
             return
         
-        thread_id = threading.get_ident()
-        
         try:
             with self.db_lock:
                 with sqlite3.connect(self.db_path) as conn:
                     cursor = conn.cursor()
-                    
-                    for player in players_data:
-                        # Update player table with code and country if available
-                        if player.get('code') or player.get('country') or player.get('name'):
-                            cursor.execute("""
-                                UPDATE player 
-                                SET code = COALESCE(?, code), 
-                                    country = COALESCE(?, country),
-                                    name = COALESCE(?, name)
-                                WHERE pid = ?
-                            """, (
-                                player.get('code') or None,
-                                player.get('country') or None, 
-                                player.get('name') or None,
-                                player['pid']
-                            ))
-                        
-                        # Insert stats data with new schema
-                        cursor.execute("""
-                            INSERT OR REPLACE INTO player_stats_snapshot 
-                            (pid, versus_rating, versus_won, versus_plays, created_at)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (
-                            player['pid'],
-                            player['versus_rating'],
-                            player['versus_won'],
-                            player['versus_plays'],
-                            player['created_at']
-                        ))
-                    
+                    # Update player table with code, country and name where they changed
+                    profiles_changed = apply_profile_changes(cursor, profile_rows)
+                    cursor.executemany(SNAPSHOT_INSERT_SQL.format(table=SNAPSHOT_TABLE), snapshot_rows)
                     conn.commit()
-                    logger.info(f"[Thread-{thread_id}] Successfully inserted {len(players_data)} player stats into database")
+                    logger.debug("Inserted %d player stats into database (%d profiles changed)",
+                                 len(snapshot_rows), profiles_changed)
                     
         except Exception as e:
-            logger.error(f"[Thread-{thread_id}] Error inserting snapshot data: {e}")
+            logger.error(f"Error inserting snapshot data: {e}")
             raise
     
-    def process_batch(self, batch_pids: List[str], batch_num: int, total_batches: int) -> tuple:
-        """Process a single batch of PIDs"""
-        thread_id = threading.get_ident()
-        logger.info(f"[Thread-{thread_id}] Processing batch {batch_num}/{total_batches} ({len(batch_pids)} PIDs)")
+    def process_batch(self, batch: PidBatch, planner: Optional[BatchPlanner] = None) -> tuple:
+        """Fetch and store a single batch of PIDs, returning (success_count, fail_count)
+        
+        When a planner is given and it splits the failed batch for a retry,
+        nothing is recorded and (0, 0) is returned.
+        """
+        logger.debug("Processing batch %d (%d PIDs)", batch.num, len(batch.pids))
         
         # Call API for this batch
-        api_data = self.call_api_batch(batch_pids)
+        api_url = f"{self.api_base_url}{','.join(batch.pids)}"
+        api_data, latency, payload_bytes = self.client.fetch_json(api_url)
         
-        if api_data:
+        if planner is not None and planner.record_result(batch, latency, payload_bytes, api_data is not None):
+            return 0, 0
+        return self.handle_batch_result(batch.pids, batch.num, api_data)
+    
+    def handle_batch_result(self, batch_pids: List[str], batch_num: int, api_data: Optional[Dict]) -> tuple:
+        """Parse and store the API response for one batch, returning (success_count, fail_count)"""
+        if api_data is not None and not isinstance(api_data, dict):
+            # Valid JSON that is not an object (a list, a string, ...) cannot hold player data
+            logger.warning(f"Batch {batch_num}: response body is not a JSON object")
+            reason = 'invalid_response'
+        elif api_data:
             # Process the response
-            processed_players = self.process_api_response(api_data, batch_pids)
+            snapshot_rows, profile_rows = self.process_api_response(api_data, batch_pids)
             
-            if processed_players:
-                # Insert into database
-                self.insert_snapshot_data(processed_players)
-                success_count = len(processed_players)
-                logger.info(f"[Thread-{thread_id}] Batch {batch_num} completed successfully: {success_count} players updated")
-                return success_count, 0
+            if snapshot_rows:
+                # Hand off to the single writer when a run is active, otherwise write directly
+                if self._writer:
+                    self._writer.submit(snapshot_rows, profile_rows)
+                else:
+                    self.insert_snapshot_data(snapshot_rows, profile_rows)
+                returned_pids = {row[0] for row in snapshot_rows}
+                missing_pids = [pid for pid in batch_pids if pid not in returned_pids]
+                self._record_failures(missing_pids, 'missing_from_response')
+                success_count = len(snapshot_rows)
+                logger.debug("Batch %d completed successfully: %d players updated", batch_num, success_count)
+                return success_count, len(missing_pids)
             else:
-                logger.warning(f"[Thread-{thread_id}] Batch {batch_num}: No valid player data processed")
-                return 0, len(batch_pids)
+                # A well-formed response without the requested users means the API does not know them
+                if isinstance(api_data.get('users'), list):
+                    reason = 'missing_from_response'
+                    logger.debug("Batch %d: none of the requested PIDs were returned", batch_num)
+                else:
+                    reason = 'invalid_response'
+                    logger.warning(f"Batch {batch_num}: No valid player data processed")
         else:
-            logger.error(f"[Thread-{thread_id}] Batch {batch_num} failed: API call unsuccessful")
-            return 0, len(batch_pids)
+            logger.error(f"Batch {batch_num} failed: API call unsuccessful")
+            reason = 'request_failed'
+        
+        self._record_failures(batch_pids, reason)
+        return 0, len(batch_pids)
+    
+    def _record_failures(self, pids: List[str], reason: str):
+        """Checkpoint failed PIDs and remember them for the end-of-run retry pass"""
+        if not pids:
+            return
+        self._failed_pids.extend(pids)
+        if self._writer:
+            self._writer.submit_failures(pids, reason)
+    
+    def _run_engine(self, planner: BatchPlanner, phase: str = 'fetch') -> tuple:
+        if self.engine == 'asyncio':
+            return self._run_async_engine(planner, phase)
+        return self._run_thread_engine(planner, phase)
+    
+    def _retry_failed(self) -> tuple:
+        """Refetch this run's failed PIDs in small batches; returns (recovered, still_failed)"""
+        retry_pids, self._failed_pids = list(dict.fromkeys(self._failed_pids)), []
+        if not retry_pids or self.retry_batch_size <= 0:
+            return 0, len(retry_pids)
+        
+        logger.info(f"Retry pass: refetching {len(retry_pids)} failed PIDs in batches of {self.retry_batch_size}")
+        sizer = AdaptiveBatchSizer(initial_size=self.retry_batch_size, min_size=self.retry_batch_size,
+                                   max_size=self.retry_batch_size)
+        recovered, still_failed = self._run_engine(BatchPlanner(retry_pids, sizer, self.max_split_depth), 'retry')
+        logger.info(f"Retry pass recovered {recovered} of {len(retry_pids)} PIDs")
+        return recovered, still_failed
+    
+    def _make_planner(self, pids: List[str]) -> BatchPlanner:
+        sizer = AdaptiveBatchSizer(initial_size=self.batch_size, min_size=self.min_batch_size,
+                                   max_size=self.max_batch_size)
+        return BatchPlanner(pids, sizer, max_split_depth=self.max_split_depth)
     
-    def update_all_players(self):
-        """Main method to update all player stats using multi-threading"""
-        logger.info("Starting player stats update process with multi-threading")
+    def _run_thread_engine(self, planner: BatchPlanner, phase: str = 'fetch') -> tuple:
+        """Fetch all batches with a fixed-size thread pool"""
+        successful_updates = 0
+        failed_updates = 0
+        
+        logger.info(f"Processing batches using {self.max_workers} threads")
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            future_to_batch = {}
+            if self._progress:
+                self._progress.begin_phase(phase, planner.pending_pids, planner,
+                                           lambda: len(future_to_batch), self._writer)
+            while planner.has_pending() or future_to_batch:
+                # Cut batches lazily so each one uses the current adaptive size
+                while len(future_to_batch) < self.max_workers:
+                    batch = planner.next_batch()
+                    if batch is None:
+                        break
+                    future_to_batch[executor.submit(self.process_batch, batch, planner)] = batch
+                
+                done, _ = concurrent.futures.wait(future_to_batch, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    batch = future_to_batch.pop(future)
+                    try:
+                        success_count, fail_count = future.result()
+                    except Exception as exc:
+                        logger.error(f'Batch {batch.num} generated an exception: {exc}')
+                        success_count, fail_count = 0, len(batch.pids)
+                        self._failed_pids.extend(batch.pids)
+                    successful_updates += success_count
+                    failed_updates += fail_count
+                    if self._progress:
+                        self._progress.record_batch(success_count, fail_count)
+        
+        return successful_updates, failed_updates
+    
+    def _run_async_engine(self, planner: BatchPlanner, phase: str = 'fetch') -> tuple:
+        """Fetch all batches on an event loop with AIMD-tuned concurrency"""
+        from async_fetcher import AIMDController, AsyncBatchFetcher
+        
+        controller = AIMDController(initial_limit=self.max_workers, max_limit=self.max_concurrency)
+        fetcher = AsyncBatchFetcher(self.api_base_url, controller, self.client)
+        totals = {'success': 0, 'failed': 0}
+        if self._progress:
+            self._progress.begin_phase(phase, planner.pending_pids, planner,
+                                       lambda: len(fetcher.in_flight), self._writer)
+        
+        logger.info(f"Processing batches with asyncio engine "
+                    f"(initial concurrency {controller.limit}, max {controller.max_limit})")
+        
+        async def on_result(batch, api_data):
+            # SQLite writes block, so keep them off the event loop
+            loop = asyncio.get_running_loop()
+            try:
+                success_count, fail_count = await loop.run_in_executor(
+                    None, self.handle_batch_result, batch.pids, batch.num, api_data)
+            except Exception as exc:
+                logger.error(f'Batch {batch.num} generated an exception: {exc}')
+                success_count, fail_count = 0, len(batch.pids)
+                self._failed_pids.extend(batch.pids)
+            totals['success'] += success_count
+            totals['failed'] += fail_count
+            if self._progress:
+                self._progress.record_batch(success_count, fail_count)
+        
+        asyncio.run(fetcher.run(planner, on_result))
+        logger.info(f"asyncio engine finished with concurrency limit {controller.limit}")
+        return totals['success'], totals['failed']
+    
+    def update_all_players(self, resume: bool = False, tiered: bool = False):
+        """Main method to update all player stats using the configured fetch engine
+        
+        The new snapshot is written to a staging table and only replaces the live
+        one (after the live rows are backed up to history) once the run succeeds.
+        With resume=True the latest unfinished run is continued: only PIDs whose
+        checkpoint is not done are fetched into the existing staging table.
+        With tiered=True only PIDs due under the refresh schedule are fetched and
+        everyone else is carried over from the live snapshot, unless a full sweep
+        is due.
+        """
+        logger.info(f"Starting player stats update process with the {self.engine} engine")
+        run_id = None
         
         try:
-            # Get all PIDs
-            all_pids = self.get_all_pids()
-            if not all_pids:
-                logger.error("No PIDs found in database")
-                return False
+            resumable = self.find_resumable_run() if resume else None
+            if resumable and not self.staging_table_exists():
+                logger.warning(f"Staging table for run {resumable[0]} is missing, starting a fresh run")
+                resumable = None
             
-            # Backup current snapshot data to history before clearing
-            self.backup_current_snapshot_to_history()
-            
-            # Clear existing snapshot data
-            self.clear_snapshot_data()
-            
-            # Create batches
-            batches = []
-            for i in range(0, len(all_pids), self.batch_size):
-                batch_pids = all_pids[i:i + self.batch_size]
-                batch_num = (i // self.batch_size) + 1
-                batches.append((batch_pids, batch_num))
+            if resumable:
+                run_id, all_pids = resumable
+            else:
+                if resume:
+                    logger.info("No unfinished update run found, starting a fresh run")
+                
+                mode = 'tiered' if tiered and not self.scheduler.is_full_sweep_due() else 'full'
+                
+                # Get all PIDs
+                all_pids = self.scheduler.select_due_pids() if mode == 'tiered' else self.get_all_pids()
+                if not all_pids and mode == 'full':
+                    logger.error("No PIDs found in database")
+                    return False
+                
+                # The live snapshot keeps serving readers while the new one is built
+                self.prepare_staging_table()
+                
+                run_id = self.start_run(all_pids, mode)
             
-            total_batches = len(batches)
-            successful_updates = 0
-            failed_updates = 0
+            # Batches are cut on demand so their size can follow measured latency and failures
+            planner = self._make_planner(all_pids)
+            logger.info(f"Processing {len(all_pids)} PIDs in batches of {planner.sizer.min_size}-"
+                        f"{planner.sizer.max_size} (starting at {planner.sizer.size}, {self.engine} engine)")
             
-            logger.info(f"Processing {len(all_pids)} PIDs in {total_batches} batches using {self.max_workers} threads")
+            fetch_start = time.monotonic()
+            self._failed_pids = []
+            # One aggregated progress line per interval instead of per-batch logging
+            progress = ProgressReporter(self.progress_interval, self.progress_jsonl)
+            progress.run_id = run_id
+            if self.progress_interval > 0:
+                progress.start()
+            self._progress = progress
+            # Fetching and SQLite writes overlap: one writer thread drains parsed players
+            self._writer = SnapshotWriter(self.db_path, commit_size=self.commit_size,
+                                          queue_size=self.writer_queue_size, run_id=run_id,
+                                          snapshot_table=STAGING_TABLE, stage_profiles=True)
+            self._writer.start()
+            try:
+                successful_updates, failed_updates = self._run_engine(planner)
+                if failed_updates:
+                    recovered, still_failed = self._retry_failed()
+                    successful_updates += recovered
+                    failed_updates = still_failed
+            finally:
+                writer, self._writer = self._writer, None
+                writer.close()
+                self._progress = None
+                progress.close()
             
-            # Process batches using thread pool
-            with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                # Submit all batch jobs
-                future_to_batch = {
-                    executor.submit(self.process_batch, batch_pids, batch_num, total_batches): batch_num
-                    for batch_pids, batch_num in batches
-                }
-                
-                # Process completed batches
-                for future in concurrent.futures.as_completed(future_to_batch):
-                    batch_num = future_to_batch[future]
-                    try:
-                        success_count, fail_count = future.result()
-                        successful_updates += success_count
-                        failed_updates += fail_count
-                        
-                        # Add delay between batches to be respectful to the API
-                        time.sleep(self.request_delay)
-                        
-                    except Exception as exc:
-                        logger.error(f'Batch {batch_num} generated an exception: {exc}')
-                        failed_updates += len(batches[batch_num-1][0])
+            self.last_run_stats = {
+                'run_id': run_id,
+                'pids': len(all_pids),
+                'successful': successful_updates,
+                'failed': failed_updates,
+                'fetch_seconds': time.monotonic() - fetch_start,
+                'batch_latencies': list(planner.latencies),
+                'final_batch_size': planner.sizer.size,
+                'splits': planner.splits,
+                'rows_written': writer.rows_written,
+                'profiles_changed': writer.profiles_changed,
+                'commits': writer.commits,
+                'write_seconds': writer.write_seconds,
+                'publish_seconds': 0.0,
+            }
             
             # Log summary
             logger.info("=" * 60)
@@ -360,21 +936,144 @@ class PlayerStatsUpdater:
             logger.info(f"Total PIDs processed: {len(all_pids)}")
             logger.info(f"Successful updates: {successful_updates}")
             logger.info(f"Failed updates: {failed_updates}")
-            logger.info(f"Success rate: {(successful_updates/(successful_updates+failed_updates)*100):.1f}%")
+            logger.info(f"Player profile changes staged: {writer.profiles_changed}")
+            logger.info(f"Final batch size: {planner.sizer.size} ({planner.splits} failed batches split and retried)")
+            if successful_updates + failed_updates:
+                logger.info(f"Success rate: {(successful_updates/(successful_updates+failed_updates)*100):.1f}%")
             logger.info("=" * 60)
             
-            if successful_updates > 0:
+            # Full runs do not carry failed players over, so publishing would truncate the leaderboard
+            mode, unfinished, total = self._run_outcome(run_id)
+            if mode not in CARRY_OVER_MODES and total and unfinished / total > self.max_failure_ratio:
+                self.finish_run(run_id, 'failed')
+                progress.report_summary(self.last_run_stats)
+                logger.error(f"Update process failed - {unfinished} of {total} PIDs are not done "
+                             f"(more than {self.max_failure_ratio:.0%}), live snapshot left unchanged; "
+                             f"rerun with --resume to fetch the rest")
+                return False
+            
+            if successful_updates > 0 or not all_pids:
+                publish_start = time.monotonic()
+                self.publish_snapshot(run_id)
+                self.last_run_stats['publish_seconds'] = time.monotonic() - publish_start
+                progress.report_summary(self.last_run_stats)
                 logger.info("Update process completed successfully")
                 return True
             else:
-                logger.error("Update process failed - no successful updates")
+                self.finish_run(run_id, 'failed')
+                progress.report_summary(self.last_run_stats)
+                logger.error("Update process failed - no successful updates, live snapshot left unchanged")
                 return False
                 
         except Exception as e:
             logger.error(f"Critical error during update process: {e}")
             logger.error("Update process failed")
+            if run_id is not None:
+                self.finish_run(run_id, 'failed')
             return False
     
+    def merge_shards(self, shard_paths: List[str], allow_partial: bool = False) -> bool:
+        """Bulk-load finished shard files into a new snapshot and publish it
+        
+        Every shard of one INDEX/COUNT layout must have completed. With
+        allow_partial=True missing or unfinished shards are skipped and their
+        players keep their current live stats.
+        """
+        logger.info(f"Merging {len(shard_paths)} shard file(s) into {self.db_path}")
+        run_id = None
+        
+        try:
+            shards = []
+            for path in shard_paths:
+                info = read_shard_info(path)
+                if info is None:
+                    logger.error(f"{path} is not a shard file")
+                    return False
+                shards.append(info)
+            
+            shard_counts = {info['shard_count'] for info in shards}
+            if len(shard_counts) != 1:
+                logger.error(f"Shard files come from different layouts (shard counts {sorted(shard_counts)})")
+                return False
+            shard_count = shard_counts.pop()
+            
+            completed = {}
+            for info in shards:
+                if info['status'] != 'completed':
+                    logger.warning(f"Shard {info['shard_index']}/{shard_count} has not completed "
+                                   f"(latest run status: {info['status']}), skipping it")
+                    continue
+                if info['shard_index'] in completed:
+                    logger.error(f"Shard {info['shard_index']}/{shard_count} was given twice")
+                    return False
+                completed[info['shard_index']] = info
+            
+            missing = sorted(set(range(shard_count)) - set(completed))
+            if (missing and not allow_partial) or not completed:
+                logger.error(f"Completed shards missing: {missing} of {shard_count}; "
+                             f"rerun them or merge with allow_partial")
+                return False
+            
+            mode = 'partial' if missing else 'full'
+            all_pids = self.get_all_pids()
+            self.prepare_staging_table()
+            run_id = self.start_run(all_pids, mode)
+            
+            for shard_index in sorted(completed):
+                self._load_shard(completed[shard_index], run_id)
+            
+            self.publish_snapshot(run_id)
+            logger.info(f"Merged {len(completed)} of {shard_count} shards ({mode} run {run_id})")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error merging shards: {e}")
+            if run_id is not None:
+                self.finish_run(run_id, 'failed')
+            return False
+    
+    def _load_shard(self, info: Dict, run_id: int):
+        """Copy one shard's snapshot, fetched profiles and outcomes into the merge run"""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute("ATTACH DATABASE ? AS shard", (info['path'],))
+            
+            cursor.execute(f"""
+                INSERT INTO {STAGING_TABLE} (pid, versus_rating, versus_won, versus_plays, created_at, fetched_at)
+                SELECT pid, versus_rating, versus_won, versus_plays, created_at, COALESCE(fetched_at, created_at)
+                FROM shard.{SNAPSHOT_TABLE}
+                WHERE pid IN (SELECT pid FROM main.player)
+            """)
+            loaded = cursor.rowcount
+            
+            # Shard player tables start with PIDs only, so any profile value was fetched by the shard
+            cursor.execute("""
+                SELECT code, country, name, pid FROM shard.player
+                WHERE code IS NOT NULL OR country IS NOT NULL OR name IS NOT NULL
+            """)
+            profiles_changed = stage_profile_changes(cursor, cursor.fetchall())
+            
+            cursor.execute(f"""
+                UPDATE update_checkpoints
+                SET status = 'done', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE run_id = ? AND pid IN (SELECT pid FROM shard.{SNAPSHOT_TABLE})
+            """, (run_id,))
+            cursor.execute("""
+                UPDATE update_checkpoints
+                SET status = 'failed', attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP,
+                    error = COALESCE((
+                        SELECT sc.error FROM shard.update_checkpoints sc
+                        WHERE sc.run_id = ? AND sc.pid = update_checkpoints.pid
+                    ), 'shard_failed')
+                WHERE run_id = ? AND status = 'pending' AND pid IN (SELECT pid FROM shard.player)
+            """, (info['run_id'], run_id))
+            conn.commit()
+            logger.info(f"Loaded {loaded} players from shard {info['shard_index']}/{info['shard_count']} "
+                        f"({profiles_changed} player profiles staged)")
+        finally:
+            conn.close()
+    
     def search_by_code(self, code: str) -> Optional[Dict]:
         """Search for a player by their code"""
         try:
@@ -493,17 +1192,127 @@ class PlayerStatsUpdater:
             logger.error(f"Error during verification: {e}")
             return False
 
+def parse_args(argv=None):
+    """Parse command line options for the updater"""
+    parser = argparse.ArgumentParser(description='Update player_stats_snapshot from the tgrcode API')
+    parser.add_argument('--db', default='mario_filtered.db', help='Path to the SQLite database')
+    parser.add_argument('--engine', choices=PlayerStatsUpdater.ENGINES, default='threads',
+                        help='Fetch engine: fixed thread pool or asyncio with adaptive concurrency')
+    parser.add_argument('--max-concurrency', type=int, default=None,
+                        help='Upper bound on in-flight requests for the asyncio engine')
+    parser.add_argument('--api-url', default=None,
+                        help='Base URL for user_info_multiple, e.g. a local mock_tgrcode_server.py')
+    parser.add_argument('--rate-limit', type=float, default=None,
+                        help='Maximum API requests per second across all workers (0 disables the limit)')
+    parser.add_argument('--batch-size', type=int, default=None, help='Initial PIDs per API call')
+    parser.add_argument('--min-batch-size', type=int, default=None, help='Lower bound for adaptive batch size')
+    parser.add_argument('--max-batch-size', type=int, default=None, help='Upper bound for adaptive batch size')
+    parser.add_argument('--retry-batch-size', type=int, default=None,
+                        help='Batch size for the end-of-run retry of failed PIDs (0 disables the retry pass)')
+    parser.add_argument('--quarantine-after', type=int, default=None,
+                        help='Consecutive failed runs before a PID is quarantined')
+    parser.add_argument('--quarantine-days', type=int, default=None,
+                        help='Days a quarantined PID is left out of update runs')
+    parser.add_argument('--commit-size', type=int, default=None,
+                        help='Players written per SQLite transaction by the writer thread')
+    parser.add_argument('--max-failure-ratio', type=float, default=None,
+                        help='Share of failed PIDs above which a full run is left unpublished for --resume')
+    parser.add_argument('--history-mode', choices=PlayerStatsUpdater.HISTORY_MODES, default='full',
+                        help="History backup: 'full' copies every player, 'changes' only players whose stats changed")
+    parser.add_argument('--progress-interval', type=float, default=None,
+                        help='Seconds between progress reports; per-batch detail is logged at DEBUG')
+    parser.add_argument('--progress-jsonl', metavar='PATH',
+                        help='Append progress and run summary records to PATH as JSON lines')
+    parser.add_argument('--history-retention', action='store_true',
+                        help='Roll up and prune old history after a successful update (see history_retention.py)')
+    parser.add_argument('--tiered', action='store_true',
+                        help='Refresh only players due under their activity tier; full sweep when one is due')
+    parser.add_argument('--full-sweep-days', type=int, default=None,
+                        help='Maximum days between full sweeps when running --tiered')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the latest unfinished run, fetching only PIDs not checkpointed as done')
+    parser.add_argument('--shard', metavar='INDEX/COUNT',
+                        help='Fetch only this hash partition of the PIDs in --db into a shard file, e.g. 0/4')
+    parser.add_argument('--shard-dir', default='shards', help='Directory for shard files')
+    parser.add_argument('--merge-shards', nargs='+', metavar='PATH',
+                        help='Load finished shard files (or directories of them) into --db and publish')
+    parser.add_argument('--allow-partial', action='store_true',
+                        help='Merge even if shards are missing; their players keep their current stats')
+    args = parser.parse_args(argv)
+    if args.shard and (args.merge_shards or args.tiered or args.history_retention):
+        parser.error('--shard cannot be combined with --merge-shards, --tiered or --history-retention')
+    if args.batch_size and ((args.min_batch_size and args.batch_size < args.min_batch_size) or
+                            (args.max_batch_size and args.batch_size > args.max_batch_size)):
+        parser.error('--batch-size must lie between --min-batch-size and --max-batch-size')
+    if args.shard:
+        try:
+            args.shard = parse_shard_spec(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    return args
+
 def main():
     """Main function to run the player stats update"""
+    args = parse_args()
     logger.info("Starting Mario player stats update with enhanced features")
     
+    db_path = args.db
+    if args.shard:
+        # A shard run works on its own file; --db only supplies the PID list
+        shard_index, shard_count = args.shard
+        db_path = shard_path(args.shard_dir, shard_index, shard_count)
+        if not (args.resume and os.path.exists(db_path)):
+            create_shard_database(args.db, db_path, shard_index, shard_count, SNAPSHOT_TABLE_SQL)
+    
     # Initialize updater
-    updater = PlayerStatsUpdater()
+    updater = PlayerStatsUpdater(db_path, engine=args.engine)
+    if args.api_url:
+        updater.api_base_url = args.api_url
+    if args.max_concurrency:
+        updater.max_concurrency = args.max_concurrency
+    if args.rate_limit is not None:
+        updater.rate_limit = args.rate_limit
+    if args.batch_size:
+        updater.batch_size = args.batch_size
+        # The default adaptive range widens to an explicit starting size instead of clamping it
+        updater.min_batch_size = min(updater.min_batch_size, args.batch_size)
+        updater.max_batch_size = max(updater.max_batch_size, args.batch_size)
+    if args.min_batch_size:
+        updater.min_batch_size = args.min_batch_size
+    if args.max_batch_size:
+        updater.max_batch_size = args.max_batch_size
+    if args.retry_batch_size is not None:
+        updater.retry_batch_size = args.retry_batch_size
+    if args.quarantine_after:
+        updater.quarantine_after_runs = args.quarantine_after
+    if args.quarantine_days:
+        updater.quarantine_days = args.quarantine_days
+    if args.commit_size:
+        updater.commit_size = args.commit_size
+    updater.history_mode = args.history_mode
+    if args.max_failure_ratio is not None:
+        updater.max_failure_ratio = args.max_failure_ratio
+    if args.progress_interval is not None:
+        updater.progress_interval = args.progress_interval
+    if args.progress_jsonl:
+        updater.progress_jsonl = args.progress_jsonl
+    if args.full_sweep_days:
+        updater.scheduler.full_sweep_days = args.full_sweep_days
     
-    # Run the update
-    success = updater.update_all_players()
+    if args.merge_shards:
+        shard_paths = []
+        for path in args.merge_shards:
+            shard_paths.extend(find_shard_files(path) if os.path.isdir(path) else [path])
+        success = updater.merge_shards(shard_paths, allow_partial=args.allow_partial)
+    else:
+        # Run the update
+        success = updater.update_all_players(resume=args.resume, tiered=args.tiered)
     
     if success:
+        if args.history_retention:
+            # Incremental: only periods that aged past a tier since the last pass are touched
+            HistoryRetention(db_path).run()
+        
         # Verify the update
         if updater.verify_update():
             logger.info("Update and verification completed successfully!")